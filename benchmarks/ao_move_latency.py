@@ -0,0 +1,50 @@
+"""Latency of the set up of a clocked move of AO_with_clock_DAQmx, with the tasks kept committed from one move to
+the next or released (recreated) before each move.
+
+To be run on a simulated device, for instance a PCIe-6363 named Dev1 created in NI MAX:
+
+    python benchmarks/ao_move_latency.py
+"""
+import time
+
+import numpy as np
+
+import pymodaq_plugins_daqmx.hardware.national_instruments.daqmx as dq
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_objects import AO_with_clock_DAQmx
+
+
+def measure(controller, persistent, Nmoves=50):
+    """Set up and output Nmoves back and forth moves of both axes, returning the set up time of each (s)"""
+    latencies = np.zeros((Nmoves,))
+    for ind in range(Nmoves):
+        target = 1. if ind % 2 == 0 else 0.
+        voltage_array = controller.merged_voltages([1. - target, 1. - target], [target, target], [0.1, 0.05])
+        if not persistent:
+            controller.release_tasks()
+        start = time.perf_counter()
+        controller.output_trajectory(voltage_array)
+        latencies[ind] = time.perf_counter() - start
+        controller.analog.waitTaskDone()
+    return latencies
+
+
+def main(device='Dev1'):
+    controller = AO_with_clock_DAQmx()
+    controller.clock_channel_name = f'{device}/ctr0'
+    controller.clock_frequency = 10000.
+    for axis, channel in zip(['x', 'y'], [f'{device}/ao0', f'{device}/ao1']):
+        controller.update_ao_channels(dq.AOChannel(name=channel, source='Analog_Output', value_min=-10.,
+                                                   value_max=10.), axis, dq.ClockSettings(Nsamples=1))
+    try:
+        for persistent in [False, True]:
+            latencies = measure(controller, persistent)
+            print(f'{"Persistent" if persistent else "Recreated"} tasks: {np.mean(latencies) * 1e3:.2f} ms per move '
+                  f'(min {np.min(latencies) * 1e3:.2f} ms, max {np.max(latencies) * 1e3:.2f} ms)')
+    finally:
+        controller.stop()
+        controller.clock.close()
+        controller.analog.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -7,15 +7,17 @@ from pymodaq.utils.parameter import Parameter
 from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_objects import AO_with_clock_DAQmx
 
 from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx import DAQmx, AOChannel, \
-    ClockSettings, DAQ_analog_types, Edge
+    ClockSettings, DAQ_analog_types, Edge, EncoderCounter, Encoder_decoding
 
-import PyDAQmx
 
 
 class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
     """Plugin to control a piezo scanners with a NI card. This modules requires a clock channel to handle the
     timing of the movement and display the position, and this clock channel is shared between the master and
     the slave daq_move created with this module, to allow smooth movements.
+    The movements requested at the same time on several axes (for instance by a scan) are merged by the controller
+    into a single trajectory, so that a diagonal move takes the time of the longest axis move only.
+    With hardware timed scans enabled, a scan using the "DAQmx hardware timed" scanners is output at once on the clock.
 
     This object inherits all functionality to communicate with PyMoDAQ Module through inheritance via DAQ_Move_base
     It then implements the particular communication with the instrument.
@@ -38,47 +40,52 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
                 'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')},
                {"title": "Step size (nm)", "name": "step_size", "type": "float", "value": 100.0},
                {"title": "Step time (ms)", "name": "step_time", "type": "float", "value": 10.0},
-               {"title": "Conversion factor (nm/V)", "name": "conv_factor", "type": "float", "value": 7500.0}
+               {"title": "Conversion factor (nm/V)", "name": "conv_factor", "type": "float", "value": 7500.0},
+               {"title": "Encoder readback:", "name": "encoder", "type": "group", "children": [
+                   {"title": "Enable?:", "name": "enable", "type": "bool", "value": False},
+                   {"title": "Encoder channel:", "name": "encoder_channel", "type": "list",
+                    "limits": DAQmx.get_NIDAQ_channels(source_type="Counter")},
+                   {"title": "Decoding:", "name": "decoding", "type": "list", "limits": Encoder_decoding.names(),
+                    "value": "X4"},
+                   {"title": "Distance per pulse (nm):", "name": "dist_per_pulse", "type": "float", "value": 10.0},
+               ]},
+               {"title": "Streaming:", "name": "streaming", "type": "group", "children": [
+                   {"title": "Enable?:", "name": "enable", "type": "bool", "value": False},
+                   {"title": "Velocity (nm/s):", "name": "velocity", "type": "float", "value": 10000.0, "min": 0.},
+                   {"title": "Acceleration (nm/s2):", "name": "acceleration", "type": "float", "value": 100000.0,
+                    "min": 0.},
+                   {"title": "Write ahead (ms):", "name": "write_ahead", "type": "float", "value": 200.0,
+                    "min": 1.},
+               ]},
+               {"title": "Hardware timed scans?:", "name": "hardware_scan", "type": "bool", "value": False},
                 ] + comon_parameters_fun(is_multiaxes, axes_names)
 
     def ini_attributes(self):
         self.controller = None
         self.step_size = 100.0  # in nm! be careful with the scaling param
-        self.number_steps = 1
         self.conv_factor = 7500.0
         self.scanner_channel = None
-        self.voltage_list = np.array([0.0])
-        self.init_step_index = 0
-        self.waiting_to_move = [False, "abs"]
+        self.encoder = None
 
     def get_actuator_value(self):
         """Get the current value from the hardware with scaling conversion.
         Reading the actual state is tricky with the NI card because the list of voltages
         is sent in the buffer immediately, so reading the last written voltage always 
         yield the target value, independently of the clock timing. 
-        To bypass this issue, instead of reading the written voltage, we read the current 
-        clock index and use it to retrieve the corresponding voltage from our list.
-        Beware that the index given by GetCOCount start at a value 2*nb_voltages + 1
-        and decreases. Therefore, we store the first value returned in self.init_step_index
-        and use this as a starting point.
+        To bypass this issue, the controller follows the progress of the output from the
+        events sent by the driver every few samples and at the end of the movement, and
+        gives the voltage currently generated without any call to the driver.
 
         Returns
         -------
         float: The position obtained after scaling conversion.
         """
-        if len(self.voltage_list) > 1:
-            try:
-                current_step_index = PyDAQmx.c_ulong()
-                self.controller.clock.task.GetCOCount(self.controller.clock_channel_name,
-                                                      PyDAQmx.byref(current_step_index))
-                index = self.init_step_index - current_step_index.value
-                voltage = self.voltage_list[min(int(index/2), len(self.voltage_list)-1)]
-            except:  # when the task did not start
-                voltage = self.voltage_list[0]
-        
-        # if we do only one step, we do not care, there is no timing anyway.
-        else:
-            voltage = self.controller.applied_voltages[self.settings.child('multiaxes', 'axis').value()]
+        if self.settings["encoder", "enable"]:
+            # actual position measured by the encoder, in nm, relative to the position when it was enabled
+            pos = self.encoder.readCounterScalar(timeout=1.) * 1e9
+            return self.get_position_with_scaling(pos)
+
+        voltage = self.controller.current_voltage(self.settings.child('multiaxes', 'axis').value())
         # convert voltage to position
         pos = voltage * self.conv_factor
         pos = self.get_position_with_scaling(pos)
@@ -87,8 +94,11 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
     def close(self):
         """ Terminate the communication protocol"""
         # This might be brutal if we are controlling another axis at the same time
+        self.controller.stop_streaming()
         self.controller.clock.close()
         self.controller.analog.close()
+        if self.encoder is not None:
+            self.encoder.close()
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings
@@ -109,6 +119,16 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
             self.controller.clock_frequency = 1e3 / self.settings.child("step_time").value()  # time give in ms
         elif param.name() == "conv_factor":
             self.conv_factor = param.value()
+            self.controller.conv_factors[self.settings.child('multiaxes', 'axis').value()] = self.conv_factor
+        elif param.name() == "hardware_scan":
+            self.controller.use_scan_plan = param.value()
+        elif param.parent().name() == "encoder":
+            self.update_encoder()
+        elif param.name() in ["enable", "write_ahead"] and param.parent().name() == "streaming":
+            if self.settings["streaming", "enable"]:
+                self.controller.set_up_streaming(self.settings["streaming", "write_ahead"] * 1e-3)
+            else:
+                self.controller.stop_streaming()
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -139,15 +159,18 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
         if self.settings.child("multiaxes", "multi_status").value() == "Master":
             self.controller.clock_frequency = 1e3 / self.settings.child("step_time").value()  # time give in ms
             self.controller.clock_channel_name = self.settings.child("clock_channel").value()
+            self.controller.use_scan_plan = self.settings["hardware_scan"]
         else:
             self.settings.child("step_time").hide()
             self.settings.child("clock_channel").hide()
+            self.settings.child("hardware_scan").hide()
 
-        self.move_done_signal.connect(self.controller.received_move_done)
-        self.controller.ni_card_ready_for_moving.connect(self.finish_waiting)
+        self.controller.merged_move_done.connect(self.merged_move_done)
         
+        self.encoder = DAQmx()
         try:
             self.update_task()
+            self.update_encoder()
             initialized = True
             info = "NI card based piezo scanner control."
             self.move_abs(0.0, init=True)  # to avoid bad initial positioning because
@@ -177,11 +200,8 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
             self.emit_status(ThreadCommand('Update_Status', ['Already there.']))
             return
         else:
-            if not self.controller.locked or init:
-                self.move_scanner(init=init)
-                self.emit_status(ThreadCommand('Update_Status', ['Absolute movement.']))
-            else:
-                self.waiting_to_move = [True, "abs"]
+            self.move_scanner(init=init)
+            self.emit_status(ThreadCommand('Update_Status', ['Absolute movement.']))
 
     def move_rel(self, value):
         """ Move the actuator to the relative target actuator value defined by value
@@ -200,11 +220,8 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
             if self.target_value == 0.0:
                 self.target_value = 1.0
             self.set_position_relative_with_scaling(value)
-            if not self.controller.locked:
-                self.move_scanner()
-                self.emit_status(ThreadCommand('Update_Status', ['Relative movement.']))
-            else:
-                self.waiting_to_move = [True, "rel"]
+            self.move_scanner()
+            self.emit_status(ThreadCommand('Update_Status', ['Relative movement.']))
 
     def move_home(self):
         """Do nothing"""
@@ -212,13 +229,11 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
 
     def stop_motion(self):
         """Stop the actuator and emits move_done signal"""
-        self.controller.locked = False
-        self.waiting_to_move[0] = False
         self.controller.stop()
         self.emit_status(ThreadCommand('Update_Status', ['Motion stopped.']))
 
     def update_task(self):
-        """ Set up the analog output task in the NI card, and the clock if necessary."""
+        """ Set up the analog output task in the NI card, the clock is set up by the controller when moving."""
         min_voltage = self.settings.child("bounds", "min_bound").value()/self.conv_factor
         max_voltage = self.settings.child("bounds", "max_bound").value()/self.conv_factor
         self.scanner_channel = AOChannel(name=self.settings.child("analog_channel").value(),
@@ -226,72 +241,58 @@ class DAQ_Move_DAQmx_MultipleScannerControl(DAQ_Move_base):
                                          analog_type=DAQ_analog_types.names()[0],
                                          value_min=min_voltage,
                                          value_max=max_voltage)
+        self.controller.conv_factors[self.settings.child('multiaxes', 'axis').value()] = self.conv_factor
 
-        # If we do more than one step, we need the clock for the time sampling
-        # because we want a smooth and slow movement.
-        if len(self.voltage_list) > 1:
-            clock_settings_ao = self.controller.set_up_clock(self.number_steps)
-        else:
-            # empty clock settings if we do only one step
-            clock_settings_ao = ClockSettings(source=None,
-                                              frequency=1/self.controller.clock_frequency,
-                                              Nsamples=1,
-                                              edge=Edge.names()[0],
-                                              repetition=False)
+        # empty clock settings, a single value is written
+        clock_settings_ao = ClockSettings(source=None,
+                                          frequency=self.controller.clock_frequency,
+                                          Nsamples=1,
+                                          edge=Edge.names()[0],
+                                          repetition=False)
 
         self.controller.update_ao_channels(self.scanner_channel,
                                            self.settings.child('multiaxes', 'axis').value(),
                                            clock_settings_ao)
 
-    def prepare_voltage_list(self):
-        """Generates the list of voltages to move smoothly the scanner."""
-        # if the desired step size is larger than the movement to realize, only one value
-        if np.abs(self.target_value - self.current_value) <= self.step_size:
-            self.voltage_list = np.array([self.target_value])/self.conv_factor
-        # otherwise we do steps
-        else:
-            pos_list = np.arange(min(self.current_value, self.target_value),
-                                 max(self.current_value, self.target_value)+self.step_size,
-                                 self.step_size)
-            # we need to start from the beginning
-            if pos_list[0] != self.current_value:
-                pos_list = pos_list[::-1]
-
-            # we ensure that the last value is the target, otherwise we might get caught in a loop
-            # if the position goes to target from more than epsilon.
-            pos_list[-1] = self.target_value
-            
-            # convert to voltage
-            self.voltage_list = pos_list/self.conv_factor
-        self.number_steps = len(self.voltage_list)
+    def update_encoder(self):
+        """Set up (or release) the encoder counter used to read back the actual position
+
+        The counter is not sample clocked, it is read on demand by get_actuator_value while it keeps counting.
+        """
+        self.encoder.close()
+        if self.settings["encoder", "enable"]:
+            encoder_channel = EncoderCounter(name=self.settings["encoder", "encoder_channel"],
+                                             source="Counter", encoder_type="Linear",
+                                             decoding=self.settings["encoder", "decoding"],
+                                             dist_per_pulse=self.settings["encoder", "dist_per_pulse"] * 1e-9)
+            self.encoder.update_task(channels=[encoder_channel], clock_settings=ClockSettings(Nsamples=1))
+            self.encoder.start()
 
     def move_scanner(self, init=False):
-        """ Actually moves the scanner. """
-        # compute the path
-        self.prepare_voltage_list()
-        if not init:
-            self.controller.locked = True
-        # fill with zeros according to the other AO channels in the controller
-        self.controller.set_up_voltage_array(self.voltage_list,
-                                             self.settings.child('multiaxes', 'axis').value())
-        # prepare the tasks
-        self.update_task()
-        if self.number_steps > 1:
-            self.controller.clock.start()
-            self.init_step_index = 2*len(self.voltage_list)+1
-            
-        # Actually tells the NI card to send the list of voltages.
-        self.controller.write_voltages()
-
-    def finish_waiting(self):
-        if self.waiting_to_move[0]:
-            self.move_scanner()
-            if self.waiting_to_move[1] == "abs":
-                self.emit_status(ThreadCommand('Update_Status', ['Absolute movement.']))
-            elif self.waiting_to_move[1] == "rel":
-                self.emit_status(ThreadCommand('Update_Status', ['Relative movement.']))
-            self.waiting_to_move[0] = False
+        """ Ask the controller to move the scanner, the movement is merged with the ones requested on the other
+        axes at the same time."""
+        if self.settings["streaming", "enable"] and not init:
+            self.stream_move()
+            return
+        self.controller.request_move(self.settings.child('multiaxes', 'axis').value(),
+                                     self.scanner_channel,
+                                     self.target_value / self.conv_factor,
+                                     self.step_size / self.conv_factor)
+
+    def merged_move_done(self, axes):
+        """Called by the controller once the merged trajectory is over"""
+        if self.settings.child('multiaxes', 'axis').value() in axes:
+            self.move_done()
+
+    def stream_move(self):
+        """Queue the move at the end of the streamed trajectory, without stopping the ongoing motion"""
+        if not self.controller.streaming:
+            self.controller.set_up_streaming(self.settings["streaming", "write_ahead"] * 1e-3)
+        self.controller.queue_move(self.settings.child('multiaxes', 'axis').value(),
+                                   self.target_value / self.conv_factor,
+                                   self.settings["streaming", "velocity"] / self.conv_factor,
+                                   self.settings["streaming", "acceleration"] / self.conv_factor)
+
 
-    
 if __name__ == '__main__':
     main(__file__)
@@ -5,12 +5,11 @@ from pymodaq.utils.daq_utils import ThreadCommand # object used to send info bac
 from pymodaq.utils.parameter import Parameter
 
 from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx import DAQmx, AOChannel, \
-    ClockSettings, DAQ_analog_types, ClockCounter, Edge
+    ClockSettings, DAQ_analog_types, ClockCounter, Edge, EncoderCounter, Encoder_decoding
 
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_objects import PositionTracker
 from PyDAQmx import DAQmx_Val_FiniteSamps
 
-import PyDAQmx
-
 
 class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
     """Plugin to control a piezo scanner with a NI card. This modules requires a clock channel to handle the
@@ -39,7 +38,15 @@ class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
                 'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')},
                {"title": "Step size (nm)", "name": "step_size", "type": "float", "value": 100.0},
                {"title": "Step time (ms)", "name": "step_time", "type": "float", "value": 10.0},
-               {"title": "Conversion factor (nm/V)", "name": "conv_factor", "type": "float", "value": 7500.0}
+               {"title": "Conversion factor (nm/V)", "name": "conv_factor", "type": "float", "value": 7500.0},
+               {"title": "Encoder readback:", "name": "encoder", "type": "group", "children": [
+                   {"title": "Enable?:", "name": "enable", "type": "bool", "value": False},
+                   {"title": "Encoder channel:", "name": "encoder_channel", "type": "list",
+                    "limits": DAQmx.get_NIDAQ_channels(source_type="Counter")},
+                   {"title": "Decoding:", "name": "decoding", "type": "list", "limits": Encoder_decoding.names(),
+                    "value": "X4"},
+                   {"title": "Distance per pulse (nm):", "name": "dist_per_pulse", "type": "float", "value": 10.0},
+               ]},
                 ] + comon_parameters_fun(is_multiaxes, axes_names)
 
     def ini_attributes(self):
@@ -52,32 +59,30 @@ class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
         self.clock_channel = None
         self.scanner_channel = None
         self.voltage_list = np.array([0.0])
-        self.init_step_index = 0
+        self.tracker = PositionTracker()
+        self.encoder = None
 
     def get_actuator_value(self):
         """Get the current value from the hardware with scaling conversion.
         Reading the actual state is tricky with the NI card because the list of voltages
         is sent in the buffer immediately, so reading the last written voltage always 
         yield the target value, independently of the clock timing. 
-        To bypass this issue, instead of reading the written voltage, we read the current 
-        clock index and use it to retrieve the corresponding voltage from our list.
-        Beware that the index given by GetCOCount start at a value 2*nb_voltages + 1
-        and decreases. Therefore, we store the first value returned in self.init_step_index
-        and use this as a starting point.
+        To bypass this issue, the progress of the output is followed from the events sent
+        by the driver every few samples and at the end of the movement, and the voltage
+        currently generated is obtained without any call to the driver.
 
         Returns
         -------
         float: The position obtained after scaling conversion.
         """
+        if self.settings["encoder", "enable"]:
+            # actual position measured by the encoder, in nm, relative to the position when it was enabled
+            pos = self.encoder.readCounterScalar(timeout=1.) * 1e9
+            return self.get_position_with_scaling(pos)
+
         if len(self.voltage_list) > 1:
-            try:
-                current_step_index = PyDAQmx.c_ulong()
-                self.clock.task.GetCOCount(self.clock_channel.name, PyDAQmx.byref(current_step_index))
-                index = self.init_step_index - current_step_index.value
-                voltage = self.voltage_list[min(int(index/2), len(self.voltage_list)-1)]
-            except:  # when the task did not start
-                voltage = self.voltage_list[0]
-        
+            voltage = self.tracker.voltages()[0]
+
         # if we do only one step, we do not care, there is no timing anyway.
         else:
             voltage = self.controller.get_last_write()
@@ -112,6 +117,8 @@ class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
             self.step_time = param.value()*1e-3
         elif param.name() == "conv_factor":
             self.conv_factor = param.value()
+        elif param.parent().name() == "encoder":
+            self.update_encoder()
 
     def ini_stage(self, controller=None):
         """Actuator communication initialization
@@ -138,9 +145,12 @@ class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
         # we need to close the clock once the move is done, to free
         # the counter resource
         self.move_done_signal.connect(self.close)
+        self.tracker.move_done.connect(self.move_done)
         
+        self.encoder = DAQmx()
         try:
             self.update_task()
+            self.update_encoder()
             initialized = True
             info = "NI card based piezo scanner control."
             self.move_abs(0.0)  # to avoid bad initial positioning because
@@ -229,6 +239,24 @@ class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
             
         self.controller.update_task(channels=[self.scanner_channel],
                                     clock_settings=clock_settings_ao)
+        if len(self.voltage_list) > 1:
+            # the progress events of the tracker follow the output, not the transfers into the FIFO
+            self.controller.set_transfer_on_empty()
+            self.tracker.register(self.controller, 1/self.step_time)
+
+    def update_encoder(self):
+        """Set up (or release) the encoder counter used to read back the actual position
+
+        The counter is not sample clocked, it is read on demand by get_actuator_value while it keeps counting.
+        """
+        self.encoder.close()
+        if self.settings["encoder", "enable"]:
+            encoder_channel = EncoderCounter(name=self.settings["encoder", "encoder_channel"],
+                                             source="Counter", encoder_type="Linear",
+                                             decoding=self.settings["encoder", "decoding"],
+                                             dist_per_pulse=self.settings["encoder", "dist_per_pulse"] * 1e-9)
+            self.encoder.update_task(channels=[encoder_channel], clock_settings=ClockSettings(Nsamples=1))
+            self.encoder.start()
 
     def prepare_voltage_list(self):
         """Generates the list of voltages to move smoothly the scanner."""
@@ -259,10 +287,10 @@ class DAQ_Move_DAQmx_ScannerControl(DAQ_Move_base):
         # prepare the tasks
         self.update_task()
         if len(self.voltage_list) > 1:
-            #self.controller.task.SetSampTimingType(DAQmx_Val_SampClk)
+            # the move done is emitted on the done event of the output task
+            self.tracker.track(self.voltage_list, 1/self.step_time)
             self.clock.start()
-            self.init_step_index = 2*len(self.voltage_list)+1
-            
+
         # Actually tells the NI card to send the list of voltages.
         self.controller.start()
         self.controller.writeAnalog(self.number_steps, 1, self.voltage_list)
@@ -0,0 +1,191 @@
+from pymodaq.control_modules.move_utility_classes import DAQ_Move_base, comon_parameters_fun, main
+from pymodaq.utils.daq_utils import ThreadCommand
+from pymodaq.utils.parameter import Parameter
+
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmxni import NIDAQmx, COPulseChannel, ClockSettings, \
+    ChannelType, UsageTypeCO, Level
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import load_pulse_table, pulse_ticks
+
+
+class DAQ_Move_NIDAQmx_PulseTrain(DAQ_Move_base):
+    """Plugin generating a pulse train with a counter output of a NI card (laser gating, triggers...), the actuator
+    value being the frequency of the pulses.
+
+    The pulses are defined by their frequency and duty cycle, or by their high and low durations in ticks of a
+    timebase. A continuous train is changed on the fly by the moves, without stopping the counter, while a finite
+    train of Npulses is generated again on each move.
+
+    In pulse table mode, a whole table of pulses (one pulse per row, frequency and duty cycle or high and low ticks)
+    loaded from a file is written at once on the counter and generated by the hardware (once or regenerated in
+    continuous mode) on each move, whatever the target.
+    """
+    _controller_units = 'Hz'
+    is_multiaxes = False
+    axes_names = []
+    _epsilon = 1e-3
+
+    params = [{'title': 'Counter output:', 'name': 'counter_channel', 'type': 'list',
+               'limits': NIDAQmx.get_NIDAQ_channels(source_type=ChannelType.COUNTER_OUTPUT)},
+              {'title': 'Pulses:', 'name': 'co_type', 'type': 'list',
+               'limits': [Uco.name for Uco in [UsageTypeCO.PULSE_FREQUENCY, UsageTypeCO.PULSE_TICKS]]},
+              {'title': 'Duty cycle:', 'name': 'duty_cycle', 'type': 'float', 'value': 0.5, 'min': 0., 'max': 1.},
+              {'title': 'Timebase:', 'name': 'timebase', 'type': 'list', 'visible': False,
+               'limits': ['100MHzTimebase', '80MHzTimebase', '20MHzTimebase']},
+              {'title': 'Idle state:', 'name': 'idle_state', 'type': 'list', 'limits': [Level.LOW.name,
+                                                                                         Level.HIGH.name]},
+              {'title': 'Generation:', 'name': 'generation', 'type': 'list', 'limits': ['Continuous', 'Finite']},
+              {'title': 'Number of pulses:', 'name': 'Npulses', 'type': 'int', 'value': 1000, 'min': 1,
+               'visible': False},
+              {'title': 'Pulse table:', 'name': 'table', 'type': 'group', 'children': [
+                  {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+                  {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True},
+              ]},
+              ] + comon_parameters_fun(is_multiaxes, axes_names)
+
+    def ini_attributes(self):
+        self.controller: NIDAQmx = None
+        self.running = False  # a continuous train is being generated, changed on the fly by the moves
+
+    def get_actuator_value(self):
+        """Get the frequency of the pulses, the last one written on the counter (it cannot be read back)
+
+        Returns
+        -------
+        float: The frequency obtained after scaling conversion.
+        """
+        return self.get_position_with_scaling(self.target_value)
+
+    def close(self):
+        """Terminate the communication protocol"""
+        self.controller.close()
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been changed by the user
+        """
+        if param.name() == 'co_type':
+            self.settings.child('timebase').show(param.value() == UsageTypeCO.PULSE_TICKS.name)
+        elif param.name() == 'generation':
+            self.settings.child('Npulses').show(param.value() == 'Finite')
+        if self.controller is not None:
+            # the task is set up again on the next move
+            self.controller.stop()
+            self.running = False
+
+    def ini_stage(self, controller=None):
+        """Actuator communication initialization
+
+        Parameters
+        ----------
+        controller: (object)
+            custom object of a PyMoDAQ plugin (Slave case).
+            None if only one actuator by controller (Master case)
+
+        Returns
+        -------
+        info: str
+        initialized: bool
+            False if initialization failed otherwise True
+        """
+        self.controller = self.ini_stage_init(old_controller=controller, new_controller=NIDAQmx())
+        self.target_value = 1000.
+        return "NI card based pulse train generation", True
+
+    def timebase_frequency(self):
+        return float(self.settings['timebase'].split('MHz')[0]) * 1e6
+
+    def pulses(self, frequency):
+        """Pulses defining a train at frequency, (frequency, duty cycle) or (high ticks, low ticks)"""
+        if self.settings['co_type'] == UsageTypeCO.PULSE_TICKS.name:
+            return pulse_ticks(frequency, self.settings['duty_cycle'], self.timebase_frequency())
+        return frequency, self.settings['duty_cycle']
+
+    def update_task(self, first, second, Nsamples):
+        """Set up the counter output task generating Nsamples pulses (repeated if continuous), the first of them
+        being defined by first and second"""
+        ticks = self.settings['co_type'] == UsageTypeCO.PULSE_TICKS.name
+        counter = self.settings['counter_channel']
+        channel = COPulseChannel(name=counter, source=ChannelType.COUNTER_OUTPUT,
+                                 counter_type=UsageTypeCO[self.settings['co_type']],
+                                 frequency=float(first[0]) if not ticks else 1000.,
+                                 duty_cycle=float(second[0]) if not ticks else 0.5,
+                                 high_ticks=int(first[0]) if ticks else 100,
+                                 low_ticks=int(second[0]) if ticks else 100,
+                                 timebase=f"/{counter.split('/')[0]}/{self.settings['timebase']}",
+                                 idle_state=Level[self.settings['idle_state']])
+        self.controller.update_task(channels=[channel],
+                                    clock_settings=ClockSettings(Nsamples=Nsamples,
+                                                                 repetition=self.settings['generation'] ==
+                                                                 'Continuous'))
+
+    def write(self, first, second, autostart=False):
+        if self.settings['co_type'] == UsageTypeCO.PULSE_TICKS.name:
+            self.controller.writeCounterTicks(first, second, autostart=autostart)
+        else:
+            self.controller.writeCounterFrequency(first, second, autostart=autostart)
+
+    def move_abs(self, value):
+        """ Move the actuator to the absolute target defined by value
+
+        Parameters
+        ----------
+        value: (float) value of the absolute target positioning
+        """
+        value = self.check_bound(value)  # if user checked bounds, the defined bounds are applied here
+        self.target_value = value
+        value = self.set_position_with_scaling(value)  # apply scaling if the user specified one
+        if self.settings['table', 'enable']:
+            self.start_table()
+        else:
+            self.generate(value)
+        self.emit_status(ThreadCommand('Update_Status', ['Absolute movement.']))
+        self.move_done()  # the pulses are written or started, the actuator has reached its target
+
+    def move_rel(self, value):
+        """ Move the actuator to the relative target actuator value defined by value
+
+        Parameters
+        ----------
+        value: (float) value of the relative target positioning
+        """
+        self.move_abs(self.current_value + value)
+
+    def generate(self, frequency):
+        """Generate the pulses at frequency: written on the fly on a running continuous train, the task being set up
+        and started otherwise"""
+        first, second = self.pulses(frequency)
+        if self.running:
+            self.write(first, second)
+            return
+        self.controller.stop()
+        Nsamples = 1000 if self.settings['generation'] == 'Continuous' else self.settings['Npulses']
+        self.update_task([first], [second], Nsamples)
+        self.controller.start()
+        self.running = self.settings['generation'] == 'Continuous'
+
+    def start_table(self):
+        """Write the whole pulse table on the counter in a single call and start its generation"""
+        first, second = load_pulse_table(self.settings['table', 'path'])
+        self.controller.stop()
+        self.running = False
+        self.update_task(first, second, first.size)
+        self.write(first, second)
+        self.controller.start()
+
+    def move_home(self):
+        """Do nothing"""
+        self.emit_status(ThreadCommand('Update_Status', ['No home position implemented.']))
+
+    def stop_motion(self):
+        """Stop the pulse train and emits move_done signal"""
+        self.controller.stop()
+        self.running = False
+        self.emit_status(ThreadCommand('Update_Status', ['Pulse train stopped.']))
+
+
+if __name__ == '__main__':
+    main(__file__)
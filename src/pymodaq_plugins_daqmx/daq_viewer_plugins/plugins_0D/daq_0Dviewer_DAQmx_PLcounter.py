@@ -1,35 +1,86 @@
+import time
 import numpy as np
 from pymodaq.utils.daq_utils import ThreadCommand
-from pymodaq.utils.data import DataWithAxes, DataToExport, DataSource
+from pymodaq.utils.data import DataWithAxes, DataToExport, DataSource, Axis
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
 from pymodaq.utils.parameter import Parameter
 
 from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx import DAQmx, \
-    Edge, ClockSettings, Counter, ClockCounter,  TriggerSettings
+    Edge, ClockSettings, Counter, ClockCounter,  TriggerSettings, TimeTagCounter
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import RollingHistory, TimeTagStream, \
+    TimeTagHistogram, CrossCorrelator
 
 from PyDAQmx import DAQmx_Val_ContSamps
 
+counter_channels = DAQmx.get_NIDAQ_channels(source_type="Counter")
+
+
 class DAQ_0DViewer_DAQmx_PLcounter(DAQ_Viewer_base):
     """
-    Plugin for a 0D PL counter, based on a NI card.
+    Plugin for a 0D PL counter, based on a NI card. Several counters (one per detector) can be
+    selected, they are all sampled by the same clock.
+
+    In Correlation mode, the events of two detectors are time tagged by the first two selected counters and their
+    cross-correlation histogram (g2 for a Hanbury Brown and Twiss setup) is accumulated live.
+
+    In Time tagging mode, the Arrival histogram (lifetime) measures each photon from the last pulse of the sync
+    source (excitation), time tagged by the second selected counter. Without sync source, the photon times are
+    taken modulo the period, which is only valid for an excitation phase locked to the timebase of the card.
     """
     params = comon_parameters+[
-        {"title": "Counting channel:", "name": "counter_channel",
-         "type": "list", "limits": DAQmx.get_NIDAQ_channels(source_type="Counter")},
+        {"title": "Counting channels:", "name": "counter_channels", "type": "itemselect",
+         "value": dict(all_items=counter_channels, selected=counter_channels[:1])},
         {"title": "Photon source:", "name": "photon_channel",
          "type": "list", "limits": DAQmx.getTriggeringSources()},
         {"title": "Clock frequency (Hz):", "name": "clock_freq",
          "type": "float", "value": 100., "default": 100., "min": 1},
         {'title': 'Clock channel:', 'name': 'clock_channel', 'type': 'list',
-         'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')}
-        ]
+         'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')},
+        {'title': 'Acquisition mode:', 'name': 'acq_mode', 'type': 'list',
+         'limits': ['Software timed', 'Buffered', 'Time tagging', 'Correlation'], 'value': 'Software timed'},
+        {'title': 'Buffered settings:', 'name': 'buffered', 'type': 'group', 'visible': False, 'children': [
+            {'title': 'Samples per block:', 'name': 'block_size', 'type': 'int', 'value': 100, 'min': 1},
+            {'title': 'Emit count trace?:', 'name': 'emit_trace', 'type': 'bool', 'value': False},
+        ]},
+        {'title': 'Time tagging settings:', 'name': 'time_tagging', 'type': 'group', 'visible': False, 'children': [
+            {'title': 'Timebase:', 'name': 'timebase', 'type': 'list',
+             'limits': ['100MHzTimebase', '80MHzTimebase', '20MHzTimebase']},
+            {'title': 'Refresh time (ms):', 'name': 'refresh_time', 'type': 'int', 'value': 100, 'min': 1},
+            {'title': 'Buffer length:', 'name': 'buffer_length', 'type': 'int', 'value': 100000, 'min': 1000},
+            {'title': 'Histogram:', 'name': 'histo_mode', 'type': 'list', 'limits': TimeTagHistogram.modes},
+            {'title': 'Bin width (ns):', 'name': 'bin_width', 'type': 'float', 'value': 100., 'min': 0.001},
+            {'title': 'Number of bins:', 'name': 'Nbins', 'type': 'int', 'value': 1000, 'min': 1},
+            {'title': 'Sync source:', 'name': 'sync_channel', 'type': 'list',
+             'limits': ['None'] + DAQmx.getTriggeringSources(), 'visible': False},
+            {'title': 'Period (ns):', 'name': 'period', 'type': 'float', 'value': 100000., 'min': 0.001,
+             'visible': False},
+            {'title': 'Clear histogram:', 'name': 'clear', 'type': 'bool_push', 'value': False},
+        ]},
+        {'title': 'Correlation settings:', 'name': 'correlation', 'type': 'group', 'visible': False, 'children': [
+            {'title': 'Second photon source:', 'name': 'photon_channel_2',
+             'type': 'list', 'limits': DAQmx.getTriggeringSources()},
+            {'title': 'Delay window (ns):', 'name': 'corr_window', 'type': 'float', 'value': 100., 'min': 0.},
+            {'title': 'Bin width (ns):', 'name': 'corr_bin_width', 'type': 'float', 'value': 10., 'min': 0.001},
+            {'title': 'Normalize (g2)?:', 'name': 'normalize', 'type': 'bool', 'value': True},
+            {'title': 'Clear correlation:', 'name': 'corr_clear', 'type': 'bool_push', 'value': False},
+        ]},
+        ] + RollingHistory.params
 
     def ini_attributes(self):
         self.controller = None
         self.clock_channel = None
-        self.counter_channel = None
+        self.counter_channels = []
         self.live = False  # True during a continuous grab
         self.counting_time = 0.1
+        self.counts = np.zeros((1, 1), dtype=np.uint32)  # reused buffer of cumulative counts, one row per counter
+        self.count_steps = np.zeros((1, 1), dtype=np.uint32)
+        self.rates = np.zeros((1, 1))  # full rate PL traces (kcts/s) of the last block
+        self.last_count = None
+        self.history = RollingHistory(self.settings['history', 'length'])
+        self.time_tags = [TimeTagStream()]  # one stream per time tagging counter
+        self.histogram = TimeTagHistogram()
+        self.correlator = CrossCorrelator()
+        self.last_read_time = 0.
 
     def commit_settings(self, param: Parameter):
         """Apply the consequences of a change of value in the detector settings
@@ -41,7 +92,35 @@ class DAQ_0DViewer_DAQmx_PLcounter(DAQ_Viewer_base):
         """
         if param.name() == "clock_freq":
             self.counting_time = 1/param.value()
+        elif param.name() == "emit_trace":
+            pass
+        elif param.parent() is not None and param.parent().name() == 'history':
+            if param.name() == 'length':
+                self.history.reset(length=param.value())
+            elif param.name() == 'enable':
+                self.history.clear()
+        elif param.name() in ['histo_mode', 'bin_width', 'Nbins', 'period', 'clear']:
+            if param.name() == 'histo_mode':
+                self.settings.child('time_tagging', 'sync_channel').show(param.value() == 'Arrival')
+                self.settings.child('time_tagging', 'period').show(param.value() == 'Arrival' and
+                                                                   self.settings['time_tagging', 'sync_channel']
+                                                                   == 'None')
+                if self.settings['time_tagging', 'sync_channel'] != 'None':  # the sync counter is added or removed
+                    self.stop()
+                    self.update_tasks()
+            self.update_histogram()
+        elif param.name() in ['corr_window', 'corr_bin_width', 'corr_clear']:
+            self.update_correlator()
+        elif param.name() == 'normalize':
+            pass
         else:
+            if param.name() == 'sync_channel':
+                self.settings.child('time_tagging', 'period').show(param.value() == 'None')
+            if param.name() == "acq_mode":
+                self.settings.child('buffered').show(param.value() == 'Buffered')
+                # the time tagging settings (timebase, refresh time, buffer) are also used for the correlation
+                self.settings.child('time_tagging').show(param.value() in ['Time tagging', 'Correlation'])
+                self.settings.child('correlation').show(param.value() == 'Correlation')
             self.stop()
             self.update_tasks()
 
@@ -60,7 +139,7 @@ class DAQ_0DViewer_DAQmx_PLcounter(DAQ_Viewer_base):
         initialized: bool
             False if initialization failed otherwise True
         """
-        self.controller = {"clock": DAQmx(), "counter": DAQmx()}
+        self.controller = {"clock": DAQmx(), "counters": []}
         try:
             self.update_tasks()
             initialized = True
@@ -70,19 +149,21 @@ class DAQ_0DViewer_DAQmx_PLcounter(DAQ_Viewer_base):
             print(e)
             initialized = False
             info = "Error"
-            
+
         self.dte_signal_temp.emit(DataToExport(name='PL',
-                                               data=[DataWithAxes(name='PL', data=[np.array([0])],
-                                               source=DataSource['raw'],
-                                               dim='Data0D', labels=['PL (kcts/s)'])]))
-        
+                                               data=[DataWithAxes(name='PL',
+                                                                  data=[np.array([0]) for _ in self.counter_channels],
+                                                                  source=DataSource['raw'],
+                                                                  dim='Data0D', labels=self.get_labels())]))
+
         return info, initialized
-    
+
     def close(self):
         """Terminate the communication protocol"""
         self.controller["clock"].close()
-        self.controller["counter"].close()
-        
+        for counter in self.controller["counters"]:
+            counter.close()
+
     def grab_data(self, Naverage=1, **kwargs):
         """Start a grab from the detector
 
@@ -99,21 +180,215 @@ class DAQ_0DViewer_DAQmx_PLcounter(DAQ_Viewer_base):
             if kwargs['live'] == self.live and self.live:
                 update = False  # we are already live
             self.live = kwargs['live']
-            
+
+        if self.settings['acq_mode'] == 'Buffered':
+            self.grab_buffered(update)
+            return
+        elif self.settings['acq_mode'] == 'Time tagging':
+            self.grab_time_tags(update)
+            return
+        elif self.settings['acq_mode'] == 'Correlation':
+            self.grab_correlation(update)
+            return
+
         if update:
             self.update_tasks()
             self.controller["clock"].start()
-        
-        read_data = self.controller["counter"].readCounter(1, counting_time=self.counting_time)
-        data_pl = 1e-3*read_data/self.counting_time  # convert to kcts/s
-        self.dte_signal.emit(DataToExport(name='PL',
-                                          data=[DataWithAxes(name='PL', data=[data_pl],
-                                                             source=DataSource['raw'],
-                                                             dim='Data0D', labels=['PL (kcts/s)'])]))
+
+        # all the counters are armed before reading so that they count during the same clock period
+        for counter in self.controller["counters"]:
+            counter.start()
+        data_pl = [1e-3*counter.readCounter(1, counting_time=self.counting_time)/self.counting_time
+                   for counter in self.controller["counters"]]  # convert to kcts/s
+        self.emit_pl([DataWithAxes(name='PL', data=data_pl, source=DataSource['raw'],
+                                   dim='Data0D', labels=self.get_labels())])
+
+    def grab_buffered(self, update=True):
+        """Read a block of cumulative counts from the continuously running counter and emit the rates
+
+        The counter task is sampled by the clock so the counting intervals are hardware timed, only one
+        driver call is made per block of samples.
+        """
+        if update:
+            self.update_tasks()
+            # the counters are started first so that they are sampled from the very first clock edge
+            for counter in self.controller["counters"]:
+                counter.start()
+            self.controller["clock"].start()
+
+        block_size = self.counts.shape[1]
+        timeout = 2 * block_size * self.counting_time + 1.
+        # all counters share the clock so each row of the buffer covers the same counting intervals
+        read = min([counter.readCounterBuffer(self.counts[ind], block_size, timeout=timeout)
+                    for ind, counter in enumerate(self.controller["counters"])])
+        rates = self.counts_to_rates(read)
+
+        labels = self.get_labels()
+        dwa_pl = [DataWithAxes(name='PL', data=[np.atleast_1d(rate) for rate in np.mean(rates, axis=1)],
+                               source=DataSource['raw'], dim='Data0D', labels=labels)]
+        if self.settings['buffered', 'emit_trace']:
+            dwa_pl.append(DataWithAxes(name='PL trace', data=list(rates.copy()),
+                                       source=DataSource['raw'], dim='Data1D', labels=labels,
+                                       axes=[Axis('Time', units='s',
+                                                  data=np.arange(rates.shape[1]) * self.counting_time,
+                                                  index=0)]))
+        self.emit_pl(dwa_pl)
+
+        if not self.live:
+            self.close()
+
+    def uses_sync(self):
+        """True if the Arrival histogram is measured from the time tags of the sync source"""
+        return self.settings['acq_mode'] == 'Time tagging' and \
+            self.settings['time_tagging', 'histo_mode'] == 'Arrival' and \
+            self.settings['time_tagging', 'sync_channel'] != 'None'
+
+    def grab_time_tags(self, update=True):
+        """Read all the events time stamped since the last read and accumulate them in the histogram
+
+        With a sync source, the photons and the sync pulses are time tagged from the same first clock edge, and the
+        sync pulses are read after the photons, so that the pulse preceding each photon has been read.
+        """
+        counters = self.controller["counters"][:2 if self.uses_sync() else 1]
+        if self.uses_sync() and len(counters) < 2:
+            self.emit_status(ThreadCommand('Update_Status', ['Select two counting channels for the sync source']))
+            return
+        if update:
+            self.update_tasks()
+            for counter in counters:
+                counter.start()
+            if self.uses_sync():
+                self.controller["clock"].start()  # arms both counters
+            self.last_read_time = time.perf_counter()
+
+        time.sleep(self.settings['time_tagging', 'refresh_time'] * 1e-3)
+        tags = []
+        for ind, counter in enumerate(counters):
+            Navailable = min(counter.getAvailableSamples(), self.counts.shape[1])
+            read = 0
+            if Navailable > 0:
+                read = counter.readCounterBuffer(self.counts[ind], Navailable, timeout=1.)
+            tags.append(self.time_tags[ind].update(self.counts[ind, :read]))
+        now = time.perf_counter()
+        self.histogram.update(tags[0], sync=tags[1] if len(tags) > 1 else None)
+
+        rate = 1e-3 * tags[0].size / (now - self.last_read_time)  # in kcts/s
+        self.last_read_time = now
+        self.emit_pl([DataWithAxes(name='PL', data=[np.array([rate])], source=DataSource['raw'],
+                                   dim='Data0D', labels=self.get_labels()[:1]),
+                      self.histogram.to_dwa('Time tags histogram', labels=[self.settings['time_tagging',
+                                                                                         'histo_mode']])])
+
+        if not self.live:
+            self.close()
+
+    def grab_correlation(self, update=True):
+        """Read the events time stamped on both channels since the last read and correlate them
+
+        Both counters are armed by the first edge of the clock so that their time tags share the same origin.
+        """
+        counters = self.controller["counters"][:2]
+        if len(counters) < 2:
+            self.emit_status(ThreadCommand('Update_Status', ['Select two counting channels for the correlation']))
+            return
+        if update:
+            self.update_tasks()
+            for counter in counters:
+                counter.start()  # armed, counting from the first clock edge
+            self.controller["clock"].start()
+            self.last_read_time = time.perf_counter()
+
+        time.sleep(self.settings['time_tagging', 'refresh_time'] * 1e-3)
+        tags = []
+        for ind, counter in enumerate(counters):
+            Navailable = min(counter.getAvailableSamples(), self.counts.shape[1])
+            read = 0
+            if Navailable > 0:
+                read = counter.readCounterBuffer(self.counts[ind], Navailable, timeout=1.)
+            tags.append(self.time_tags[ind].update(self.counts[ind, :read]))
+        now = time.perf_counter()
+        self.correlator.update(tags[0], tags[1], duration=now - self.last_read_time)
+
+        rates = [np.array([1e-3 * tag.size / (now - self.last_read_time)]) for tag in tags]  # in kcts/s
+        self.last_read_time = now
+        normalize = self.settings['correlation', 'normalize']
+        self.emit_pl([DataWithAxes(name='PL', data=rates, source=DataSource['raw'],
+                                   dim='Data0D', labels=self.get_labels()),
+                      self.correlator.to_dwa('Correlation', normalize=normalize,
+                                             labels=['g2' if normalize else 'Coincidences'])])
+
+        if not self.live:
+            self.close()
+
+    def timebase_period(self):
+        """Period (ns) of the timebase counted by the time tagging counters, the resolution of the time tags"""
+        return 1e3 / float(self.settings['time_tagging', 'timebase'].split('MHz')[0])
+
+    def update_correlator(self):
+        """(Re)create the correlator from the settings, the accumulated coincidences are cleared
+
+        The bin width is rounded to a whole number of timebase periods, as the time tags are quantized to the
+        timebase: finer bins would be left empty, except one every timebase period.
+        """
+        tick = self.timebase_period()
+        bin_width = max(int(round(self.settings['correlation', 'corr_bin_width'] / tick)), 1) * tick
+        if not np.isclose(bin_width, self.settings['correlation', 'corr_bin_width']):
+            self.settings.child('correlation', 'corr_bin_width').setValue(bin_width)
+        self.correlator = CrossCorrelator(window=self.settings['correlation', 'corr_window'] * 1e-9,
+                                          bin_width=bin_width * 1e-9)
+
+    def update_histogram(self):
+        """(Re)create the histogram from the settings, the accumulated events are cleared"""
+        self.histogram = TimeTagHistogram(bin_width=self.settings['time_tagging', 'bin_width'] * 1e-9,
+                                          Nbins=self.settings['time_tagging', 'Nbins'],
+                                          mode=self.settings['time_tagging', 'histo_mode'],
+                                          period=self.settings['time_tagging', 'period'] * 1e-9)
+
+    def emit_pl(self, dwa_pl):
+        """Emit the PL data, adding the rolling history of the 0D PL values if enabled"""
+        if self.settings['history', 'enable']:
+            self.history.update([data[0] for data in dwa_pl[0].data])
+            if self.settings['history', 'emit']:
+                dwa_pl.append(self.history.to_dwa('PL history', labels=self.get_labels()))
+        self.dte_signal.emit(DataToExport(name='PL', data=dwa_pl))
+
+    def counts_to_rates(self, Nread):
+        """Differentiate the cumulative counts of the last block into count rates (kcts/s)
+
+        All the counters are processed at once, one row per counter.
+
+        Parameters
+        ----------
+        Nread: int
+            number of samples per counter read in the counts buffer
+
+        Returns
+        -------
+        ndarray: view on the rates buffer, shape (number of counters, number of samples)
+        """
+        if Nread == 0:
+            return self.rates[:, :0]
+        counts = self.counts[:, :Nread]
+        steps = self.count_steps[:, :Nread]
+        # uint32 arithmetic handles the roll over of the hardware counters
+        np.subtract(counts[:, 1:], counts[:, :-1], out=steps[:, 1:])
+        if self.last_count is None:
+            # first block after a (re)start, there is no reference for the first samples
+            steps = steps[:, 1:]
+        else:
+            np.subtract(counts[:, 0], self.last_count, out=steps[:, 0])
+        self.last_count = counts[:, -1].copy()
+        rates = self.rates[:, :steps.shape[1]]
+        np.multiply(steps, 1e-3 / self.counting_time, out=rates)
+        return rates
+
+    def get_labels(self):
+        return [f'PL {channel.name} (kcts/s)' for channel in self.counter_channels]
 
     def stop(self):
         """Stop the current grab hardware wise if necessary"""
         self.close()
+        self.live = False
         self.emit_status(ThreadCommand('Update_Status', ['Acquisition stopped.']))
         return ''
 
@@ -123,21 +398,76 @@ class DAQ_0DViewer_DAQmx_PLcounter(DAQ_Viewer_base):
         self.clock_channel = ClockCounter(self.settings.child("clock_freq").value(),
                                           name=self.settings.child("clock_channel").value(),
                                           source="Counter")
-        self.counter_channel = Counter(name=self.settings.child("counter_channel").value(),
-                                       source="Counter", edge=Edge.names()[0])
+        if self.settings['acq_mode'] in ['Time tagging', 'Correlation']:
+            # the first selected counter(s) count the timebase edges, latched on each photon
+            timebase = self.settings['time_tagging', 'timebase']
+            if self.settings['acq_mode'] == 'Time tagging' and not self.uses_sync():
+                names = self.settings['counter_channels']['selected'][:1]
+                arm_source = ''
+            else:
+                names = self.settings['counter_channels']['selected'][:2]
+                arm_source = "/" + self.clock_channel.name + "InternalOutput"
+            self.counter_channels = [TimeTagCounter(name=name, source="Counter", edge=Edge.names()[0],
+                                                    timebase="/" + name.split('/')[0] + "/" + timebase,
+                                                    timebase_frequency=float(timebase.split('MHz')[0]) * 1e6,
+                                                    arm_source=arm_source)
+                                     for name in names]
+        else:
+            self.counter_channels = [Counter(name=name, source="Counter", edge=Edge.names()[0])
+                                     for name in self.settings['counter_channels']['selected']]
 
         self.controller["clock"].update_task(channels=[self.clock_channel],
                                              clock_settings=ClockSettings(),
                                              trigger_settings=TriggerSettings())
         self.controller["clock"].task.CfgImplicitTiming(DAQmx_Val_ContSamps, 1)
-        
-        self.controller["counter"].update_task(channels=[self.counter_channel],
-                                               clock_settings=ClockSettings(),
-                                               trigger_settings=TriggerSettings())
 
-        # connect the clock to the counter
-        self.controller["counter"].task.SetSampClkSrc("/" + self.clock_channel.name + "InternalOutput")
+        if self.settings['acq_mode'] == 'Buffered':
+            block_size = self.settings['buffered', 'block_size']
+            self.counting_time = 1 / self.settings['clock_freq']
+            self.counts = np.zeros((len(self.counter_channels), block_size), dtype=np.uint32)
+            self.count_steps = np.zeros((len(self.counter_channels), block_size), dtype=np.uint32)
+            self.rates = np.zeros((len(self.counter_channels), block_size))
+            self.last_count = None
+            # continuous sampling on the clock, the input buffer holds several blocks
+            clock_settings = [ClockSettings(source="/" + self.clock_channel.name + "InternalOutput",
+                                            frequency=self.settings['clock_freq'],
+                                            Nsamples=max(10 * block_size, 1000),
+                                            repetition=True)] * len(self.counter_channels)
+        elif self.settings['acq_mode'] in ['Time tagging', 'Correlation']:
+            buffer_length = self.settings['time_tagging', 'buffer_length']
+            self.counts = np.zeros((len(self.counter_channels), buffer_length), dtype=np.uint32)
+            self.time_tags = [TimeTagStream(channel.timebase_frequency, buffer_length)
+                              for channel in self.counter_channels]
+            self.update_histogram()
+            self.update_correlator()
+            # the photons are the sample clock, the frequency is only the maximum expected rate
+            photon_channels = [self.settings['photon_channel'],
+                               self.settings['time_tagging', 'sync_channel'] if self.uses_sync() else
+                               self.settings['correlation', 'photon_channel_2']]
+            clock_settings = [ClockSettings(source=photon_channel,
+                                            frequency=1e7,
+                                            Nsamples=buffer_length,
+                                            repetition=True)
+                              for photon_channel in photon_channels[:len(self.counter_channels)]]
+        else:
+            clock_settings = [ClockSettings()] * len(self.counter_channels)
+
+        # one task per counter, a counter input task can only hold a single channel on most devices
+        for counter in self.controller["counters"][len(self.counter_channels):]:
+            counter.close()
+        self.controller["counters"] = self.controller["counters"][:len(self.counter_channels)]
+        while len(self.controller["counters"]) < len(self.counter_channels):
+            self.controller["counters"].append(DAQmx())
+
+        for counter, channel, settings in zip(self.controller["counters"], self.counter_channels, clock_settings):
+            counter.update_task(channels=[channel],
+                                clock_settings=settings,
+                                trigger_settings=TriggerSettings())
+
+            if self.settings['acq_mode'] not in ['Time tagging', 'Correlation']:
+                # connect the clock to the counter
+                counter.task.SetSampClkSrc("/" + self.clock_channel.name + "InternalOutput")
+
 
-        
 if __name__ == '__main__':
     main(__file__)
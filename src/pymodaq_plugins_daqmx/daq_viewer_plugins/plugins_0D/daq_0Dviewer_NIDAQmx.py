@@ -1,3 +1,5 @@
+import numpy as np
+from pymodaq.utils.data import DataToExport
 from pymodaq.control_modules.viewer_utility_classes import main
 from pymodaq.control_modules.viewer_utility_classes import comon_parameters as viewer_params
 from pymodaq_plugins_daqmx import config
@@ -7,6 +9,8 @@ from pymodaq_plugins_daqmx.hardware.national_instruments.daqmxni import UsageTyp
                                                             TerminalConfiguration, Edge
 from pymodaq_plugins_daqmx.hardware.national_instruments.NIDAQmx_base import DAQ_NIDAQmx_base
 from pymodaq_plugins_daqmx.hardware.national_instruments.NIDAQmx_Viewer import DAQ_NIDAQmx_Viewer
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import RollingHistory, \
+    EventDetector, PulseAnalyzer
 from pymodaq.utils.logger import set_logger, get_module_name
 logger = set_logger(get_module_name(__file__))
 
@@ -25,6 +29,7 @@ class DAQ_0DViewer_NIDAQmx(DAQ_NIDAQmx_Viewer):
     current_device: niDevice
     live: bool
     Naverage: int
+    history: RollingHistory
 
     param_devices = NIDAQmx.get_NIDAQ_devices().device_names
     params = viewer_params + [
@@ -32,7 +37,7 @@ class DAQ_0DViewer_NIDAQmx(DAQ_NIDAQmx_Viewer):
         {'title': 'Devices :', 'name': 'devices', 'type': 'list', 'limits': param_devices,
          'value': param_devices[0]
          },
-        ] + DAQ_NIDAQmx_base.params
+        ] + DAQ_NIDAQmx_base.params + EventDetector.params + PulseAnalyzer.params + RollingHistory.params
 
     def __init__(self, parent=None, params_state=None):
         super().__init__(parent, params_state)
@@ -46,6 +51,32 @@ class DAQ_0DViewer_NIDAQmx(DAQ_NIDAQmx_Viewer):
         self.config_modules = []
         self.live = False
         self.Naverage = 1
+        self.history = RollingHistory(self.settings['history', 'length'])
+
+    def commit_settings(self, param):
+        if param.parent() is not None and param.parent().name() == 'history':
+            if param.name() == 'length':
+                self.history.reset(length=param.value())
+            elif param.name() == 'enable':
+                self.history.clear()
+        else:
+            super().commit_settings(param)
+            if param.parent() is not None and param.parent().name() in ['events', 'pulses'] and \
+                    param.name() == 'enable':
+                # the captures and pulse histograms are emitted as they are, bypassing the history
+                captures = self.settings['events', 'enable'] or self.settings['pulses', 'enable']
+                if captures:
+                    self.settings.child('history', 'enable').setValue(False)
+                self.settings.child('history').show(not captures)
+
+    def process_data(self, dte: DataToExport) -> DataToExport:
+        """Add the rolling history of the channels mean values to the emitted data"""
+        if self.settings['history', 'enable']:
+            dwa = dte[0]
+            self.history.update([np.mean(data) for data in dwa.data])
+            if self.settings['history', 'emit']:
+                dte.append(self.history.to_dwa('NI Analog Input history', labels=dwa.labels))
+        return dte
 
     def close(self):
         self.live = False
@@ -1,5 +1,11 @@
+from pymodaq_plugins_daqmx import config
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmxni import NIDAQmx
+from pymodaq_plugins_daqmx.hardware.national_instruments.NIDAQmx_base import DAQ_NIDAQmx_base
 from pymodaq_plugins_daqmx.hardware.national_instruments.NIDAQmx_Viewer import DAQ_NIDAQmx_Viewer
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import EventDetector, \
+    PulseAnalyzer
 from pymodaq.control_modules.viewer_utility_classes import main
+from pymodaq.control_modules.viewer_utility_classes import comon_parameters as viewer_params
 
 
 class DAQ_1DViewer_DAQmx(DAQ_NIDAQmx_Viewer):
@@ -17,9 +23,23 @@ class DAQ_1DViewer_DAQmx(DAQ_NIDAQmx_Viewer):
     """
     control_type = "1D"  # could be "0D", "1D"
 
+    param_devices = NIDAQmx.get_NIDAQ_devices().device_names
+    params = viewer_params + [
+        {'title': 'Devices :', 'name': 'devices', 'type': 'list', 'limits': param_devices,
+         'value': param_devices[0]
+         },
+        ] + DAQ_NIDAQmx_base.params + EventDetector.params + PulseAnalyzer.params
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, control_type=self.control_type, **kwargs)
 
+    def ini_attributes(self):
+        super().ini_attributes()
+        self.config = config
+        self.config_channels = []
+        self.config_devices = []
+        self.config_modules = []
+
 
 if __name__ == '__main__':
     main(__file__)
\ No newline at end of file
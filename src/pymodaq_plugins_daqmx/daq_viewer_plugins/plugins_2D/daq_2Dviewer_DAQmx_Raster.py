@@ -0,0 +1,210 @@
+import numpy as np
+from pymodaq.utils.daq_utils import ThreadCommand
+from pymodaq.utils.data import DataToExport, DataFromPlugins, Axis
+from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters, main
+from pymodaq.utils.parameter import Parameter
+
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx import DAQmx, AOChannel, AIChannel, Counter, \
+    DAQ_analog_types, DAQ_termination, Edge
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_objects import AO_with_clock_DAQmx
+
+
+class DAQ_2DViewer_DAQmx_Raster(DAQ_Viewer_base):
+    """
+    Plugin acquiring an image by raster scanning two piezo scanners (analog outputs) with a NI card.
+
+    The whole frame trajectory is computed at once and output on the AO channels sampled by a clock counter. The
+    acquisition (a counter, for instance photon counting, or an analog input) is sampled by the same clock, so
+    that each pixel is hardware timed and the frame rate is only limited by the pixel time.
+    The image is emitted after each line while the frame is being acquired.
+
+    Do not use the scanner analog outputs or the clock channel with other plugins at the same time.
+    """
+    params = comon_parameters+[
+        {'title': 'Clock channel:', 'name': 'clock_channel', 'type': 'list',
+         'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')},
+        {'title': 'Pixel time (ms):', 'name': 'pixel_time', 'type': 'float', 'value': 1., 'min': 0.},
+        {'title': 'Flyback pixels:', 'name': 'flyback', 'type': 'int', 'value': 10, 'min': 0},
+        {'title': 'Snake scan?:', 'name': 'snake', 'type': 'bool', 'value': False},
+        {'title': 'X axis (fast):', 'name': 'x_axis', 'type': 'group', 'children': [
+            {'title': 'Output channel:', 'name': 'analog_channel', 'type': 'list',
+             'limits': DAQmx.get_NIDAQ_channels(source_type='Analog_Output')},
+            {'title': 'Conversion factor (nm/V)', 'name': 'conv_factor', 'type': 'float', 'value': 7500.0},
+            {'title': 'Start (nm):', 'name': 'start', 'type': 'float', 'value': 0.},
+            {'title': 'Stop (nm):', 'name': 'stop', 'type': 'float', 'value': 10000.},
+            {'title': 'Npixels:', 'name': 'Npixels', 'type': 'int', 'value': 100, 'min': 1},
+        ]},
+        {'title': 'Y axis (slow):', 'name': 'y_axis', 'type': 'group', 'children': [
+            {'title': 'Output channel:', 'name': 'analog_channel', 'type': 'list',
+             'limits': DAQmx.get_NIDAQ_channels(source_type='Analog_Output')},
+            {'title': 'Conversion factor (nm/V)', 'name': 'conv_factor', 'type': 'float', 'value': 7500.0},
+            {'title': 'Start (nm):', 'name': 'start', 'type': 'float', 'value': 0.},
+            {'title': 'Stop (nm):', 'name': 'stop', 'type': 'float', 'value': 10000.},
+            {'title': 'Npixels:', 'name': 'Npixels', 'type': 'int', 'value': 100, 'min': 1},
+        ]},
+        {'title': 'Acquisition:', 'name': 'acq_type', 'type': 'list', 'limits': ['Counter', 'Analog input']},
+        {'title': 'Counting channel:', 'name': 'counter_channel', 'type': 'list',
+         'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')},
+        {'title': 'Analog input:', 'name': 'ai_channel', 'type': 'list', 'visible': False,
+         'limits': DAQmx.get_NIDAQ_channels(source_type='Analog_Input')},
+    ]
+
+    def ini_attributes(self):
+        self.controller = None
+        self.channels = []
+        self.voltages = None
+        self.pixel_ticks = None
+        self.buffer = np.zeros((0,))
+        self.image = np.zeros((1, 1))
+        self.x_axis = np.zeros((1,))
+        self.y_axis = np.zeros((1,))
+
+    def commit_settings(self, param: Parameter):
+        """Apply the consequences of a change of value in the detector settings
+
+        Parameters
+        ----------
+        param: Parameter
+            A given parameter (within detector_settings) whose value has been changed by the user
+        """
+        if param.name() == 'acq_type':
+            self.settings.child('counter_channel').show(param.value() == 'Counter')
+            self.settings.child('ai_channel').show(param.value() == 'Analog input')
+        self.voltages = None  # the trajectory will be computed again on the next grab
+
+    def ini_detector(self, controller=None):
+        """Detector communication initialization
+
+        Parameters
+        ----------
+        controller: (object)
+            custom object of a PyMoDAQ plugin (Slave case). None if only one actuator/detector by controller
+            (Master case)
+
+        Returns
+        -------
+        info: str
+        initialized: bool
+            False if initialization failed otherwise True
+        """
+        self.controller = {"scanner": AO_with_clock_DAQmx(), "acquisition": DAQmx()}
+        self.update_trajectory()
+        self.dte_signal_temp.emit(DataToExport(name='Raster', data=[self.get_dwa()]))
+        return "NI card based raster scanning", True
+
+    def close(self):
+        """Terminate the communication protocol"""
+        self.controller["scanner"].clock.close()
+        self.controller["scanner"].analog.close()
+        self.controller["acquisition"].close()
+
+    def update_trajectory(self):
+        """Compute the frame trajectory (in volts) and the image axes from the settings"""
+        axes = []
+        for axis in ['x_axis', 'y_axis']:
+            positions = np.linspace(self.settings[axis, 'start'], self.settings[axis, 'stop'],
+                                    self.settings[axis, 'Npixels'])
+            axes.append(positions)
+        self.x_axis, self.y_axis = axes
+        self.voltages, self.pixel_ticks = AO_with_clock_DAQmx.raster_voltages(
+            self.x_axis / self.settings['x_axis', 'conv_factor'],
+            self.y_axis / self.settings['y_axis', 'conv_factor'],
+            flyback=self.settings['flyback'], snake=self.settings['snake'])
+        self.image = np.zeros(self.pixel_ticks.shape)
+
+    def update_tasks(self):
+        """Set up the scanner (clock and AO) tasks and the acquisition task sampled on the same clock"""
+        scanner = self.controller["scanner"]
+        scanner.clock_channel_name = self.settings['clock_channel']
+        scanner.clock_frequency = 1e3 / self.settings['pixel_time']
+        for axis in ['x_axis', 'y_axis']:
+            voltages = self.voltages[0 if axis == 'x_axis' else 1]
+            scanner.AO_channels[axis] = AOChannel(name=self.settings[axis, 'analog_channel'],
+                                                  source='Analog_Output',
+                                                  analog_type=DAQ_analog_types.names()[0],
+                                                  value_min=min(np.min(voltages), -0.1),
+                                                  value_max=max(np.max(voltages), 0.1))
+        clock_settings = scanner.set_up_raster(self.voltages, ['x_axis', 'y_axis'])
+
+        if self.settings['acq_type'] == 'Counter':
+            self.channels = [Counter(name=self.settings['counter_channel'], source='Counter',
+                                     edge=Edge.names()[0])]
+            self.buffer = np.zeros((self.voltages.shape[1],), dtype=np.uint32)
+        else:
+            self.channels = [AIChannel(name=self.settings['ai_channel'], source='Analog_Input',
+                                       analog_type=DAQ_analog_types.names()[0],
+                                       termination=DAQ_termination.names()[0])]
+            self.buffer = np.zeros((self.voltages.shape[1],))
+        self.controller["acquisition"].update_task(channels=self.channels, clock_settings=clock_settings)
+
+    def grab_data(self, Naverage=1, **kwargs):
+        """Acquire a whole frame, the image is emitted after each line
+
+        Parameters
+        ----------
+        Naverage: int
+            Number of hardware averaging not relevant here.
+        kwargs: dict
+            others optionals arguments
+        """
+        if self.voltages is None:
+            self.update_trajectory()
+        self.update_tasks()
+        self.image[...] = 0.
+        self.controller["scanner"].start_raster(slaved=[self.controller["acquisition"]])
+
+        line_length = self.voltages.shape[1] // self.pixel_ticks.shape[0]
+        timeout = 2 * line_length * self.settings['pixel_time'] * 1e-3 + 1.
+        Nread = 0
+        Nticks = self.voltages.shape[1]
+        for line in range(self.pixel_ticks.shape[0]):
+            # the last line also reads the extra tick ending the last pixel
+            Nline = line_length if line < self.pixel_ticks.shape[0] - 1 else Nticks - Nread
+            Nread += self.read_block(Nread, Nline, timeout)
+            self.fill_image(Nread)
+            if line < self.pixel_ticks.shape[0] - 1:
+                self.dte_signal_temp.emit(DataToExport(name='Raster', data=[self.get_dwa()]))
+        self.dte_signal.emit(DataToExport(name='Raster', data=[self.get_dwa()]))
+        self.stop()
+
+    def read_block(self, start, Nsamples, timeout):
+        """Read Nsamples of the acquisition task into the frame buffer, starting at index start"""
+        if self.settings['acq_type'] == 'Counter':
+            return self.controller["acquisition"].readCounterBuffer(self.buffer[start:start + Nsamples],
+                                                                    Nsamples, timeout=timeout)
+        else:
+            return self.controller["acquisition"].readAnalogBuffer(self.buffer[start:start + Nsamples],
+                                                                   Nsamples, timeout=timeout)
+
+    def fill_image(self, Nread):
+        """Convert the samples read so far into pixel values, all at once
+
+        The sample at clock edge k+1 ends the pixel output at edge k: counts are differentiated (uint32
+        arithmetic handles the roll over) into count rates in kcts/s, analog inputs are taken at the end of
+        the pixel.
+        """
+        if Nread < 2:
+            return
+        if self.settings['acq_type'] == 'Counter':
+            values = np.diff(self.buffer[:Nread]) * (1. / self.settings['pixel_time'])
+        else:
+            values = self.buffer[1:Nread]
+        done = self.pixel_ticks < values.size
+        self.image[done] = values[self.pixel_ticks[done]]
+
+    def get_dwa(self):
+        label = 'PL (kcts/s)' if self.settings['acq_type'] == 'Counter' else 'Voltage (V)'
+        return DataFromPlugins(name='Raster', data=[self.image.copy()], dim='Data2D', labels=[label],
+                               axes=[Axis('y', units='nm', data=self.y_axis, index=0),
+                                     Axis('x', units='nm', data=self.x_axis, index=1)])
+
+    def stop(self):
+        """Stop the current grab hardware wise if necessary"""
+        self.controller["scanner"].stop()
+        self.controller["acquisition"].stop()
+        self.emit_status(ThreadCommand('Update_Status', ['Acquisition stopped.']))
+        return ''
+
+
+if __name__ == '__main__':
+    main(__file__)
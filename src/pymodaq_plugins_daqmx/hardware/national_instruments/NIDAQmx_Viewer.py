@@ -1,13 +1,16 @@
 import nidaqmx
 import numpy as np
+import time
 import traceback
 from qtpy import QtCore
 from .daqmxni import NIDAQmx
 from pymodaq_plugins_daqmx.hardware.national_instruments.NIDAQmx_base import DAQ_NIDAQmx_base, TerminalConfiguration, \
     UsageTypeAI, ChannelType
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import EventDetector, \
+    PulseAnalyzer
 from pymodaq.control_modules.viewer_utility_classes import DAQ_Viewer_base, comon_parameters as viewer_params
 from pymodaq.utils.daq_utils import ThreadCommand
-from pymodaq.utils.data import DataFromPlugins, DataToExport
+from pymodaq.utils.data import DataFromPlugins, DataToExport, Axis
 from pymodaq.utils.logger import set_logger, get_module_name
 logger = set_logger(get_module_name(__file__))
 
@@ -27,7 +30,7 @@ class DAQ_NIDAQmx_Viewer(DAQ_Viewer_base, DAQ_NIDAQmx_base):
     """
 
     live_mode_available = True
-    params = viewer_params + DAQ_NIDAQmx_base.params
+    params = viewer_params + DAQ_NIDAQmx_base.params + EventDetector.params + PulseAnalyzer.params
 
     def __init__(self, parent=None, params_state=None, control_type="0D"):
         DAQ_Viewer_base.__init__(self, parent, params_state)  # defines settings attribute and various other methods
@@ -42,13 +45,20 @@ class DAQ_NIDAQmx_Viewer(DAQ_Viewer_base, DAQ_NIDAQmx_base):
                                                          ChannelType.COUNTER_INPUT.name,
                                                          ChannelType.DIGITAL_INPUT.name])  # analog & digital input + counter
         elif self.control_type == "1D":
-            self.settings.child('NIDAQ_type').setLimits(ChannelType.ANALOG_INPUT.name)
+            self.settings.child('NIDAQ_type').setLimits([ChannelType.ANALOG_INPUT.name,
+                                                         ChannelType.COUNTER_INPUT.name,
+                                                         ChannelType.DIGITAL_INPUT.name])
         elif self.control_type == "Actuator":
             self.settings.child('NIDAQ_type').setLimits(ChannelType.ANALOG_OUTPUT.name, ChannelType.COUNTER_OUTPUT.name)
 
         self.settings.child('ao_settings').hide()
         self.settings.child('ao_channels').hide()
 
+        self.di_samples_read = 0  # number of samples read since the start of the sample clocked DI task
+        self.detector = EventDetector()  # software trigger on the analog input blocks
+        self.analyzer = PulseAnalyzer()  # pulse height histogram of the analog input blocks
+        self.start_time = time.time()
+
         # timer used for the counter
         self.timer = QtCore.QTimer()
         self.timer.setSingleShot(True)
@@ -58,6 +68,8 @@ class DAQ_NIDAQmx_Viewer(DAQ_Viewer_base, DAQ_NIDAQmx_base):
         """Stop the current grab hardware wise if necessary"""
         try:
             self.controller.stop()
+            if self.timestamps is not None:
+                self.timestamps.stop()
             self.live = False
             logger.info("Acquisition stopped.")
         except Exception:
@@ -87,6 +99,16 @@ class DAQ_NIDAQmx_Viewer(DAQ_Viewer_base, DAQ_NIDAQmx_base):
                 ranges = self.controller.getAIVoltageRange(device)
                 param.child('voltage_settings', 'volt_min').setOpts(limits=[r[0] for r in ranges])
                 param.child('voltage_settings', 'volt_max').setOpts(limits=[r[1] for r in ranges])
+            elif param.parent().name() == 'events':
+                if param.name() == 'enable' and param.value():
+                    self.settings.child('pulses', 'enable').setValue(False)  # both analyze the same blocks
+                self.update_detector()
+                return
+            elif param.parent().name() == 'pulses':
+                if param.name() == 'enable' and param.value():
+                    self.settings.child('events', 'enable').setValue(False)
+                self.update_analyzer()
+                return
 
         DAQ_NIDAQmx_base.commit_settings(self, param)
 
@@ -186,28 +208,154 @@ class DAQ_NIDAQmx_Viewer(DAQ_Viewer_base, DAQ_NIDAQmx_base):
         if self.controller.task is None:
             self.update_task()
 
-        self.controller.register_callback(self.emit_data, "Nsamples", self.clock_settings.Nsamples)
+        if self.change_detection():
+            # each change is read and emitted at once, the time stamp counter is started first to latch all of them
+            self.controller.register_callback(self.emit_data, "Nsamples", 1)
+            self.timestamp_stream.clear()
+            self.timestamps.start()
+        elif self.reference_triggered():
+            # the Nsamples around the trigger are read once the finite acquisition is done
+            self.controller.register_callback(self.emit_reference, "done")
+        else:
+            self.controller.register_callback(self.emit_data, "Nsamples", self.clock_settings.Nsamples)
+        self.di_samples_read = 0
+        if self.events_enabled():
+            self.update_detector()
+        if self.pulses_enabled():
+            self.update_analyzer()
+        self.start_time = time.time()
         self.controller.start()
 
-    def emit_data(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+    def events_enabled(self):
+        return self.settings['events', 'enable'] and self.settings['NIDAQ_type'] == ChannelType.ANALOG_INPUT.name
+
+    def pulses_enabled(self):
+        return self.settings['pulses', 'enable'] and self.settings['NIDAQ_type'] == ChannelType.ANALOG_INPUT.name
+
+    def update_analyzer(self):
+        """Set up the pulse analyzer from the settings, its histogram being cleared"""
+        self.analyzer = PulseAnalyzer(threshold=self.settings['pulses', 'threshold'],
+                                      hysteresis=self.settings['pulses', 'hysteresis'],
+                                      polarity=self.settings['pulses', 'polarity'],
+                                      baseline_blocks=self.settings['pulses', 'baseline_blocks'],
+                                      max_length=self.settings['pulses', 'max_length'],
+                                      Nbins=self.settings['pulses', 'Nbins'],
+                                      max_height=self.settings['pulses', 'max_height'],
+                                      sample_rate=self.settings['clock_settings', 'frequency'],
+                                      channel=self.settings['pulses', 'channel'])
+
+    def update_detector(self):
+        """Set up the software event detector from the settings, its stream starting again"""
+        self.detector = EventDetector(condition=self.settings['events', 'condition'],
+                                      level=self.settings['events', 'level'],
+                                      window_top=self.settings['events', 'window_top'],
+                                      hysteresis=self.settings['events', 'hysteresis'],
+                                      pre=self.settings['events', 'pre'],
+                                      post=self.settings['events', 'post'],
+                                      sample_rate=self.settings['clock_settings', 'frequency'],
+                                      channel=self.settings['events', 'channel'])
+
+    def emit_data(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data, Nsamples=None):
+        """Read and emit a block of Nsamples samples (nsamplestoread if None)"""
+        if Nsamples is None:
+            Nsamples = self.settings['nsamplestoread']
+        if self.settings['NIDAQ_type'] == ChannelType.DIGITAL_INPUT.name:
+            self.emit_digital(Nsamples)
+            return 0  # mandatory for the NIDAQmx callback
         channels_names = [ch.name for ch in self.channels]
         # channels_ai_names = [ch.name for ch in self.channels if ch.source == 'Analog_Input']
-        data_from_task = self.controller.task.read(self.settings['nsamplestoread'], timeout=20.0)
+        if self.settings['NIDAQ_type'] == ChannelType.COUNTER_INPUT.name:
+            # frequency/period samples, read in a single call into a reused buffer
+            data_from_task = self.controller.readCounter(Nsamples, timeout=20.0)
+            name = 'NI Counter Input'
+        else:
+            data_from_task = self.controller.task.read(Nsamples, timeout=20.0)
+            name = 'NI Analog Input'
+        if not len(self.controller.task.channels.channel_names) != 1:
+            data_dfp = [np.array(data_from_task)]
+        else:
+            data_dfp = list(map(np.array, data_from_task))
+        if self.pulses_enabled():  # exclusive of the event detector
+            self.emit_pulses(data_dfp)
+            return 0  # mandatory for the NIDAQmx callback
+        if self.events_enabled():
+            self.emit_events(data_dfp, channels_names)
+            return 0  # mandatory for the NIDAQmx callback
         if self.control_type == "0D":
-            if not len(self.controller.task.channels.channel_names) != 1:
-                data_dfp = [np.array(data_from_task)]
-            else:
-                data_dfp = list(map(np.array, data_from_task))
-            dte = DataToExport(name='NIDAQmx',
-                               data=[DataFromPlugins(name='NI Analog Input',
-                                                     data=data_dfp,
-                                                     dim=f'Data{self.settings.child("display").value()}',
-                                                     labels=channels_names
-                                                     ),
-                                     ])
-        self.dte_signal.emit(dte)
+            dim = f'Data{self.settings.child("display").value()}'
+        else:
+            dim = 'Data1D'
+        dte = DataToExport(name='NIDAQmx',
+                           data=[DataFromPlugins(name=name,
+                                                 data=data_dfp,
+                                                 dim=dim,
+                                                 labels=channels_names
+                                                 ),
+                                 ])
+        self.dte_signal.emit(self.process_data(dte))
         return 0  # mandatory for the NIDAQmx callback
 
+    def emit_reference(self, task_handle, status, callback_data):
+        """Emit the Nsamples acquired around a reference trigger (pretrigger samples first), the task being armed
+        again for the next trigger in live mode"""
+        self.emit_data(task_handle, None, self.clock_settings.Nsamples, callback_data,
+                       Nsamples=self.clock_settings.Nsamples)
+        if self.live:
+            self.controller.stop()
+            self.controller.start()
+        return 0  # mandatory for the NIDAQmx callback
+
+    def emit_pulses(self, data):
+        """Analyze the pulses of a block of samples, only the pulse height histogram and the statistics of the pulses
+        being emitted"""
+        self.analyzer.update(np.atleast_2d(np.array(data)))
+        self.dte_signal.emit(DataToExport(name='NIDAQmx', data=[self.analyzer.to_dwa('NI Pulse heights'),
+                                                                self.analyzer.statistics_dwa('NI Pulse statistics')]))
+
+    def emit_events(self, data, labels):
+        """Feed the event detector with a block of samples, only the complete captures being emitted, each one on its
+        own with the time of its event as timestamp"""
+        for capture in self.detector.update(np.atleast_2d(np.array(data))):
+            dwa = self.detector.to_dwa(capture, name='NI Analog Input event', labels=labels)
+            dwa.timestamp = self.start_time + float(capture[0])
+            self.dte_signal.emit(DataToExport(name='NIDAQmx', data=[dwa]))
+
+    def emit_digital(self, Nsamples=None):
+        """Emit the uint32 words read from the digital input task (one per channel and sample, bit i being line i
+        of a port channel): the block of Nsamples samples (nsamplestoread if None) with their time axis for the
+        sample clock timing, or the list of the changes read with their time stamps for the change detection.
+        Displayed as 0D, only the last state of each channel is emitted."""
+        channels_names = [ch.name for ch in self.channels]
+        if self.change_detection():
+            words = self.controller.readDigital(timeout=20.0)
+            if words.shape[1] == 0:
+                return
+            if self.timestamp_buffer.size < words.shape[1]:
+                self.timestamp_buffer = np.zeros((words.shape[1],), dtype=np.uint32)
+            read = self.timestamps.readCounterBuffer(self.timestamp_buffer, words.shape[1], timeout=1.)
+            times = self.timestamp_stream.update(self.timestamp_buffer[:read])
+            words = words[:, :times.size]
+            name = 'NI Digital Input changes'
+        else:
+            if Nsamples is None:
+                Nsamples = self.settings['nsamplestoread']
+            words = self.controller.readDigital(Nsamples, timeout=20.0)
+            times = (self.di_samples_read + np.arange(words.shape[1])) / self.clock_settings.frequency
+            self.di_samples_read += words.shape[1]
+            name = 'NI Digital Input'
+        if self.control_type == "0D" and self.settings.child("display").value() == '0D':
+            dwa = DataFromPlugins(name=name, data=[words[ind, -1:].copy() for ind in range(words.shape[0])],
+                                  dim='Data0D', labels=channels_names)
+        else:
+            dwa = DataFromPlugins(name=name, data=[words[ind].copy() for ind in range(words.shape[0])],
+                                  dim='Data1D', labels=channels_names,
+                                  axes=[Axis('Time', units='s', data=times, index=0)])
+        self.dte_signal.emit(self.process_data(DataToExport(name='NIDAQmx', data=[dwa])))
+
+    def process_data(self, dte: DataToExport) -> DataToExport:
+        """Processing stage applied on the data of each read block before their emission, to be subclassed"""
+        return dte
+
     def counter_done(self):
         channels_name = [ch.name for ch in self.channels]
         data_counter = self.readCounter(len(self.channels),
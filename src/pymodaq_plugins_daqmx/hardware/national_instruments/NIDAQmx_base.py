@@ -1,3 +1,4 @@
+import numpy as np
 from qtpy import QtWidgets
 from qtpy.QtCore import Signal
 from pymodaq.utils.logger import set_logger, get_module_name
@@ -5,7 +6,10 @@ from pymodaq.utils.parameter import Parameter
 from pymodaq.utils.parameter.pymodaq_ptypes import registerParameterType, GroupParameter
 from pymodaq_plugins_daqmx.hardware.national_instruments.daqmxni import NIDAQmx, Edge, ChannelType, ClockSettings, \
     AIChannel, AIThermoChannel, AOChannel, CIChannel, COChannel, DOChannel, DIChannel, UsageTypeAI, UsageTypeAO, \
-    ThermocoupleType, TerminalConfiguration, TriggerSettings
+    ThermocoupleType, TerminalConfiguration, TriggerSettings, UsageTypeCI, CIFrequencyChannel, CIPeriodChannel, \
+    CounterFrequencyMethod, CIEncoderChannel, EncoderType, ChangeDetectionSettings, LineGrouping, CITimestampChannel, \
+    COPulseChannel, UsageTypeCO, Level
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import TimeTagStream, load_pulse_table
 
 
 logger = set_logger(get_module_name(__file__))
@@ -176,6 +180,77 @@ class ScalableGroupCounter(GroupParameter):
 registerParameterType('groupcounter', ScalableGroupCounter, override=True)
 
 
+class ScalableGroupCI(ScalableGroupCounter):
+    """
+        Counter input channels, counting edges or measuring the frequency/period of their input signal
+
+        See Also
+        --------
+        ScalableGroupCounter
+    """
+
+    params = ScalableGroupCounter.params + [
+        {'title': 'CI type:', 'name': 'ci_type', 'type': 'list',
+         'limits': [Uci.name for Uci in [UsageTypeCI.COUNT_EDGES, UsageTypeCI.FREQUENCY, UsageTypeCI.PERIOD,
+                                         UsageTypeCI.POSITION_LINEAR_ENCODER,
+                                         UsageTypeCI.POSITION_ANGULAR_ENCODER]]},
+        {'title': 'Frequency/Period:', 'name': 'freq_settings', 'type': 'group', 'visible': False, 'children': [
+            {'title': 'Min (Hz or s):', 'name': 'value_min', 'type': 'float', 'value': 2.},
+            {'title': 'Max (Hz or s):', 'name': 'value_max', 'type': 'float', 'value': 100.},
+            {'title': 'Method:', 'name': 'meas_method', 'type': 'list',
+             'limits': [method.name for method in CounterFrequencyMethod]},
+        ]},
+        {'title': 'Encoder:', 'name': 'encoder_settings', 'type': 'group', 'visible': False, 'children': [
+            {'title': 'Decoding:', 'name': 'decoding_type', 'type': 'list',
+             'limits': [Enc.name for Enc in EncoderType], 'value': EncoderType.X_4.name},
+            {'title': 'Distance per pulse (m):', 'name': 'dist_per_pulse', 'type': 'float', 'value': 1e-6},
+            {'title': 'Pulses per revolution:', 'name': 'pulses_per_rev', 'type': 'int', 'value': 1000, 'min': 1},
+        ]},
+    ]
+
+    def __init__(self, **opts):
+        super().__init__(**opts)
+        self.opts['type'] = 'groupci'
+
+
+registerParameterType('groupci', ScalableGroupCI, override=True)
+
+
+class ScalableGroupCO(ScalableGroupCounter):
+    """
+        Counter output channels, generating pulse trains defined by their frequency and duty cycle or by their high
+        and low durations in ticks of a timebase
+
+        See Also
+        --------
+        ScalableGroupCounter
+    """
+
+    params = [
+        {'title': 'CO type:', 'name': 'co_type', 'type': 'list',
+         'limits': [Uco.name for Uco in [UsageTypeCO.PULSE_FREQUENCY, UsageTypeCO.PULSE_TICKS]]},
+        {'title': 'Idle state:', 'name': 'idle_state', 'type': 'list', 'limits': [Level.LOW.name, Level.HIGH.name]},
+        {'title': 'Initial delay (s or ticks):', 'name': 'initial_delay', 'type': 'float', 'value': 0., 'min': 0.},
+        {'title': 'Frequency:', 'name': 'freq_settings', 'type': 'group', 'children': [
+            {'title': 'Frequency:', 'name': 'frequency', 'type': 'float', 'value': 1000., 'min': 0., 'suffix': 'Hz'},
+            {'title': 'Duty cycle:', 'name': 'duty_cycle', 'type': 'float', 'value': 0.5, 'min': 0., 'max': 1.},
+        ]},
+        {'title': 'Ticks:', 'name': 'ticks_settings', 'type': 'group', 'visible': False, 'children': [
+            {'title': 'Timebase:', 'name': 'timebase', 'type': 'list',
+             'limits': ['100MHzTimebase', '80MHzTimebase', '20MHzTimebase']},
+            {'title': 'High ticks:', 'name': 'high_ticks', 'type': 'int', 'value': 100, 'min': 2},
+            {'title': 'Low ticks:', 'name': 'low_ticks', 'type': 'int', 'value': 100, 'min': 2},
+        ]},
+    ]
+
+    def __init__(self, **opts):
+        super().__init__(**opts)
+        self.opts['type'] = 'groupco'
+
+
+registerParameterType('groupco', ScalableGroupCO, override=True)
+
+
 class ScalableGroupDI(GroupParameter):
     """
     """
@@ -284,21 +359,43 @@ class DAQ_NIDAQmx_base:
                'limits': NIDAQmx.get_NIDAQ_channels(source_type=ChannelType.DIGITAL_OUTPUT)},
               {'title': 'DI Channels:', 'name': 'di_channels', 'type': 'groupdi',
                'limits': NIDAQmx.get_NIDAQ_channels(source_type=ChannelType.DIGITAL_INPUT)},
+              {'title': 'DI Settings:', 'name': 'di_settings', 'type': 'group', 'visible': False, 'children': [
+                  {'title': 'Line grouping:', 'name': 'grouping', 'type': 'list',
+                   'limits': [grouping.name for grouping in LineGrouping]},
+                  {'title': 'Timing:', 'name': 'timing', 'type': 'list',
+                   'limits': ['Sample clock', 'Change detection']},
+                  {'title': 'Time stamp counter:', 'name': 'timestamp_counter', 'type': 'list', 'visible': False,
+                   'limits': NIDAQmx.get_NIDAQ_channels(source_type=ChannelType.COUNTER_INPUT)},
+                  {'title': 'Timebase:', 'name': 'timebase', 'type': 'list', 'visible': False,
+                   'limits': ['100MHzTimebase', '80MHzTimebase', '20MHzTimebase']},
+              ]},
               {'title': 'Counter Settings:', 'name': 'counter_settings', 'type': 'group', 'visible': True, 'children': [
                   {'title': 'Counting time (ms):', 'name': 'counting_time', 'type': 'float', 'value': 100.,
                    'default': 100., 'min': 0.},
-                  {'title': 'CI Channels:', 'name': 'ci_channels', 'type': 'groupcounter',
+                  {'title': 'Sample clock:', 'name': 'sample_clock', 'type': 'list',
+                   'limits': ['Implicit'] + NIDAQmx.getTriggeringSources()},
+                  {'title': 'CI Channels:', 'name': 'ci_channels', 'type': 'groupci',
                    'limits': NIDAQmx.get_NIDAQ_channels(source_type=ChannelType.COUNTER_INPUT)},
-                  {'title': 'CO Channels:', 'name': 'co_channels', 'type': 'groupcounter',
+                  {'title': 'CO Channels:', 'name': 'co_channels', 'type': 'groupco',
                    'limits': NIDAQmx.get_NIDAQ_channels(source_type=ChannelType.COUNTER_OUTPUT)},
+                  {'title': 'Pulse table:', 'name': 'pulse_table', 'type': 'group', 'visible': False, 'children': [
+                      {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+                      {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True},
+                  ]},
               ]},
               {'title': 'Trigger Settings:', 'name': 'trigger_settings', 'type': 'group', 'visible': True, 'children': [
                   {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False, },
+                  {'title': 'Trigger type:', 'name': 'trigger_type', 'type': 'list',
+                   'limits': TriggerSettings.trigger_types},
                   {'title': 'Trigger Source:', 'name': 'trigger_channel', 'type': 'list',
                    'limits': NIDAQmx.getTriggeringSources()},
-                  {'title': 'Edge type:', 'name': 'edge', 'type': 'list', 'limits': [e.name for e in Edge],
-                   'visible': False},
-                  {'title': 'Level:', 'name': 'level', 'type': 'float', 'value': 1., 'visible': False}
+                  {'title': 'Edge type:', 'name': 'edge', 'type': 'list', 'limits': [e.name for e in Edge]},
+                  {'title': 'Level:', 'name': 'level', 'type': 'float', 'value': 1., 'visible': False},
+                  {'title': 'Pretrigger samples:', 'name': 'pretrigger_samples', 'type': 'int', 'value': 100,
+                   'min': 2, 'visible': False},
+                  {'title': 'Acquire when:', 'name': 'gate', 'type': 'list', 'visible': False,
+                   'limits': TriggerSettings.digital_gates},
+                  {'title': 'Window top:', 'name': 'window_top', 'type': 'float', 'value': 2., 'visible': False},
               ]}
               ]
 
@@ -310,6 +407,10 @@ class DAQ_NIDAQmx_base:
         self.clock_settings = None
         self.trigger_settings = None
         self.live = False
+        self.timestamps = None  # counter task time stamping the changes detected on the digital inputs
+        self.timestamp_stream = TimeTagStream()
+        self.timestamp_buffer = np.zeros((0,), dtype=np.uint32)
+        self.pulses = None  # pulse table written on the counter output task, one sample per pulse
 
     def commit_settings(self, param: Parameter):
         """
@@ -348,19 +449,23 @@ class DAQ_NIDAQmx_base:
                 self.settings.child('di_channels').hide()
 
             elif param.value() == ChannelType.COUNTER_INPUT.name:  # counter input
-                self.settings.child('clock_settings').hide()
+                # frequency/period channels are buffered, one sample per period of their input signal
+                self.settings.child('clock_settings').show()
                 self.settings.child('ai_channels').hide()
                 self.settings.child('ao_channels').hide()
                 self.settings.child('ao_settings').hide()
+                self.settings.child('counter_settings').show()
                 self.settings.child('counter_settings', 'ci_channels').show()
                 self.settings.child('do_channels').hide()
                 self.settings.child('di_channels').hide()
 
             elif param.value() == ChannelType.COUNTER_OUTPUT.name:  # counter output
-                self.settings.child('clock_settings').hide()
+                # Nsamples pulses (a finite train) or a continuous one, the frequency of the clock is not used
+                self.settings.child('clock_settings').show()
                 self.settings.child('ai_channels').hide()
                 self.settings.child('ao_channels').hide()
                 self.settings.child('ao_settings').hide()
+                self.settings.child('counter_settings').show()
                 self.settings.child('counter_settings', 'co_channels').show()
                 self.settings.child('do_channels').hide()
                 self.settings.child('di_channels').hide()
@@ -368,8 +473,8 @@ class DAQ_NIDAQmx_base:
             elif param.value() == ChannelType.DIGITAL_INPUT.name:  # Digital_Input
                 self.settings.child('clock_settings').show()
                 self.settings.child('ai_channels').hide()
-                self.settings.child('ao_channels').show()
-                self.settings.child('ao_settings').show()
+                self.settings.child('ao_channels').hide()
+                self.settings.child('ao_settings').hide()
                 self.settings.child('counter_settings').hide()
                 self.settings.child('do_channels').hide()
                 self.settings.child('di_channels').show()
@@ -382,6 +487,12 @@ class DAQ_NIDAQmx_base:
                 self.settings.child('counter_settings').hide()
                 self.settings.child('do_channels').show()
                 self.settings.child('di_channels').hide()
+            self.settings.child('di_settings').show(param.value() == ChannelType.DIGITAL_INPUT.name)
+            self.update_trigger_settings()
+            self.settings.child('counter_settings', 'ci_channels').show(param.value() == ChannelType.COUNTER_INPUT.name)
+            self.settings.child('counter_settings', 'co_channels').show(param.value() == ChannelType.COUNTER_OUTPUT.name)
+            self.settings.child('counter_settings', 'pulse_table').show(
+                param.value() == ChannelType.COUNTER_OUTPUT.name)
 
         elif param.name() == 'refresh_hardware':
             if param.value():
@@ -394,26 +505,142 @@ class DAQ_NIDAQmx_base:
             param.parent().child('current_settings').show(param.value() == UsageTypeAI.CURRENT.name)
             param.parent().child('thermoc_settings').show(param.value() == UsageTypeAI.TEMPERATURE_THERMOCOUPLE.name)
 
+        elif param.name() == 'ci_type':
+            param.parent().child('freq_settings').show(param.value() in [UsageTypeCI.FREQUENCY.name,
+                                                                         UsageTypeCI.PERIOD.name])
+            param.parent().child('encoder_settings').show('ENCODER' in param.value())
+            if param.value() in [UsageTypeCI.FREQUENCY.name, UsageTypeCI.PERIOD.name]:
+                # sensible default range, in Hz for the frequency and in s for the period
+                frequency = param.value() == UsageTypeCI.FREQUENCY.name
+                param.parent().child('freq_settings', 'value_min').setValue(2. if frequency else 1e-6)
+                param.parent().child('freq_settings', 'value_max').setValue(100. if frequency else 0.1)
+
+        elif param.name() == 'co_type':
+            param.parent().child('freq_settings').show(param.value() == UsageTypeCO.PULSE_FREQUENCY.name)
+            param.parent().child('ticks_settings').show(param.value() == UsageTypeCO.PULSE_TICKS.name)
+
         elif param.name() == 'ao_type':
             param.parent().child('voltage_settings').show(param.value() == UsageTypeAI.VOLTAGE.name)
             param.parent().child('current_settings').show(param.value() == UsageTypeAI.CURRENT.name)
 
-        elif param.name() == 'trigger_channel':
-            param.parent().child('level').show('PF' not in param.opts['title'])
+        elif param.name() in ['trigger_channel', 'trigger_type', 'gate']:
+            self.update_trigger_settings()
+
+        elif param.name() == 'grouping':
+            # the channels are either lines or whole ports, read as uint32 words
+            self.settings.child('di_channels').clearChildren()
+            if param.value() == LineGrouping.CHAN_FOR_ALL_LINES.name:
+                self.settings.child('di_channels').setOpts(
+                    addList=self.controller.get_NIDAQ_ports(source_type=ChannelType.DIGITAL_INPUT))
+            else:
+                self.settings.child('di_channels').setOpts(
+                    addList=self.controller.get_NIDAQ_channels(source_type=ChannelType.DIGITAL_INPUT))
+
+        elif param.name() == 'timing':
+            self.settings.child('di_settings', 'timestamp_counter').show(param.value() == 'Change detection')
+            self.settings.child('di_settings', 'timebase').show(param.value() == 'Change detection')
+
+    def update_trigger_settings(self):
+        """Show the trigger settings relevant for the type of the trigger and of its source (digital or analog)"""
+        trigger = self.settings.child('trigger_settings')
+        digital = 'PF' in trigger['trigger_channel']
+        pause = trigger['trigger_type'] == 'Pause'
+        gates = TriggerSettings.digital_gates if digital else TriggerSettings.analog_gates
+        if trigger['gate'] not in gates:
+            trigger.child('gate').setLimits(gates)
+            trigger.child('gate').setValue(gates[0])
+        trigger.child('edge').show(not pause)
+        trigger.child('level').show(not digital)
+        trigger.child('pretrigger_samples').show(trigger['trigger_type'] == 'Reference')
+        trigger.child('gate').show(pause)
+        trigger.child('window_top').show(pause and 'window' in trigger['gate'])
 
     def update_task(self):
         self.channels = self.get_channels_from_settings()
-        self.clock_settings = ClockSettings(frequency=self.settings['clock_settings', 'frequency'],
-                                            Nsamples=self.settings['clock_settings', 'Nsamples'],
-                                            edge=Edge.RISING,
-                                            repetition=self.live, )
+        source = None
+        if self.settings['NIDAQ_type'] == ChannelType.COUNTER_INPUT.name and \
+                self.settings['counter_settings', 'sample_clock'] != 'Implicit':
+            # counters have no sample clock of their own, encoders have to be sampled on an external one
+            source = self.settings['counter_settings', 'sample_clock']
+        if self.change_detection():
+            # a sample on each edge of the DI channels instead of a sample clock
+            names = ','.join([channel.name for channel in self.channels])
+            self.clock_settings = ChangeDetectionSettings(Nsamples=self.settings['clock_settings', 'Nsamples'],
+                                                          rising_channel=names, falling_channel=names,
+                                                          repetition=self.live)
+            self.update_timestamps()
+        elif self.settings['NIDAQ_type'] == ChannelType.COUNTER_OUTPUT.name:
+            # implicit timing: Nsamples pulses (the whole table if any), repeated if continuous
+            self.pulses = self.get_pulse_table()
+            self.clock_settings = ClockSettings(Nsamples=self.settings['clock_settings', 'Nsamples']
+                                                if self.pulses is None else self.pulses[0].size,
+                                                repetition=self.settings['clock_settings', 'repetition'])
+        else:
+            self.clock_settings = ClockSettings(source=source,
+                                                frequency=self.settings['clock_settings', 'frequency'],
+                                                Nsamples=self.settings['clock_settings', 'Nsamples'],
+                                                edge=Edge.RISING,
+                                                repetition=self.live and not self.reference_triggered(), )
         self.trigger_settings = \
             TriggerSettings(trig_source=self.settings['trigger_settings', 'trigger_channel'],
                             enable=self.settings['trigger_settings', 'enable'],
                             edge=Edge[self.settings['trigger_settings', 'edge']],
-                            level=self.settings['trigger_settings', 'level'], )
+                            level=self.settings['trigger_settings', 'level'],
+                            trigger_type=self.settings['trigger_settings', 'trigger_type'],
+                            pretrigger_samples=self.settings['trigger_settings', 'pretrigger_samples'],
+                            gate=self.settings['trigger_settings', 'gate'],
+                            window_top=self.settings['trigger_settings', 'window_top'], )
         if self.channels:
             self.controller.update_task(self.channels, self.clock_settings, trigger_settings=self.trigger_settings)
+            if self.pulses is not None:
+                self.write_pulses(*self.pulses)
+
+    def get_pulse_table(self):
+        """Load the pulse table of the counter output, (frequencies, duty cycles) or (high ticks, low ticks)
+        depending on the type of the channel, None if disabled"""
+        if not self.settings['counter_settings', 'pulse_table', 'enable']:
+            return None
+        if len(self.settings.child('counter_settings', 'co_channels').children()) != 1:
+            raise ValueError('A pulse table can only be generated by a single counter output')
+        first, second = load_pulse_table(self.settings['counter_settings', 'pulse_table', 'path'])
+        if first.size < 2:
+            raise ValueError('A pulse table should define at least two pulses')
+        return first, second
+
+    def write_pulses(self, first, second, autostart=False):
+        """Write pulses on the counter output task in a single call, (frequencies, duty cycles) or (high ticks, low
+        ticks) depending on the type of the channel, buffered if the task is implicitly timed"""
+        channel = self.channels[0]
+        if channel.counter_type == UsageTypeCO.PULSE_TICKS:
+            self.controller.writeCounterTicks(first, second, autostart=autostart)
+        else:
+            self.controller.writeCounterFrequency(first, second, autostart=autostart)
+
+    def reference_triggered(self):
+        """Finite acquisitions of Nsamples around a reference trigger, re-armed after each of them in live mode"""
+        return self.settings['trigger_settings', 'enable'] and \
+            self.settings['trigger_settings', 'trigger_type'] == 'Reference'
+
+    def change_detection(self):
+        return self.settings['NIDAQ_type'] == ChannelType.DIGITAL_INPUT.name and \
+            self.settings['di_settings', 'timing'] == 'Change detection'
+
+    def update_timestamps(self):
+        """Set up the counter task counting the edges of the timebase, latched on each change detected by the DI
+        task (its ChangeDetectionEvent being the sample clock of the counter), the time stamps of the changes"""
+        if self.timestamps is None:
+            self.timestamps = NIDAQmx()
+        counter = self.settings['di_settings', 'timestamp_counter']
+        timebase = self.settings['di_settings', 'timebase']
+        timebase_frequency = float(timebase.split('MHz')[0]) * 1e6
+        self.timestamps.update_task([CITimestampChannel(name=counter, source=ChannelType.COUNTER_INPUT,
+                                                        timebase=f"/{counter.split('/')[0]}/{timebase}",
+                                                        timebase_frequency=timebase_frequency)],
+                                    ClockSettings(source=f"/{self.settings['devices']}/ChangeDetectionEvent",
+                                                  frequency=timebase_frequency,
+                                                  Nsamples=self.settings['clock_settings', 'Nsamples'],
+                                                  repetition=True))
+        self.timestamp_stream = TimeTagStream(timebase_frequency, length=self.settings['clock_settings', 'Nsamples'])
 
     def get_channels_from_settings(self):
         channels = []
@@ -454,20 +681,46 @@ class DAQ_NIDAQmx_base:
         elif self.settings['NIDAQ_type'] == ChannelType.COUNTER_INPUT.name:  # counter input
             source = ChannelType.COUNTER_INPUT
             for channel in self.settings.child('counter_settings', 'ci_channels').children():
-                channels.append(CIChannel(name=channel.opts['title'],
-                                          source=source, edge=Edge[channel['edge']]))
+                counter_type = UsageTypeCI[channel['ci_type']]
+                if counter_type == UsageTypeCI.COUNT_EDGES:
+                    channels.append(CIChannel(name=channel.opts['title'],
+                                              source=source, edge=Edge[channel['edge']]))
+                elif counter_type in [UsageTypeCI.POSITION_LINEAR_ENCODER, UsageTypeCI.POSITION_ANGULAR_ENCODER]:
+                    channels.append(CIEncoderChannel(name=channel.opts['title'],
+                                                     source=source, counter_type=counter_type,
+                                                     decoding_type=EncoderType[
+                                                         channel['encoder_settings', 'decoding_type']],
+                                                     dist_per_pulse=channel['encoder_settings', 'dist_per_pulse'],
+                                                     pulses_per_rev=channel['encoder_settings', 'pulses_per_rev']))
+                else:
+                    channel_class = CIFrequencyChannel if counter_type == UsageTypeCI.FREQUENCY else CIPeriodChannel
+                    channels.append(channel_class(name=channel.opts['title'],
+                                                  source=source, edge=Edge[channel['edge']],
+                                                  value_min=channel['freq_settings', 'value_min'],
+                                                  value_max=channel['freq_settings', 'value_max'],
+                                                  meas_method=CounterFrequencyMethod[
+                                                      channel['freq_settings', 'meas_method']]))
 
         elif self.settings['NIDAQ_type'] == ChannelType.COUNTER_OUTPUT.name:  # counter output
             source = ChannelType.COUNTER_OUTPUT
             for channel in self.settings.child('counter_settings', 'co_channels').children():
-                channels.append(COChannel(name=channel.opts['title'],
-                                          source=source, edge=Edge[channel['edge']]))
+                channels.append(COPulseChannel(name=channel.opts['title'], source=source,
+                                               counter_type=UsageTypeCO[channel['co_type']],
+                                               frequency=channel['freq_settings', 'frequency'],
+                                               duty_cycle=channel['freq_settings', 'duty_cycle'],
+                                               high_ticks=channel['ticks_settings', 'high_ticks'],
+                                               low_ticks=channel['ticks_settings', 'low_ticks'],
+                                               timebase=f"/{channel.opts['title'].split('/')[0]}/"
+                                                        f"{channel['ticks_settings', 'timebase']}",
+                                               idle_state=Level[channel['idle_state']],
+                                               initial_delay=channel['initial_delay']))
 
         elif self.settings['NIDAQ_type'] == ChannelType.DIGITAL_INPUT.name:  # digital input
             source = ChannelType.DIGITAL_INPUT
             for channel in self.settings.child('di_channels').children():
                 channels.append(DIChannel(name=channel.opts['title'],
-                                          source=source))
+                                          source=source,
+                                          line_grouping=LineGrouping[self.settings['di_settings', 'grouping']]))
 
         elif self.settings['NIDAQ_type'] == ChannelType.DIGITAL_OUTPUT.name:  # Digital output
             source = ChannelType.DIGITAL_OUTPUT
@@ -485,6 +738,8 @@ class DAQ_NIDAQmx_base:
             self.timer.stop()
         QtWidgets.QApplication.processEvents()
         self.controller.stop()
+        if self.timestamps is not None:
+            self.timestamps.stop()
 
 
 
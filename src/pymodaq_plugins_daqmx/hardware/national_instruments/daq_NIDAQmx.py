@@ -1,5 +1,6 @@
 from qtpy import QtWidgets, QtCore
 from qtpy.QtCore import Signal, QThread
+import threading
 from pymodaq.utils.daq_utils import ThreadCommand, getLineInfo
 from pymodaq.utils.data import DataFromPlugins, Axis, DataActuator, DataToExport
 import numpy as np
@@ -13,8 +14,10 @@ from pymodaq.control_modules.move_utility_classes import comon_parameters_fun as
 from pymodaq.utils.parameter import Parameter
 from pymodaq.utils.parameter.pymodaq_ptypes import registerParameterType, GroupParameter
 
+from .daqmx_processing import WaveformGenerator, WaveformLibrary, load_digital_pattern
 from .daqmx import DAQmx, DAQ_analog_types, DAQ_thermocouples, DAQ_termination, Edge, DAQ_NIDAQ_source, \
-    ClockSettings, AIChannel, Counter, AIThermoChannel, AOChannel, TriggerSettings, DOChannel, DIChannel
+    ClockSettings, AIChannel, Counter, AIThermoChannel, AOChannel, TriggerSettings, DOChannel, DIChannel, ClockCounter, \
+    DigitalGrouping
 
 
 class ScalableGroupAI(GroupParameter):
@@ -246,7 +249,8 @@ class DAQ_NIDAQmx_base(DAQmx):
     params =[{'title': 'Refresh hardware:', 'name': 'refresh_hardware', 'type': 'bool', 'value': False},
             {'title': 'Signal type:', 'name': 'NIDAQ_type', 'type': 'list', 'limits': DAQ_NIDAQ_source.names()},
              {'title': 'AO Settings:', 'name': 'ao_settings', 'type': 'group', 'children': [
-                 {'title': 'Waveform:', 'name': 'waveform', 'type': 'list', 'value': 'DC', 'limits': ['DC', 'Sinus', 'Ramp']},
+                 {'title': 'Waveform:', 'name': 'waveform', 'type': 'list', 'value': 'DC',
+                  'limits': ['DC'] + WaveformLibrary.shapes},
 
                  {'title': 'Controlled param:', 'name': 'cont_param', 'type': 'list', 'value': 'offset',
                   'limits': ['offset', 'amplitude', 'frequency']},
@@ -254,7 +258,18 @@ class DAQ_NIDAQmx_base(DAQmx):
                      {'title': 'Offset:', 'name': 'offset', 'type': 'float', 'value': 0., },
                      {'title': 'Amplitude:', 'name': 'amplitude', 'type': 'float', 'value': 1., },
                      {'title': 'Frequency:', 'name': 'frequency', 'type': 'float', 'value': 10., },
+                     {'title': 'Stop frequency:', 'name': 'stop_frequency', 'type': 'float', 'value': 100.,
+                      'visible': False},
+                     {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True,
+                      'visible': False},
                     ]},
+                 {'title': 'Streaming:', 'name': 'streaming', 'type': 'group', 'visible': False, 'children': [
+                     {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+                     {'title': 'Write ahead (ms):', 'name': 'write_ahead', 'type': 'float', 'value': 100.,
+                      'min': 1.},
+                     {'title': 'Apply changes at:', 'name': 'apply_at', 'type': 'list',
+                      'limits': WaveformGenerator.apply_modes},
+                 ]},
              ]},
             {'title': 'Clock Settings:', 'name': 'clock_settings', 'type': 'group', 'children': [
                 {'title': 'Nsamples:', 'name': 'Nsamples', 'type': 'int', 'value': 1000, 'default': 1000, 'min': 1},
@@ -271,6 +286,13 @@ class DAQ_NIDAQmx_base(DAQmx):
                 'limits': DAQmx.get_NIDAQ_channels(source_type='Digital_Output')},
              {'title': 'DI Channels:', 'name': 'di_channels', 'type': 'groupdi',
               'limits': DAQmx.get_NIDAQ_channels(source_type='Digital_Input')},
+            {'title': 'Digital Settings:', 'name': 'digital_settings', 'type': 'group', 'visible': False, 'children': [
+                {'title': 'Line grouping:', 'name': 'grouping', 'type': 'list', 'limits': DigitalGrouping.names()},
+                {'title': 'Pattern:', 'name': 'pattern', 'type': 'group', 'visible': False, 'children': [
+                    {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+                    {'title': 'File:', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True},
+                ]},
+            ]},
             {'title': 'Counter Settings:', 'name': 'counter_settings', 'type': 'group', 'visible': True, 'children': [
                 {'title': 'Counting time (ms):', 'name': 'counting_time', 'type': 'float', 'value': 100.,
                 'default': 100., 'min': 0.},
@@ -359,6 +381,10 @@ class DAQ_NIDAQmx_base(DAQmx):
                 self.settings.child('counter_settings').hide()
                 self.settings.child('do_channels').hide()
                 self.settings.child('di_channels').show()
+            self.settings.child('digital_settings').show(param.value() in [DAQ_NIDAQ_source(3).name,
+                                                                           DAQ_NIDAQ_source(4).name])
+            self.settings.child('digital_settings', 'pattern').show(
+                param.value() == DAQ_NIDAQ_source(3).name and self.settings['digital_settings', 'grouping'] == 'Port')
             self.update_task()
 
         elif param.name() == 'refresh_hardware':
@@ -381,6 +407,18 @@ class DAQ_NIDAQmx_base(DAQmx):
         elif param.name() == 'trigger_channel':
             param.parent().child('level').show('PF' not in param.opts['title'])
 
+        elif param.name() == 'grouping':
+            # the channels are either lines or whole ports
+            for group, source in [('do_channels', 'Digital_Output'), ('di_channels', 'Digital_Input')]:
+                self.settings.child(group).clearChildren()
+                if param.value() == 'Port':
+                    self.settings.child(group).setOpts(addList=self.get_NIDAQ_ports(source_type=source))
+                else:
+                    self.settings.child(group).setOpts(addList=self.get_NIDAQ_channels(source_type=source))
+            self.settings.child('digital_settings', 'pattern').show(
+                param.value() == 'Port' and self.settings['NIDAQ_type'] == DAQ_NIDAQ_source(3).name)
+            self.update_task()
+
         else:
             self.update_task()
 
@@ -440,11 +478,13 @@ class DAQ_NIDAQmx_base(DAQmx):
         elif self.settings['NIDAQ_type'] == DAQ_NIDAQ_source(3).name:  # Digital output
             for channel in self.settings.child('do_channels').children():
                 channels.append(DOChannel(name=channel.opts['title'],
-                                          source='Digital_Output'))
+                                          source='Digital_Output',
+                                          grouping=self.settings['digital_settings', 'grouping']))
         elif self.settings['NIDAQ_type'] == DAQ_NIDAQ_source(4).name:  # digital input
             for channel in self.settings.child('di_channels').children():
                 channels.append(DIChannel(name=channel.opts['title'],
-                                          source='Digital_Input'))
+                                          source='Digital_Input',
+                                          grouping=self.settings['digital_settings', 'grouping']))
         return channels
 
     def stop(self):
@@ -631,6 +671,8 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
         =============== ==============
     """
     _controller_units = 'Volts'
+    waveform_done = Signal()  # emitted from the driver thread at the end of a waveform output
+    setpoint_generated = Signal(int)  # emitted from the driver thread with the number of setpoints output
     is_multiaxes = False  # set to True if this plugin is controlled for a multiaxis controller (with a unique communication link)
     stage_names = []  # "list of strings of the multiaxes
 
@@ -645,7 +687,21 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
                     'limits': ['Master', 'Slave']},
                    {'title': 'Axis:', 'name': 'axis', 'type': 'list', 'limits': stage_names},
 
-               ]}] + actuator_params
+               ]},
+              {'title': 'Setpoint table:', 'name': 'table', 'type': 'group', 'children': [
+                  {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+                  {'title': 'Start:', 'name': 'start', 'type': 'float', 'value': 0.},
+                  {'title': 'Stop:', 'name': 'stop', 'type': 'float', 'value': 1.},
+                  {'title': 'Npoints:', 'name': 'Npoints', 'type': 'int', 'value': 100, 'min': 2},
+                  {'title': 'File (optional):', 'name': 'path', 'type': 'browsepath', 'value': '', 'filetype': True},
+                  {'title': 'Step clock:', 'name': 'clock_source', 'type': 'list',
+                   'limits': ['Counter'] + DAQmx.getTriggeringSources()},
+                  {'title': 'Clock counter:', 'name': 'clock_counter', 'type': 'list',
+                   'limits': DAQmx.get_NIDAQ_channels(source_type='Counter')},
+                  {'title': 'Step time (ms):', 'name': 'step_time', 'type': 'float', 'value': 10., 'min': 0.},
+                  {'title': 'Current index:', 'name': 'index', 'type': 'int', 'value': 0, 'readonly': True},
+              ]},
+              ] + actuator_params
 
     def __init__(self, parent=None, params_state=None, control_type="Actuator"):
         DAQ_Move_base.__init__(self, parent, params_state)  # defines settings attribute and various other methods
@@ -655,6 +711,20 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
         self.settings.child('NIDAQ_type').setLimits(['Analog_Output', 'Digital_Output'])
 
         self.settings.child('clock_settings', 'Nsamples').setValue(1)
+        self.dc_running = False  # True when the DC output task is started with software timing
+        self.generator = None  # WaveformGenerator of the streamed waveform
+        self.waveforms = WaveformLibrary()
+        self.streaming = False
+        self.chunk_size = 100
+        self._writer = None
+        self.waveform_done.connect(self.waveform_move_done, QtCore.Qt.QueuedConnection)
+        self.setpoint_generated.connect(self.update_table_index, QtCore.Qt.QueuedConnection)
+        self.table = np.zeros((0,))  # setpoints of the table mode
+        self.table_index = 0  # number of setpoints output
+        self._setpoints_transferred = 0  # number of setpoints transferred to the device
+        self.table_target = 0  # index of the setpoint the current move waits for
+        self.table_running = False
+        self.step_clock = DAQmx()
 
     def get_actuator_value(self) -> DataActuator:
         """Get the current position from the hardware with scaling conversion.
@@ -665,7 +735,8 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
         """
 
         pos = self.target_position
-        ##
+        if self.table_running and self.table_index > 0:
+            pos = self.table[self.table_index - 1]
 
         pos = self.get_position_with_scaling(pos)
         self.emit_status(ThreadCommand('check_position', [pos]))
@@ -680,12 +751,36 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
 
         """
 
+        if param.parent() is not None and param.parent().name() == 'table':
+            if param.name() == 'enable' and not param.value():
+                # back to the normal task, the table task is clocked by the step clock
+                self.update_task()
+            elif param.name() != 'index' and self.table_running:
+                self.start_setpoint_table()
+            return
+        elif self.streaming and param.parent() is not None and param.parent().name() == 'waveform_settings' and \
+                param.name() in ['offset', 'amplitude', 'frequency']:
+            # phase continuous change of the streamed waveform, the task is kept running
+            self.generator.update(self.settings['ao_settings', 'streaming', 'apply_at'],
+                                  **{param.name(): param.value()})
+            return
+        elif param.parent() is not None and param.parent().name() == 'streaming':
+            if param.name() == 'enable' and not param.value():
+                # back to the normal (regenerated) task, the streamed one does not allow the regeneration
+                self.update_task()
+            return
+        elif param.parent() is not None and param.parent().name() == 'pattern':
+            self.stop()  # the pattern is (re)started by the next move
+            return
         DAQ_NIDAQmx_base.commit_settings(self, param)
         if param.name() == 'waveform':
             if param.value() == 'DC':
                 self.settings.child('ao_settings', 'cont_param').setValue('offset')
             self.settings.child('ao_settings', 'cont_param').show(not param.value() == 'DC')
             self.settings.child('ao_settings', 'waveform_settings').show(not param.value() == 'DC')
+            self.settings.child('ao_settings', 'streaming').show(param.value() in WaveformGenerator.waveforms)
+            self.settings.child('ao_settings', 'waveform_settings', 'stop_frequency').show(param.value() == 'Chirp')
+            self.settings.child('ao_settings', 'waveform_settings', 'path').show(param.value() == 'Arbitrary')
 
         if param.parent() is not None:
             if param.parent().name() == 'ao_channels':
@@ -745,24 +840,167 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
             return self.status
 
     def calulate_waveform(self, value):
+        """Compute the buffer of the waveform, from the memoized normalized waveforms of the library. For a repeated
+        output, a single period is computed (the waveform frequency is rounded such that a period is an integer
+        number of samples), to be regenerated. The returned buffer is reused by the next call."""
         waveform = self.settings['ao_settings', 'waveform']
         if waveform == 'DC':
-            values = np.array([value])
+            return np.array([value])
+        Nsamples = self.settings['clock_settings', 'Nsamples']
+        freq = self.settings['clock_settings', 'frequency']
+        freq0 = self.settings['ao_settings', 'waveform_settings', 'frequency']
+        repetition = self.settings['clock_settings', 'repetition']
+        if repetition and waveform != 'Chirp':
+            Nsamples = max(int(np.round(freq / freq0)), 2)
+            freq0 = freq / Nsamples
+        return self.waveforms.waveform(waveform, Nsamples,
+                                       amplitude=self.settings['ao_settings', 'waveform_settings', 'amplitude'],
+                                       offset=self.settings['ao_settings', 'waveform_settings', 'offset'],
+                                       frequency=freq0, sample_rate=freq, endpoint=not repetition,
+                                       stop_frequency=self.settings['ao_settings', 'waveform_settings',
+                                                                    'stop_frequency'],
+                                       path=str(self.settings['ao_settings', 'waveform_settings', 'path']))
+
+    def update_task(self):
+        self.stop_streaming()
+        self.stop_setpoint_table()
+        self.dc_running = False
+        self.live = self.settings['clock_settings', 'repetition']  # continuous output of the waveform
+        DAQ_NIDAQmx_base.update_task(self)
+
+    def stop(self):
+        self.stop_streaming()
+        self.stop_setpoint_table()
+        self.dc_running = False
+        DAQ_NIDAQmx_base.stop(self)
+
+    def get_setpoint_table(self):
+        """The setpoints loaded from the file (.npy or text) if any, equally spaced from start to stop otherwise"""
+        path = str(self.settings['table', 'path'])
+        if path not in ['', '.']:
+            return np.ravel(np.load(path) if path.endswith('.npy') else np.loadtxt(path)).astype(np.float64)
+        return np.linspace(self.settings['table', 'start'], self.settings['table', 'stop'],
+                           self.settings['table', 'Npoints'])
+
+    def start_setpoint_table(self):
+        """Upload the whole setpoint table into the AO buffer, each setpoint being output on an edge of the step
+        clock: a counter of the card (generating one pulse per setpoint, started once the output is armed) or an
+        external clock (PFI). The detectors can be triggered by the same clock. The number of setpoints output is
+        followed from the driver events, no software move is done: the samples are only transferred to the device
+        once its onboard memory is empty, so that a transferred setpoint means that the previous one has been output
+        (the last one on the done event)."""
+        self.stop()
+        self.table = self.get_setpoint_table()
+        Nsetpoints = self.table.size
+        frequency = 1e3 / self.settings['table', 'step_time']
+        if self.settings['table', 'clock_source'] == 'Counter':
+            source = '/' + self.settings['table', 'clock_counter'] + 'InternalOutput'
+            self.step_clock.update_task(channels=[ClockCounter(frequency, name=self.settings['table', 'clock_counter'],
+                                                               source='Counter')],
+                                        clock_settings=ClockSettings(Nsamples=1))
+            self.step_clock.set_implicit_timing(Nsetpoints)
         else:
-            Nsamples = self.settings['clock_settings', 'Nsamples']
-            freq = self.settings['clock_settings', 'frequency']
-            time = np.linspace(0, Nsamples / freq, Nsamples, endpoint=False)
+            source = self.settings['table', 'clock_source']
+        self.channels = self.get_channels_from_settings()
+        # the frequency is the maximum expected rate of the step clock
+        DAQmx.update_task(self, self.channels, ClockSettings(source=source, frequency=frequency,
+                                                             Nsamples=Nsetpoints, repetition=False),
+                          trigger_settings=TriggerSettings())
+        self.table_index = 0
+        self.table_target = 0
+        self.settings.child('table', 'index').setValue(0)
+        self.set_transfer_on_empty()
+        self._setpoints_transferred = 0
+        self.register_callback(self.setpoint_callback, 'Nsamples_generated', 1)
+        self.register_callback(self.setpoints_done_callback, 'done')
+        self.writeAnalog(Nsetpoints, len(self.channels), np.tile(self.table, len(self.channels)))
+        self.start()
+        self.table_running = True
+        if self.settings['table', 'clock_source'] == 'Counter':
+            self.step_clock.start()
+
+    def stop_setpoint_table(self):
+        if not self.table_running:
+            return
+        self.table_running = False
+        self.step_clock.close()
+        DAQmx.stop(self)
 
-            freq0 = self.settings['ao_settings', 'waveform_settings', 'frequency']
-            amp = self.settings['ao_settings', 'waveform_settings', 'amplitude']
-            offset = self.settings['ao_settings', 'waveform_settings', 'offset']
-            if waveform == 'Sinus':
-                values = offset + amp * np.sin(2*np.pi*freq0*time)
-            elif waveform == 'Ramp':
-                values = offset + amp * np.linspace(0, 1, Nsamples)
+    def setpoint_callback(self, taskhandle, event_type, Nsamples, callbackdata):
+        # called from a driver thread on each setpoint transferred to the device, once the previous one is output
+        self._setpoints_transferred += 1
+        if self._setpoints_transferred > 1:
+            self.table_index = self._setpoints_transferred - 1
+            self.setpoint_generated.emit(self.table_index)
+        return 0
 
-        return values
+    def setpoints_done_callback(self, taskhandle, status, callbackdata):
+        # called from a driver thread once the last setpoint has been output
+        self.table_index = self.table.size
+        self.setpoint_generated.emit(self.table_index)
+        return 0
 
+    def update_table_index(self, index):
+        self.settings.child('table', 'index').setValue(index)
+        if self.table_running and index > self.table_target:
+            self.current_position = self.check_position()
+            self.move_done()
+            self.table_target = self.table.size  # done only once per move
+
+    def start_streaming(self):
+        """Output the waveform continuously, regeneration being disabled: a write-ahead thread keeps the buffer
+        (four chunks of the write ahead duration) filled with the blocks computed by the WaveformGenerator"""
+        self.stop()
+        frequency = self.settings['clock_settings', 'frequency']
+        self.chunk_size = max(int(self.settings['ao_settings', 'streaming', 'write_ahead'] * 1e-3 * frequency / 4), 1)
+        self.generator = WaveformGenerator(self.settings['ao_settings', 'waveform'],
+                                           frequency=self.settings['ao_settings', 'waveform_settings', 'frequency'],
+                                           amplitude=self.settings['ao_settings', 'waveform_settings', 'amplitude'],
+                                           offset=self.settings['ao_settings', 'waveform_settings', 'offset'],
+                                           sample_rate=frequency)
+        self.channels = self.get_channels_from_settings()
+        DAQmx.update_task(self, self.channels,
+                          ClockSettings(frequency=frequency, Nsamples=4 * self.chunk_size, repetition=True),
+                          trigger_settings=self.trigger_settings)
+        self.set_regeneration(False)
+        for _ in range(2):  # prefill so that the generation does not underflow at start
+            self._write_chunk()
+        self.start()
+        self.streaming = True
+        self._writer = threading.Thread(target=self._write_ahead, daemon=True)
+        self._writer.start()
+
+    def stop_streaming(self):
+        if not self.streaming:
+            return
+        self.streaming = False
+        DAQmx.stop(self)  # unblocks a pending write
+        if self._writer is not None:
+            self._writer.join(1.)
+            self._writer = None
+
+    def _write_chunk(self):
+        values = self.generator.generate(self.chunk_size)
+        # blocks while the buffer is full, the same waveform is output on all the channels
+        self.writeAnalog(self.chunk_size, len(self.channels), np.tile(values, len(self.channels)))
+
+    def _write_ahead(self):
+        while self.streaming:
+            try:
+                self._write_chunk()
+            except Exception as e:
+                if self.streaming:
+                    self.emit_status(ThreadCommand('Update_Status', [f'AO streaming stopped: {e}', 'log']))
+                self.streaming = False
+
+    def start_dc_output(self):
+        """Start the AO task with software timing, committed once, so that DC values are written as scalars while
+        it runs, without stopping and restarting it for each move"""
+        DAQmx.stop(self)
+        self.set_on_demand()
+        self.commit()
+        self.start()
+        self.dc_running = True
 
     def move_Abs(self, position):
         """ Move the actuator to the absolute target defined by position
@@ -774,32 +1012,124 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
 
         position = self.check_bound(position)  # if user checked bounds, the defined bounds are applied here
         position = self.set_position_with_scaling(position)  # apply scaling if the user specified one
-        if self.settings['NIDAQ_type'] == 'Analog_Output':
+        self.target_position = position
+        if self.settings['table', 'enable'] and self.settings['NIDAQ_type'] == 'Analog_Output':
+            self.move_along_table(position)
+        elif self.settings['NIDAQ_type'] == 'Analog_Output':
+            self.write_waveform(position)
+        elif self.settings['NIDAQ_type'] == 'Digital_Output':
+            self.write_digital(position)
+
+    def move_along_table(self, position):
+        """In table mode, the move is done once the hardware clock has output the closest setpoint to position
+        (the output is started on the first move, and again for a new pass once the whole table has been output).
+        A setpoint already passed is done at once."""
+        target = int(np.argmin(np.abs(self.table - position))) if self.table_running else 0
+        if not self.table_running or (self.table_index >= self.table.size and target < self.table.size - 1):
+            self.start_setpoint_table()
+        self.table_target = int(np.argmin(np.abs(self.table - position)))
+        self.target_position = self.table[self.table_target]
+        if self.table_index > self.table_target:
+            self.table_target = self.table.size
+            self.current_position = self.check_position()
+            self.move_done()
+
+    def write_waveform(self, position):
+        """Output the waveform corresponding to position on the AO channel
+
+        A DC value is written on the running software timed task and the move is done at once (the settings are
+        not updated, they are not used for DC). In streaming mode, the controlled parameter of the streamed waveform
+        is changed without interrupting it. Other waveforms are output by restarting the task with the
+        controlled parameter set to position, the move being done on its done event. A repeated waveform is
+        regenerated from the onboard memory of the device when possible, the move is then done once started.
+        """
+        if self.settings['ao_settings', 'waveform'] == 'DC':
+            if not self.dc_running:
+                self.start_dc_output()
+            self.writeAnalog(1, 1, np.array([position], dtype=np.float64))
+            self.current_position = self.check_position()
+            self.move_done()
+        elif self.settings['ao_settings', 'streaming', 'enable'] and \
+                self.settings['ao_settings', 'waveform'] in WaveformGenerator.waveforms:
+            cont_param = self.settings['ao_settings', 'cont_param']
+            if self.streaming:
+                self.generator.update(self.settings['ao_settings', 'streaming', 'apply_at'], **{cont_param: position})
+            else:
+                self.settings.child('ao_settings', 'waveform_settings', cont_param).setValue(position)
+                self.start_streaming()
+            self.current_position = self.check_position()
+            self.move_done()
+        else:
             self.settings.child('ao_settings', 'waveform_settings',
                                  self.settings['ao_settings', 'cont_param']).setValue(position)
-            values = self.calulate_waveform(position)
-            self.target_position = position
-
+            try:
+                values = self.calulate_waveform(position)
+            except FileNotFoundError as e:  # Arbitrary waveform without a valid file, the output is left as is
+                self.emit_status(ThreadCommand('Update_Status', [f'Move skipped: {e}', 'log']))
+                self.current_position = self.check_position()
+                self.move_done()
+                return
             self.stop()
-
-            if len(values) == 1:
-                self.writeAnalog(len(values), 1, values, autostart=True)
+            periodic = self.settings['clock_settings', 'repetition']
+            if self.c_callback is None and not periodic:
+                self.register_callback(self.move_done_callback)
+            self.writeAnalog(len(values), 1, values, autostart=False, onboard_memory=periodic)
+            self.task.StartTask()
+            if periodic:  # no done event
                 self.current_position = self.check_position()
                 self.move_done()
-            else:
-                if self.c_callback is None:
-                    self.register_callback(self.move_done_callback)
-                self.writeAnalog(len(values), 1, values, autostart=False)
-                self.task.StartTask()
-        elif self.settings['NIDAQ_type'] == 'Digital_Output':
+
+    def write_digital(self, position):
+        """Output position on the DO channels
+
+        With the Port grouping, position is the uint32 word setting all the lines of each port at once, written on
+        the running software timed task, the move being done at once. If the pattern is enabled, the words of the
+        pattern file are output instead on the sample clock (frequency of the clock settings, once or regenerated
+        if repetition is checked, and triggered if the trigger is enabled), the move being done on its done event
+        (or once started if regenerated). With the Line grouping, position is written on the line.
+        """
+        if self.settings['digital_settings', 'grouping'] == 'Line':
             self.writeDigital(1, np.array([position], dtype=np.uint8), autostart=True)
+        elif self.settings['digital_settings', 'pattern', 'enable']:
+            self.start_pattern()
+        else:
+            if not self.dc_running:
+                self.start_dc_output()
+            self.writeDigitalPort(1, len(self.channels),
+                                  np.full((len(self.channels),), int(position), dtype=np.uint32))
+            self.current_position = self.check_position()
+            self.move_done()
+
+    def start_pattern(self):
+        """Upload the pattern into the buffer of the sample clocked DO task (the same pattern on every port) and
+        start it"""
+        words = load_digital_pattern(str(self.settings['digital_settings', 'pattern', 'path']))
+        if words.size == 1:  # a sample clocked task needs at least two samples
+            words = np.repeat(words, 2)
+        self.stop()
+        self.channels = self.get_channels_from_settings()
+        periodic = self.settings['clock_settings', 'repetition']
+        DAQmx.update_task(self, self.channels,
+                          ClockSettings(frequency=self.settings['clock_settings', 'frequency'], Nsamples=words.size,
+                                        repetition=periodic),
+                          trigger_settings=self.trigger_settings)
+        if not periodic:
+            self.register_callback(self.move_done_callback)
+        self.writeDigitalPort(words.size, len(self.channels), np.tile(words, len(self.channels)))
+        self.start()
+        if periodic:  # no done event
+            self.current_position = self.check_position()
+            self.move_done()
 
     def move_done_callback(self, taskhandle, status, callbackdata):
+        # called from a driver thread, the move done is handled in the plugin thread through a queued signal
+        self.waveform_done.emit()
+        return 0
+
+    def waveform_move_done(self):
         self.current_position = self.check_position()
-        QtWidgets.QApplication.processEvents()
         self.move_done()
         self.task.StopTask()
-        return 0
 
     def move_Rel(self, position):
         """ Move the actuator to the relative target actuator value defined by position
@@ -811,25 +1141,12 @@ class DAQ_NIDAQmx_Actuator(DAQ_Move_base, DAQ_NIDAQmx_base):
 
         position = self.check_bound(self.current_position + position) - self.current_position
         self.target_position = position + self.current_position
-        if self.settings['NIDAQ_type'] == 'Analog_Output':
-            self.settings.child('ao_settings', 'waveform_settings',
-                                 self.settings['ao_settings', 'cont_param']).setValue(self.target_position)
-
-            values = self.calulate_waveform(self.target_position)
-
-            self.stop()
-
-            if len(values) == 1:
-                self.writeAnalog(len(values), 1, values, autostart=True)
-                self.current_position = self.check_position()
-                self.move_done()
-            else:
-                if self.c_callback is None:
-                    self.register_callback(self.move_done_callback)
-                self.writeAnalog(len(values), 1, values, autostart=False)
-                self.task.StartTask()
+        if self.settings['table', 'enable'] and self.settings['NIDAQ_type'] == 'Analog_Output':
+            self.move_along_table(self.target_position)
+        elif self.settings['NIDAQ_type'] == 'Analog_Output':
+            self.write_waveform(self.target_position)
         elif self.settings['NIDAQ_type'] == 'Digital_Output':
-            self.writeDigital(1, np.array([self.target_position], dtype=np.uint8), autostart=True)
+            self.write_digital(self.target_position)
 
     def move_Home(self):
         """
@@ -102,6 +102,32 @@ class Edge(IntEnum):
         return [name for name, member in cls.__members__.items()]
 
 
+class Encoder_decoding(IntEnum):
+    """
+    """
+    X1 = PyDAQmx.DAQmx_Val_X1
+    X2 = PyDAQmx.DAQmx_Val_X2
+    X4 = PyDAQmx.DAQmx_Val_X4
+    TwoPulseCounting = PyDAQmx.DAQmx_Val_TwoPulseCounting
+
+    @classmethod
+    def names(cls):
+        return [name for name, member in cls.__members__.items()]
+
+
+class DigitalGrouping(IntEnum):
+    """
+    Line: one channel per digital line, written as one uint8 per line
+    Port: one channel for all the lines of a port, written as one uint32 word per sample (bit i is line i)
+    """
+    Line = PyDAQmx.DAQmx_Val_ChanPerLine
+    Port = PyDAQmx.DAQmx_Val_ChanForAllLines
+
+    @classmethod
+    def names(cls):
+        return [name for name, member in cls.__members__.items()]
+
+
 class ClockMode(IntEnum):
     """
     """
@@ -207,6 +233,39 @@ class ClockCounter(Counter):
         self.counter_type = "Clock Output"
 
         
+class TimeTagCounter(Counter):
+    def __init__(self, timebase='/Dev1/100MHzTimebase', timebase_frequency=100e6, arm_source='', **kwargs):
+        """Counter counting the edges of a timebase, its value is latched on each edge of the sample clock
+        (the events to be time stamped)
+
+        arm_source: terminal of a digital arm start trigger (empty: the counter starts with its task), several
+        counters armed by the same terminal share the same time origin
+        """
+        super().__init__(**kwargs)
+        self.timebase = timebase
+        self.timebase_frequency = timebase_frequency
+        self.arm_source = arm_source
+        self.counter_type = "Time Tag Input"
+
+
+class EncoderCounter(Counter):
+    def __init__(self, encoder_type='Linear', decoding='X4', dist_per_pulse=1e-6, pulses_per_rev=1000, **kwargs):
+        """Counter decoding the A/B signals of a quadrature encoder into a position
+
+        encoder_type: 'Linear' (position in meters) or 'Angular' (angle in degrees)
+        decoding: one of Encoder_decoding names
+        dist_per_pulse: distance in meters of one pulse, for the linear encoders
+        pulses_per_rev: number of pulses per revolution, for the angular encoders
+        """
+        super().__init__(**kwargs)
+        assert encoder_type in ['Linear', 'Angular']
+        assert decoding in Encoder_decoding.names()
+        self.decoding = decoding
+        self.dist_per_pulse = dist_per_pulse
+        self.pulses_per_rev = pulses_per_rev
+        self.counter_type = f"{encoder_type} Encoder"
+
+
 class SemiPeriodCounter(Counter):
     def __init__(self, value_max, **kwargs):
         super().__init__(**kwargs)
@@ -215,8 +274,15 @@ class SemiPeriodCounter(Counter):
 
         
 class DigitalChannel(Channel):
-    def __init__(self, **kwargs):
+    def __init__(self, grouping=DigitalGrouping.names()[0], **kwargs):
+        """
+        Parameters
+        ----------
+        grouping: (str) one of DigitalGrouping names, Port if the name of the channel is a port (DevX/portY)
+        """
         super().__init__(**kwargs)
+        assert grouping in DigitalGrouping.names()
+        self.grouping = grouping
 
 
 class DOChannel(DigitalChannel):
@@ -272,9 +338,11 @@ class DAQmx:
         self.update_NIDAQ_devices()
         self.update_NIDAQ_channels()
         self.c_callback = None
+        self.c_callbacks = dict([])  # references to the registered callbacks, one per event
         self.callback_data = None
         self.is_scalar = True
         self.write_buffer = np.array([0.])
+        self.onboard_memory = False  # True if the AO channels of the task only use the onboard memory
 
     @property
     def task(self):
@@ -360,6 +428,27 @@ class DAQmx:
 
         return channels_tot
 
+    @classmethod
+    def get_NIDAQ_ports(cls, devices=None, source_type='Digital_Output'):
+        """Get the list of the digital ports (to be used with the Port grouping) of the connected devices
+
+        Parameters
+        ----------
+        devices: list of str, the devices, all the connected ones if None
+        source_type: str, either Digital_Output or Digital_Input
+        """
+        if devices is None:
+            devices = cls.get_NIDAQ_devices()
+        ports = []
+        for device in devices:
+            if source_type == DAQ_NIDAQ_source.Digital_Output.name:
+                string = try_string_buffer(PyDAQmx.DAQmxGetDevDOPorts, device)
+            else:
+                string = try_string_buffer(PyDAQmx.DAQmxGetDevDIPorts, device)
+            if string != '':
+                ports.extend(string.split(', '))
+        return ports
+
     @classmethod
     def getAOMaxRate(cls, device):
         data = PyDAQmx.c_double()
@@ -411,6 +500,8 @@ class DAQmx:
 
                 self._task = None
                 self.c_callback = None
+                self.c_callbacks = dict([])
+            self.onboard_memory = False
 
             self._task = PyDAQmx.Task()
 
@@ -464,6 +555,30 @@ class DAQmx:
                                                                      0, # expected min
                                                                      channel.value_max, # expected max
                                                                      PyDAQmx.DAQmx_Val_Ticks, "")
+                    elif channel.counter_type == "Linear Encoder":
+                        err_code = self._task.CreateCILinEncoderChan(channel.name, "",
+                                                                     Encoder_decoding[channel.decoding].value,
+                                                                     False, 0., PyDAQmx.DAQmx_Val_AHighBHigh,
+                                                                     PyDAQmx.DAQmx_Val_Meters,
+                                                                     channel.dist_per_pulse, 0., None)
+                    elif channel.counter_type == "Angular Encoder":
+                        err_code = self._task.CreateCIAngEncoderChan(channel.name, "",
+                                                                     Encoder_decoding[channel.decoding].value,
+                                                                     False, 0., PyDAQmx.DAQmx_Val_AHighBHigh,
+                                                                     PyDAQmx.DAQmx_Val_Degrees,
+                                                                     channel.pulses_per_rev, 0., None)
+                    elif channel.counter_type == "Time Tag Input":
+                        err_code = self._task.CreateCICountEdgesChan(channel.name, "",
+                                                                     Edge[channel.edge].value, 0,
+                                                                     PyDAQmx.DAQmx_Val_CountUp)
+                        if not err_code:
+                            err_code = self._task.SetCICountEdgesTerm(channel.name, channel.timebase)
+                        if not err_code and channel.arm_source != '':
+                            err_code = self._task.SetArmStartTrigType(PyDAQmx.DAQmx_Val_DigEdge)
+                            if not err_code:
+                                err_code = self._task.SetDigEdgeArmStartTrigSrc(channel.arm_source)
+                            if not err_code:
+                                err_code = self._task.SetDigEdgeArmStartTrigEdge(PyDAQmx.DAQmx_Val_Rising)
                         
                     
                     if not not err_code:
@@ -484,13 +599,13 @@ class DAQmx:
                                      PyDAQmx.DAQmx_Val_Amps, None)
 
                 elif channel.source == 'Digital_Output': #Digital_Output
-                    err_code = self._task.CreateDOChan(channel.name, "", PyDAQmx.DAQmx_Val_ChanPerLine)
+                    err_code = self._task.CreateDOChan(channel.name, "", DigitalGrouping[channel.grouping].value)
                     if not not err_code:
                         status = self.DAQmxGetErrorString(err_code)
                         raise IOError(status)
 
                 elif channel.source == 'Digital_Input': #Digital_Input
-                    err_code = self._task.CreateDIChan(channel.name, "", PyDAQmx.DAQmx_Val_ChanPerLine)
+                    err_code = self._task.CreateDIChan(channel.name, "", DigitalGrouping[channel.grouping].value)
                     if not not err_code:
                         status = self.DAQmxGetErrorString(err_code)
                         raise IOError(status)
@@ -587,7 +702,19 @@ class DAQmx:
             print(e)
 
     def register_callback(self, callback, event='done', nsamples=1):
+        """Register a python function called by the driver on a task event, before starting the task
 
+        Several events can be registered on the same task, a reference to each ctypes callback is kept as long as
+        the task exists.
+
+        Parameters
+        ----------
+        callback: callable with the signature of the event callback, returning 0
+        event: str, one of 'done', 'sample', 'Nsamples' (acquired into the buffer) or 'Nsamples_generated'
+            (transferred from the buffer, for output tasks: into the device FIFO, see set_transfer_on_empty to
+            follow the samples actually output)
+        nsamples: int, number of samples between two calls for the Nsamples events
+        """
         if event == 'done':
             self.c_callback = PyDAQmx.DAQmxDoneEventCallbackPtr(callback)
             self._task.RegisterDoneEvent(0, self.c_callback, None)
@@ -598,6 +725,11 @@ class DAQmx:
             self.c_callback = PyDAQmx.DAQmxEveryNSamplesEventCallbackPtr(callback)
             self._task.RegisterEveryNSamplesEvent(PyDAQmx.DAQmx_Val_Acquired_Into_Buffer, nsamples,
                                                   0, self.c_callback, None)
+        elif event == 'Nsamples_generated':
+            self.c_callback = PyDAQmx.DAQmxEveryNSamplesEventCallbackPtr(callback)
+            self._task.RegisterEveryNSamplesEvent(PyDAQmx.DAQmx_Val_Transferred_From_Buffer, nsamples,
+                                                  0, self.c_callback, None)
+        self.c_callbacks[event] = self.c_callback
 
     def get_last_write_index(self):
         if self.task is not None:
@@ -621,7 +753,7 @@ class DAQmx:
             else:
                 return 0.
 
-    def writeAnalog(self, Nsamples, Nchannels, values, autostart=False):
+    def writeAnalog(self, Nsamples, Nchannels, values, autostart=False, onboard_memory=False):
         """
         Write Nsamples on N analog output channels
         Parameters
@@ -629,6 +761,9 @@ class DAQmx:
         Nsamples: (int) numver of samples to write on each channel
         Nchannels: (int) number of AO channels defined in the task
         values: (ndarray) 2D array (or flattened array) of size Nsamples * Nchannels
+        onboard_memory: (bool) for a regenerated (periodic) output written before starting the task: if the device
+            supports it, the samples are uploaded once into its onboard memory and regenerated from there, without
+            any transfer from the host while the task runs
 
         Returns
         -------
@@ -648,12 +783,45 @@ class DAQmx:
 
         else:
             self.is_scalar = False
+            onboard_memory = onboard_memory and Nsamples * Nchannels <= self.get_onboard_buffer_size()
+            if onboard_memory != self.onboard_memory:
+                self.set_onboard_memory(onboard_memory)
             read = PyDAQmx.int32()
             self._task.WriteAnalogF64(Nsamples, autostart, timeout, PyDAQmx.DAQmx_Val_GroupByChannel, values,
                                            PyDAQmx.byref(read), None)
             if read.value != Nsamples:
                 raise IOError(f'Insufficient number of samples have been written:{read.value}/{Nsamples}')
 
+    def get_onboard_buffer_size(self):
+        """Number of samples the onboard buffer of the output device of the task can hold, 0 if not available"""
+        size = PyDAQmx.uInt32()
+        try:
+            self._task.GetBufOutputOnbrdBufSize(PyDAQmx.byref(size))
+        except PyDAQmx.DAQmxFunctions.DAQException:
+            return 0
+        return size.value
+
+    def set_onboard_memory(self, enable=True):
+        """Regenerate the samples of the AO channels of the (stopped) task from the onboard memory only, if enable"""
+        self.onboard_memory = enable
+        for channel in try_string_buffer(self._task.GetTaskChannels).split(', '):
+            try:
+                self._task.SetAOUseOnlyOnBrdMem(channel, enable)
+            except PyDAQmx.DAQmxFunctions.DAQException as e:
+                if enable:
+                    logger.info(f'Onboard memory not used for {channel}: {e}')
+                    self.set_onboard_memory(False)
+                    return
+
+    def set_transfer_on_empty(self):
+        """Transfer the samples of the AO channels of the (stopped) task to the device only when its onboard memory
+        is empty, instead of filling its FIFO at once. The Nsamples_generated events (samples transferred from the
+        buffer) then follow the samples actually output, within a few samples"""
+        for channel in try_string_buffer(self._task.GetTaskChannels).split(', '):
+            err = self._task.SetAODataXferReqCond(channel, PyDAQmx.DAQmx_Val_OnBrdMemEmpty)
+            if err != 0:
+                raise IOError(self.DAQmxGetErrorString(err))
+
     def readAnalog(self, Nchannels, clock_settings):
         read = PyDAQmx.int32()
         N = clock_settings.Nsamples
@@ -667,6 +835,24 @@ class DAQmx:
         else:
             raise IOError(f'Insufficient number of samples have been read:{read.value}/{N}')
 
+    def readAnalogBuffer(self, buffer, Nsamples=PyDAQmx.DAQmx_Val_Auto, timeout=10.):
+        """
+        Read samples from a sample clocked (buffered) analog input task into a preallocated array
+        Parameters
+        ----------
+        buffer: (ndarray) preallocated float64 array, grouped by channel
+        Nsamples: (int) number of samples per channel to read, DAQmx_Val_Auto reads all the available samples
+        timeout: (float) time in seconds to wait for the samples
+
+        Returns
+        -------
+        int: the number of samples per channel actually written into buffer
+        """
+        read = PyDAQmx.int32()
+        self._task.ReadAnalogF64(Nsamples, timeout, PyDAQmx.DAQmx_Val_GroupByChannel, buffer, buffer.size,
+                                 PyDAQmx.byref(read), None)
+        return read.value
+
     def readCounter(self, Nchannels, counting_time=10., read_function="Ex"):
 
         data_counter = np.zeros(Nchannels, dtype='uint32')
@@ -687,6 +873,41 @@ class DAQmx:
         else:
             raise IOError(f'Insufficient number of samples have been read:{read}/{Nchannels}')
 
+    def readCounterBuffer(self, buffer, Nsamples=PyDAQmx.DAQmx_Val_Auto, timeout=10.):
+        """
+        Read samples from a sample clocked (buffered) counter task without stopping it
+        Parameters
+        ----------
+        buffer: (ndarray) preallocated uint32 array (counts), or float64 array (scaled values such as encoder
+            positions), reused from one read to the other
+        Nsamples: (int) number of samples to read, DAQmx_Val_Auto reads all the available samples
+        timeout: (float) time in seconds to wait for the samples
+
+        Returns
+        -------
+        int: the number of samples actually written into buffer
+        """
+        read = PyDAQmx.int32()
+        if buffer.dtype == np.float64:
+            self._task.ReadCounterF64(Nsamples, timeout, buffer, buffer.size, PyDAQmx.byref(read), None)
+        else:
+            self._task.ReadCounterU32Ex(Nsamples, timeout, PyDAQmx.DAQmx_Val_GroupByChannel,
+                                        buffer, buffer.size, PyDAQmx.byref(read), None)
+        return read.value
+
+    def readCounterScalar(self, timeout=10.):
+        """Read on demand the current scaled value of a started, not sample clocked, counter task (for instance an
+        encoder position)"""
+        value = PyDAQmx.float64()
+        self._task.ReadCounterScalarF64(timeout, PyDAQmx.byref(value), None)
+        return value.value
+
+    def getAvailableSamples(self):
+        """Get the number of samples per channel available in the input buffer of the task"""
+        data = PyDAQmx.c_uint32()
+        self._task.GetReadAvailSampPerChan(PyDAQmx.byref(data))
+        return data.value
+
     def readDigital(self, Nchannels):
         read = PyDAQmx.int32()
         bytes_sample = PyDAQmx.int32()
@@ -702,13 +923,34 @@ class DAQmx:
     def writeDigital(self, Nchannels, values, autostart=False):
         if np.prod(values.shape) != Nchannels:
             raise ValueError(f'The shape of digital outputs values is incorrect, should be {Nchannels}')
-        values.astype(np.uint8)
+        values = values.astype(np.uint8)
         written = PyDAQmx.int32()
         self._task.WriteDigitalLines(Nchannels, autostart, 0, PyDAQmx.DAQmx_Val_GroupByChannel,
                                       values, PyDAQmx.byref(written), None)
         if written.value != Nchannels:
             raise IOError(f'Insufficient number of samples have been written:{written}/{Nchannels}')
 
+    def writeDigitalPort(self, Nsamples, Nchannels, values, autostart=False, timeout=10.):
+        """Write Nsamples uint32 words on each of the Nchannels port channels of the task (Port grouping), all the
+        lines of a port being set at once by a single word
+
+        Parameters
+        ----------
+        Nsamples: int, number of samples to write on each channel, a whole clocked pattern or a single word
+        Nchannels: int, number of port channels defined in the task
+        values: ndarray of size Nsamples * Nchannels, grouped by channel, bit i of a word being line i of the port
+        autostart: bool, start the task with the write
+        timeout: float, maximum time (s) to wait for space in the buffer
+        """
+        if np.prod(values.shape) != Nsamples * Nchannels:
+            raise ValueError(f'The shape of digital outputs values is incorrect, should be {Nsamples} x {Nchannels}')
+        values = np.ascontiguousarray(values, dtype=np.uint32)
+        written = PyDAQmx.int32()
+        self._task.WriteDigitalU32(Nsamples, autostart, timeout, PyDAQmx.DAQmx_Val_GroupByChannel,
+                                   values, PyDAQmx.byref(written), None)
+        if written.value != Nsamples:
+            raise IOError(f'Insufficient number of samples have been written:{written}/{Nsamples}')
+
     @classmethod
     def getAIVoltageRange(cls, device='Dev1'):
         buff_size = 100
@@ -737,6 +979,45 @@ class DAQmx:
         if self._task is not None:
             self._task.StartTask()
 
+    def commit(self):
+        """Reserve the resources and program the hardware of the task once, stopping the task then brings it back to
+        this committed state such that it can be restarted quickly"""
+        if self._task is not None:
+            err = self._task.TaskControl(PyDAQmx.DAQmx_Val_Task_Commit)
+            if err != 0:
+                raise IOError(self.DAQmxGetErrorString(err))
+
+    def set_implicit_timing(self, Nsamples, repetition=False):
+        """Timing of a counter output task: Nsamples pulses (or continuous pulses if repetition)"""
+        if self._task is not None:
+            err = self._task.CfgImplicitTiming(PyDAQmx.DAQmx_Val_ContSamps if repetition
+                                               else PyDAQmx.DAQmx_Val_FiniteSamps, Nsamples)
+            if err != 0:
+                raise IOError(self.DAQmxGetErrorString(err))
+
+    def set_on_demand(self):
+        """Software timing of a stopped task: once started, each write is output at once"""
+        if self._task is not None:
+            err = self._task.SetSampTimingType(PyDAQmx.DAQmx_Val_OnDemand)
+            if err != 0:
+                raise IOError(self.DAQmxGetErrorString(err))
+
+    def set_regeneration(self, allow=True):
+        """Allow (default) or not the regeneration of the samples of an output buffer. Without regeneration, the
+        buffer has to be written continuously ahead of the generation"""
+        if self._task is not None:
+            err = self._task.SetWriteRegenMode(PyDAQmx.DAQmx_Val_AllowRegen if allow
+                                               else PyDAQmx.DAQmx_Val_DoNotAllowRegen)
+            if err != 0:
+                raise IOError(self.DAQmxGetErrorString(err))
+
+    def set_sample_count(self, Nsamples):
+        """Change the number of samples of a stopped finite task without recreating it"""
+        if self._task is not None:
+            err = self._task.SetSampQuantSampPerChan(Nsamples)
+            if err != 0:
+                raise IOError(self.DAQmxGetErrorString(err))
+
     def close(self):
         """
             close the current task.
@@ -1,19 +1,215 @@
-from collections import OrderedDict
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import NamedTuple
 import numpy as np
-from qtpy.QtCore import QObject, Signal
+from qtpy.QtCore import QObject, Signal, QTimer
+import PyDAQmx
 import pymodaq_plugins_daqmx.hardware.national_instruments.daqmx as dq
-from PyDAQmx import DAQmx_Val_FiniteSamps
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import RingBuffer
+from PyDAQmx import DAQmx_Val_FiniteSamps, DAQmx_Val_ContSamps, DAQmx_Val_DoNotAllowRegen, DAQmx_Val_FirstSample
 
 from pymodaq.utils.logger import set_logger, get_module_name
 
 logger = set_logger(get_module_name(__file__))
 
 
+def motion_profile(start, stop, velocity, acceleration, dt):
+    """Positions sampled every dt of a move limited in velocity and acceleration
+
+    The profile is trapezoidal (triangular for short moves), computed at once for all the samples.
+
+    Returns
+    -------
+    ndarray: the positions of the move, the last one being stop
+    """
+    distance = abs(stop - start)
+    if distance == 0 or velocity <= 0 or acceleration <= 0:
+        return np.array([stop], dtype=np.float64)
+    t_acc = velocity / acceleration
+    if acceleration * t_acc ** 2 > distance:  # the maximum velocity is never reached
+        t_acc = np.sqrt(distance / acceleration)
+        velocity = acceleration * t_acc
+    t_flat = (distance - acceleration * t_acc ** 2) / velocity
+    duration = 2 * t_acc + t_flat
+    t = np.minimum(np.arange(1, int(np.ceil(duration / dt)) + 1) * dt, duration)
+    d = np.where(t < t_acc, 0.5 * acceleration * t ** 2,
+                 np.where(t < t_acc + t_flat, 0.5 * acceleration * t_acc ** 2 + velocity * (t - t_acc),
+                          distance - 0.5 * acceleration * (duration - t) ** 2))
+    d[-1] = distance
+    return start + np.sign(stop - start) * d
+
+
+class PositionState(NamedTuple):
+    """Progress of a clocked output, published by the driver events"""
+    index: int  # number of samples generated
+    timestamp: float  # time.perf_counter() of the event
+    voltages: np.ndarray  # voltages generated at that time, one per channel
+    done: bool
+
+
+class PositionTracker(QObject):
+    """Follow the progress of a finite clocked AO task from its driver events, without polling the driver
+
+    The samples of the task have to be transferred to the device only when its onboard memory is empty
+    (DAQmx.set_transfer_on_empty), otherwise the events of a move shorter than the FIFO all fire at its start.
+
+    The state is replaced as a whole by the event callbacks (a single attribute assignment) and read as a whole
+    by voltages(), so no lock is needed. Between two events, the position is extrapolated from the clock frequency.
+    """
+    move_done = Signal()
+
+    def __init__(self):
+        QObject.__init__(self)
+        self._voltage_array = np.zeros((1, 1))
+        self._frequency = 1.
+        self._Nevent = 1
+        self.state = PositionState(0, time.perf_counter(), np.zeros((1,)), True)
+
+    def hold(self, voltages):
+        """Set a static state, for instance where an output was interrupted"""
+        self.state = PositionState(0, time.perf_counter(), np.ravel(voltages).astype(np.float64), True)
+
+    def register(self, daq, frequency, update_time=0.02):
+        """Register the events of the AO task of daq, once when the task is (re)created (DAQmx rejects a second
+        registration of the same event on a task)
+
+        Parameters
+        ----------
+        daq: DAQmx object of the AO task
+        frequency: float, frequency of the sample clock
+        update_time: float, approximate time (s) between two progress events
+        """
+        self._Nevent = max(int(round(update_time * frequency)), 1)
+        daq.register_callback(self._samples_generated, 'Nsamples_generated', self._Nevent)
+        daq.register_callback(self._done, 'done')
+
+    def track(self, voltage_array, frequency):
+        """Reset the state for a new output of voltage_array by the (not started yet) AO task, whose events have
+        been registered
+
+        Parameters
+        ----------
+        voltage_array: ndarray of shape (Nchannels, Nsamples) or (Nsamples,) for a single channel
+        frequency: float, frequency of the sample clock
+        """
+        self._voltage_array = np.atleast_2d(voltage_array)
+        self._frequency = frequency
+        self.state = PositionState(0, time.perf_counter(), self._voltage_array[:, 0], False)
+
+    def _samples_generated(self, task_handle, event_type, Nsamples, callback_data):
+        index = min(self.state.index + self._Nevent, self._voltage_array.shape[1])
+        self.state = PositionState(index, time.perf_counter(), self._voltage_array[:, index - 1], False)
+        return 0  # mandatory for the DAQmx callback
+
+    def _done(self, task_handle, status, callback_data):
+        self.state = PositionState(self._voltage_array.shape[1], time.perf_counter(),
+                                   self._voltage_array[:, -1], True)
+        self.move_done.emit()
+        return 0  # mandatory for the DAQmx callback
+
+    def sample_index(self):
+        """Get the number of samples generated so far, extrapolated from the last event"""
+        state = self.state
+        if state.done:
+            return state.index
+        index = state.index + int((time.perf_counter() - state.timestamp) * self._frequency)
+        return min(index, self._voltage_array.shape[1])
+
+    def voltages(self):
+        """Get the voltages currently generated, one per channel"""
+        state = self.state
+        if state.done:
+            return state.voltages
+        return self._voltage_array[:, max(self.sample_index(), 1) - 1]
+
+
+class ScanPlan:
+    """Scan compiled by the hardware timed scanners of pymodaq_plugins_daqmx.scanners, to be output at once by the
+    AO_with_clock_DAQmx controlling the scanned axes
+
+    Parameters
+    ----------
+    axes: list of str, the axis of the controller driven by the actuator of each column of positions (None if it is
+        not one of the NI scanners)
+    positions: ndarray of shape (Npoints, number of actuators), the scan points in the order they are scanned, in
+        the actuator units
+    dwell_time: float, time (s) spent at each point, during which the detectors are acquiring
+    """
+    def __init__(self, axes, positions, dwell_time=0.1):
+        self.axes = list(axes)
+        self.positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        self.dwell_time = dwell_time
+
+    def trajectory(self, axes, start_voltages, conv_factors, steps, frequency):
+        """Compile the whole scan into the voltages of the AO channels of a controller, one column per clock tick
+
+        Each point is reached with a ramp limited to the step voltage of each axis per tick (as for a merged move),
+        then held during the dwell time.
+
+        Parameters
+        ----------
+        axes: list of str, the axes of the AO channels of the controller, in the order of its channels
+        start_voltages: list of float, the voltages currently applied on these axes
+        conv_factors: dict, axis: conversion factor (actuator units/V) of the axes scanned
+        steps: list of float, maximum voltage step between two clock ticks of each axis
+        frequency: float, frequency of the clock
+
+        Returns
+        -------
+        voltage_array: ndarray of shape (number of axes, number of ticks)
+        point_voltages: ndarray of shape (Npoints, number of axes), the voltages of each scan point
+        point_ticks: ndarray of int, the number of samples generated once each point is reached
+        Ndwell: int, number of ticks of the dwell time
+        """
+        point_voltages = np.tile(np.asarray(start_voltages, dtype=np.float64), (self.positions.shape[0], 1))
+        for ind, ax in enumerate(axes):
+            if ax in self.axes:
+                point_voltages[:, ind] = self.positions[:, self.axes.index(ax)] / conv_factors[ax]
+        Ndwell = max(1, int(round(self.dwell_time * frequency)))
+        segments = []
+        point_ticks = np.zeros((point_voltages.shape[0],), dtype=int)
+        Nticks = 0
+        previous = np.asarray(start_voltages, dtype=np.float64)
+        for ind, voltages in enumerate(point_voltages):
+            ramp = AO_with_clock_DAQmx.merged_voltages(previous, voltages, steps)
+            if ind > 0 and ramp.shape[1] > 1:
+                ramp = ramp[:, 1:]  # the previous point is already held
+            point_ticks[ind] = Nticks + ramp.shape[1]
+            segments.extend([ramp, np.repeat(voltages[:, None], Ndwell - 1, axis=1)])
+            Nticks += ramp.shape[1] + Ndwell - 1
+            previous = voltages
+        # one more tick so that the clocked acquisitions measure during the whole dwell time of the last point
+        segments.append(point_voltages[-1][:, None])
+        return np.concatenate(segments, axis=1), point_voltages, point_ticks, Ndwell
+
+
 class AO_with_clock_DAQmx(QObject):
     """Object used to coordinate the use of several DAQmx by several modules.
     Its main intended use is to control the movement of several scanners (AO chans) with
-    the timing given by the same clock channel."""
+    the timing given by the same clock channel.
+
+    In streaming mode, the clock runs continuously and a write-ahead thread keeps the AO buffer (regeneration off)
+    filled with the queued moves, or with the last voltages when there is nothing to move, so that consecutive moves
+    are chained without stopping the tasks.
+
+    Otherwise, the moves requested by the master and slave actuators with request_move within merge_window (ms)
+    are merged into a single clocked trajectory, each axis being ramped over the same duration, and
+    merged_move_done is emitted with all the axes of the trajectory once it is over. Requests received while moving
+    are merged into the next trajectory.
+    If use_scan_plan is True, the moves to the points of the ScanPlan published on this controller by a hardware
+    timed scanner (set_scan_plan) are not output one by one: the move to its first point outputs the whole scan at
+    once, and the next moves are only waiting for the clock to reach their point (see follow_scan_plan). A plan is
+    output once: it is discarded at its end, when it is aborted, or if the first move requested is not to its first
+    point.
+    The clock and AO tasks are kept committed from one move to the next, only their number of samples is changed
+    per move, see release_tasks. A single step is output as a clocked buffer of two samples at the target, the
+    events of the tracker being only valid on a buffered task.
+    """
     ni_card_ready_for_moving = Signal()
+    merged_move_done = Signal(list)  # the axes whose movement is over
+    _move_requested = Signal()
+
     def __init__(self):
         QObject.__init__(self)
 
@@ -26,21 +222,73 @@ class AO_with_clock_DAQmx(QObject):
         self.num_ch = 0
         self.voltage_array = None
         self.max_ch_nb = 1
+        self._max_ch_nb_device = None  # device whose number of AO channels is cached in max_ch_nb
+        self._clock_key = None  # (channel, frequency) of the committed clock task
+        self._analog_channels = None  # channel names and ranges of the committed AO task
+        self._analog_samples = None  # number of samples of the AO task
         self.applied_voltages = OrderedDict()
         self.locked = False  # True when busy already moving something
+        self.raster_axes = []
+
+        self.streaming = False
+        self.chunk_size = 50
+        self._writer = None
+        self._queue = deque()  # queued moves, arrays of shape (num_ch, Nsamples)
+        self._queue_lock = threading.Lock()
+        self._queue_position = 0  # index of the next sample to write in the first queued move
+        self._queued_end = np.zeros((0,))  # voltages at the end of the queue
+        self._last_output = np.zeros((0,))
+        self._written = 0  # total number of samples per channel written since the start of the stream
+        self.history = RingBuffer(1)  # last written samples
+        self.stream_state = PositionState(0, time.perf_counter(), np.zeros((0,)), True)
+        self.tracker = PositionTracker()
+
+        self.merge_window = 20  # ms
+        self._requests = OrderedDict()  # axis: (AOChannel, target voltage, step voltage)
+        self._requests_lock = threading.Lock()
+        self._merged_axes = []
+        self._merge_timer = QTimer()
+        self._merge_timer.setSingleShot(True)
+        self._merge_timer.timeout.connect(self.execute_merged_move)
+        # requests may come from the threads of the slave actuators, the window is opened in the controller thread
+        self._move_requested.connect(self._open_merge_window)
+        self.tracker.move_done.connect(self._merged_move_finished)
+
+        self.use_scan_plan = False
+        self.scan_plan = None  # ScanPlan published by a hardware timed scanner, not output yet
+        self.conv_factors = dict()  # axis: conversion factor of the actuator, to convert the scan plan positions
+        self._plan_running = False
+        self._plan_axes = []  # axes of the running plan
+        self._plan_voltages = np.zeros((0, 0))  # voltages of each point of the running plan
+        self._plan_ticks = np.zeros((0,), dtype=int)
+        self._plan_tolerance = np.zeros((0,))
+        self._plan_dwell = 1
+        self._plan_index = 0  # next point expected
+        self._plan_waiting = None  # (tick, axes) of the point whose move is not done yet
+        self._plan_timer = QTimer()
+        self._plan_timer.setSingleShot(True)
+        self._plan_timer.timeout.connect(self._check_plan_point)
 
     def set_up_clock(self, nb_steps):
         """Prepare the clock with the desired frequency
-        nb_steps (int) specifies the number of steps there will be in the movement."""
-        self.clock_channel = dq.ClockCounter(self.clock_frequency,
-                                             name=self.clock_channel_name,
-                                             source="Counter")
-        if self.clock.task is not None:
-            self.clock.task.WaitUntilTaskDone(-1)  # in case another scanner is still moving
-        self.clock.update_task(channels=[self.clock_channel])
-        # we need to set the rate again, I do not understand why
-        self.clock.task.SetSampClkRate(self.clock_frequency)
-        self.clock.task.CfgImplicitTiming(DAQmx_Val_FiniteSamps, nb_steps + 1)
+        nb_steps (int) specifies the number of steps there will be in the movement.
+        The clock task is only created (and committed) when its channel or frequency changed, otherwise only its
+        number of pulses is updated.
+        It is only called once the previous movement is over (its done event released the scheduler), so the clock
+        is stopped without waiting."""
+        self.clock.stop()
+        if self.clock.task is None or self._clock_key != (self.clock_channel_name, self.clock_frequency):
+            self.clock_channel = dq.ClockCounter(self.clock_frequency,
+                                                 name=self.clock_channel_name,
+                                                 source="Counter")
+            # no sample clock timing, it would override the pulse frequency (the default settings are at 1 kHz)
+            self.clock.update_task(channels=[self.clock_channel], clock_settings=dq.ClockSettings(Nsamples=1))
+            self.clock.task.CfgImplicitTiming(DAQmx_Val_FiniteSamps, nb_steps + 1)
+            self.clock.commit()
+            self._clock_key = (self.clock_channel_name, self.clock_frequency)
+            self._analog_channels = None  # the AO sample clock rate has to be updated as well
+        else:
+            self.clock.set_sample_count(nb_steps + 1)
 
         clock_settings_ao = dq.ClockSettings(source="/" + self.clock_channel_name + "InternalOutput",
                                              frequency=self.clock_frequency,
@@ -50,21 +298,60 @@ class AO_with_clock_DAQmx(QObject):
         self.get_max_ch_nb()
         return clock_settings_ao
 
+    def set_up_analog(self, nb_steps):
+        """Prepare the AO task of all the channels for an output of nb_steps samples
+
+        The task is only created (and committed) when the channels changed, it is always clocked by the clock task
+        and at least two samples long (see output_trajectory).
+        """
+        nb_steps = max(nb_steps, 2)
+        self.analog.stop()
+        names = [(channel.name, channel.value_min, channel.value_max) for channel in self.AO_channels.values()]
+        if self.analog.task is None or self._analog_channels != names:
+            clock_settings_ao = dq.ClockSettings(source="/" + self.clock_channel_name + "InternalOutput",
+                                                 frequency=self.clock_frequency,
+                                                 edge=dq.Edge.names()[0],
+                                                 Nsamples=nb_steps,
+                                                 repetition=False)
+            self.analog.update_task(channels=list(self.AO_channels.values()), clock_settings=clock_settings_ao)
+            # each move overwrites the buffer from its start
+            self.analog.task.SetWriteRelativeTo(DAQmx_Val_FirstSample)
+            self.analog.task.SetWriteOffset(0)
+            # the progress events of the tracker follow the output, not the transfers into the FIFO
+            self.analog.set_transfer_on_empty()
+            self.tracker.register(self.analog, self.clock_frequency)
+            self._analog_channels = names
+            self._analog_samples = None
+        if nb_steps != self._analog_samples:
+            self.analog.set_sample_count(nb_steps)
+            self.analog.commit()
+            self._analog_samples = nb_steps
+
+    def release_tasks(self):
+        """Forget the committed tasks, they are recreated on the next move"""
+        self._clock_key = None
+        self._analog_channels = None
+
     def update_ao_channels(self, channel, axis, clock_settings_ao):
         """Update the dict containing the AO channels, and the associated task in the
         corresponding DAQmx object."""
+        new_channel = axis not in self.AO_channels.keys() or self.AO_channels[axis].name != channel.name
         self.AO_channels[axis] = channel
         if axis not in self.applied_voltages.keys():
             self.applied_voltages[axis] = 0.0
+        if self.streaming:
+            if new_channel:  # the streamed task has to contain all the channels
+                self.set_up_streaming()
+            return
+        if self.locked:  # another scanner is moving, the AO task is set up with the channel on the next move
+            return
         self.num_ch = len(self.AO_channels)
         self.get_max_ch_nb()
         if self.num_ch > self.max_ch_nb:
             logger.info("Too many AO channels!")
             return
-        if self.clock.task is not None:  # we wait for slow movements
-            self.clock.task.WaitUntilTaskDone(-1)  # in case another scanner is still moving
-        self.analog.update_task(channels=[self.AO_channels[ax] for ax in self.AO_channels.keys()],
-                                clock_settings=clock_settings_ao)
+        # only the number of samples of clock_settings_ao is used, the persistent AO task is clocked when needed
+        self.set_up_analog(clock_settings_ao.Nsamples)
 
     def set_up_voltage_array(self, voltage_list, axis):
         if self.num_ch == 1:
@@ -93,21 +380,441 @@ class AO_with_clock_DAQmx(QObject):
             for i in range(len(axes)):
                 self.applied_voltages[axes[i]] = self.voltage_array[i, -1]
 
-        self.analog.start()
+        # the buffer is written before starting the clocked task
+        self.tracker.track(self.voltage_array, self.clock_frequency)
         self.analog.writeAnalog(nb_steps, self.num_ch, self.voltage_array)
+        self.analog.start()
+
+    def request_move(self, axis, channel, target, step):
+        """Ask for a move of one axis, to be merged with the other requests received within merge_window
+
+        Parameters
+        ----------
+        axis: str, the axis to move
+        channel: AOChannel of the axis
+        target: float, target voltage
+        step: float, maximum voltage step between two clock ticks
+        """
+        with self._requests_lock:
+            self._requests[axis] = (channel, target, step)
+        self._move_requested.emit()
+
+    def _open_merge_window(self):
+        if not self.locked and not self._merge_timer.isActive():
+            self._merge_timer.start(self.merge_window)
+
+    @staticmethod
+    def merged_voltages(starts, targets, steps):
+        """Ramp every axis from its start to its target voltage over the same number of clock ticks
+
+        The number of ticks is set by the axis needing the most steps, the first tick being the start voltages as for
+        a single axis move. Only the targets are output if all the moves are smaller than their step.
+
+        Returns
+        -------
+        ndarray of shape (number of axes, number of ticks)
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        targets = np.asarray(targets, dtype=np.float64)
+        distances = np.abs(targets - starts)
+        steps = np.asarray(steps, dtype=np.float64)
+        if np.all(distances <= steps):
+            return targets[:, None]
+        Nticks = int(np.max(np.ceil(distances[distances > steps] / steps[distances > steps]))) + 1
+        return np.linspace(starts, targets, Nticks, axis=1)
+
+    def execute_merged_move(self):
+        """Output the trajectory merging all the pending requests, the other axes keep their voltages"""
+        with self._requests_lock:
+            if self.locked or len(self._requests) == 0:
+                return
+            requests = self._requests
+            self._requests = OrderedDict()
+        for axis, (channel, _, _) in requests.items():
+            self.AO_channels[axis] = channel
+            if axis not in self.applied_voltages.keys():
+                self.applied_voltages[axis] = 0.0
+        self.num_ch = len(self.AO_channels)
+        if self.use_scan_plan and (self.scan_plan is not None or self._plan_running) and \
+                self.follow_scan_plan(requests):
+            return
+        targets = [requests[ax][1] if ax in requests else self.applied_voltages[ax] for ax in self.AO_channels]
+        steps = [requests[ax][2] if ax in requests else np.inf for ax in self.AO_channels]
+        voltage_array = self.merged_voltages([self.applied_voltages[ax] for ax in self.AO_channels], targets, steps)
+
+        self.locked = True
+        self._merged_axes = list(requests.keys())
+        self.get_max_ch_nb()
+        if self.num_ch > self.max_ch_nb:
+            logger.info("Too many AO channels!")
+            self._merged_move_finished()
+            return
+        self.output_trajectory(voltage_array)
+
+    def set_scan_plan(self, scan_plan):
+        """Publish the ScanPlan of a hardware timed scanner, replacing the one not output yet (a running plan goes
+        on)"""
+        self.scan_plan = scan_plan
+
+    def follow_scan_plan(self, requests):
+        """Handle the requests as moves to the points of the scan plan, if they are
+
+        The move to the first point of the plan outputs the whole scan. The next requests are matched to the next
+        points of the running scan and are done once the clock has output them, the scan going on meanwhile. A
+        request which is not part of the scan aborts it.
+
+        Returns
+        -------
+        bool: True if the requests were handled as scan points
+        """
+        axes = list(self.AO_channels.keys())
+        if any(ax not in (self._plan_axes if self._plan_running else self.scan_plan.axes) for ax in requests):
+            self._abort_plan()
+            return False
+        columns = [axes.index(ax) for ax in requests]
+        targets = np.array([requests[ax][1] for ax in requests])
+        if not self._plan_running:
+            voltage_array, point_voltages, point_ticks, Ndwell = self.scan_plan.trajectory(
+                axes, [self.applied_voltages[ax] for ax in axes], self.conv_factors,
+                [requests[ax][2] if ax in requests else np.inf for ax in axes], self.clock_frequency)
+            tolerance = np.full((len(axes),), np.inf)
+            for ind in range(len(axes)):
+                distinct = np.unique(point_voltages[:, ind])
+                if distinct.size > 1:
+                    tolerance[ind] = 0.5 * np.min(np.diff(distinct))
+            if not np.all(np.abs(point_voltages[0, columns] - targets) <= tolerance[columns]):
+                self.scan_plan = None  # a move outside of the scan, the plan is not run
+                return False
+            self._plan_voltages, self._plan_ticks, self._plan_tolerance = point_voltages, point_ticks, tolerance
+            self._plan_dwell = Ndwell
+            self.get_max_ch_nb()
+            if self.num_ch > self.max_ch_nb:
+                logger.info("Too many AO channels!")
+                return False
+            self._plan_axes = self.scan_plan.axes
+            self.scan_plan = None  # output once
+            self._plan_running = True
+            self.output_trajectory(voltage_array)
+            self._wait_plan_point(0, list(requests.keys()))
+            return True
+        matching = np.all(np.abs(self._plan_voltages[self._plan_index:, columns] - targets)
+                          <= self._plan_tolerance[columns], axis=1)
+        if not np.any(matching):
+            self._abort_plan()
+            return False
+        self._wait_plan_point(self._plan_index + int(np.argmax(matching)), list(requests.keys()))
+        return True
+
+    def _wait_plan_point(self, index, axes):
+        self._plan_index = index + 1
+        self._plan_waiting = (self._plan_ticks[index], axes)
+        self._check_plan_point()
+
+    def _check_plan_point(self):
+        """Emit merged_move_done once the clock has reached the awaited point, otherwise check again when it
+        should have"""
+        if self._plan_waiting is None:
+            return
+        tick, axes = self._plan_waiting
+        remaining = tick - self.tracker.sample_index()
+        if remaining > 0 and self._plan_running:
+            self._plan_timer.start(int(np.ceil(remaining / self.clock_frequency * 1e3)))
+            return
+        if -remaining >= self._plan_dwell:
+            logger.warning('The scan point was requested after the end of its dwell time, increase the dwell time'
+                           ' of the scanner')
+        self._plan_waiting = None
+        self.merged_move_done.emit(axes)
+
+    def _abort_plan(self):
+        """Stop the output of the running scan plan (or discard the plan not output yet), the scanners stay where the
+        output was interrupted"""
+        self.scan_plan = None
+        self._plan_timer.stop()
+        if not self._plan_running:
+            return
+        voltages = self.tracker.voltages()
+        self.clock.stop()
+        self.analog.stop()
+        for ind, ax in enumerate(self.AO_channels.keys()):
+            self.applied_voltages[ax] = voltages[ind]
+        self.tracker.hold(voltages)
+        self._plan_running = False
+        if self._plan_waiting is not None:
+            axes = self._plan_waiting[1]
+            self._plan_waiting = None
+            self.merged_move_done.emit(axes)
+
+    def output_trajectory(self, voltage_array):
+        """Output voltage_array of shape (num_ch, nb_steps) on all the AO channels, clocked by the clock task, a
+        single step being repeated into a buffer of two samples"""
+        if voltage_array.shape[1] == 1:
+            voltage_array = np.repeat(voltage_array, 2, axis=1)
+        nb_steps = voltage_array.shape[1]
+        self.set_up_clock(nb_steps)
+        self.set_up_analog(nb_steps)
+        self.voltage_array = voltage_array if self.num_ch > 1 else voltage_array[0]
+        self.write_voltages()
+        self.clock.start()
+
+    def _merged_move_finished(self):
+        """Called on the done event of the clocked output"""
+        if self._plan_running:
+            self._plan_running = False
+            self._check_plan_point()
+            return
+        if not self.locked:
+            return
+        axes = self._merged_axes
+        self._merged_axes = []
+        self.locked = False
+        self.merged_move_done.emit(axes)
+        if len(self._requests) != 0:
+            self._merge_timer.start(self.merge_window)
+
+    @staticmethod
+    def raster_voltages(x_voltages, y_voltages, flyback=0, snake=False):
+        """Compute the two-axis trajectory of a whole frame, one clock tick per pixel
+
+        Each line starts with flyback ticks at its first position so that the scanner settles after the jump from
+        the end of the previous line. One more tick holding the last position is added at the end, so that the
+        acquisitions sampled on the same clock measure during every pixel.
+
+        Parameters
+        ----------
+        x_voltages: ndarray, voltages of the pixels along a line (fast axis)
+        y_voltages: ndarray, voltages of the lines (slow axis)
+        flyback: int, number of settling ticks at the start of each line
+        snake: bool, if True, every other line is scanned backwards
+
+        Returns
+        -------
+        voltages: ndarray of shape (2, number of ticks + 1), x and y voltages
+        pixel_ticks: ndarray of int of shape (Ny, Nx), index of the tick of each pixel of the image
+        """
+        x_voltages = np.asarray(x_voltages, dtype=np.float64)
+        y_voltages = np.asarray(y_voltages, dtype=np.float64)
+        Nx, Ny = x_voltages.size, y_voltages.size
+        line_length = Nx + flyback
+        x_lines = np.tile(x_voltages, (Ny, 1))
+        pixel_ticks = np.arange(Ny)[:, None] * line_length + flyback + np.arange(Nx)[None, :]
+        if snake:
+            x_lines[1::2] = x_lines[1::2, ::-1]
+            pixel_ticks[1::2] = pixel_ticks[1::2, ::-1]
+        x_lines = np.concatenate((np.repeat(x_lines[:, :1], flyback, axis=1), x_lines), axis=1)
+        y_lines = np.repeat(y_voltages[:, None], line_length, axis=1)
+        voltages = np.stack((x_lines.ravel(), y_lines.ravel()))
+        return np.concatenate((voltages, voltages[:, -1:]), axis=1), pixel_ticks
+
+    def set_up_raster(self, voltage_array, axes):
+        """Prepare the clock and the AO task to output a whole precomputed trajectory
+
+        Parameters
+        ----------
+        voltage_array: ndarray of shape (number of axes, number of ticks), see raster_voltages
+        axes: list of str, the axes of the AO_channels driven by each row of voltage_array
+
+        Returns
+        -------
+        ClockSettings: to be used by the acquisition tasks sampled on the same clock
+        """
+        clock_settings = self.set_up_clock(voltage_array.shape[1] - 1)
+        self.analog.update_task(channels=[self.AO_channels[ax] for ax in axes], clock_settings=clock_settings)
+        self._analog_channels = None  # not the persistent task of the moves
+        self.raster_axes = axes
+        self.voltage_array = voltage_array
+        return clock_settings
+
+    def start_raster(self, slaved=()):
+        """Write the trajectory, then start the AO task, the slaved acquisitions and finally the clock, so that
+        they all start on its first edge
+
+        Parameters
+        ----------
+        slaved: iterable of DAQmx objects whose tasks are sampled on the clock
+        """
+        self.locked = True
+        self.analog.writeAnalog(self.voltage_array.shape[1], self.voltage_array.shape[0], self.voltage_array)
+        self.analog.start()
+        for daq in slaved:
+            daq.start()
+        self.clock.start()
+        for ind, ax in enumerate(self.raster_axes):
+            self.applied_voltages[ax] = self.voltage_array[ind, -1]
+
+    def set_up_streaming(self, write_ahead=None):
+        """(Re)start the continuous output of all the AO channels on the continuously running clock
+
+        Parameters
+        ----------
+        write_ahead: float, duration (s) of the AO buffer, the latency between a queued move and its start
+        """
+        if write_ahead is None:
+            write_ahead = 4 * self.chunk_size / self.clock_frequency
+        self.stop_streaming()
+        self.chunk_size = max(int(write_ahead * self.clock_frequency / 4), 1)
+        self.clock_channel = dq.ClockCounter(self.clock_frequency,
+                                             name=self.clock_channel_name,
+                                             source="Counter")
+        self.clock.update_task(channels=[self.clock_channel], clock_settings=dq.ClockSettings(Nsamples=1))
+        self.clock.task.CfgImplicitTiming(DAQmx_Val_ContSamps, 1000)
+        self.release_tasks()  # not the persistent tasks of the clocked moves
+        clock_settings_ao = dq.ClockSettings(source="/" + self.clock_channel_name + "InternalOutput",
+                                             frequency=self.clock_frequency,
+                                             edge=dq.Edge.names()[0],
+                                             Nsamples=4 * self.chunk_size,
+                                             repetition=True)
+        self.num_ch = len(self.AO_channels)
+        self.analog.update_task(channels=list(self.AO_channels.values()), clock_settings=clock_settings_ao)
+        # the buffer only contains the samples not generated yet, a late write is an error instead of a repetition
+        self.analog.task.SetWriteRegenMode(DAQmx_Val_DoNotAllowRegen)
+
+        with self._queue_lock:
+            self._queue.clear()
+            self._queue_position = 0
+            self._queued_end = np.array([self.applied_voltages[ax] for ax in self.AO_channels.keys()])
+            self._last_output = self._queued_end.copy()
+        self._written = 0
+        self.history = RingBuffer(8 * self.chunk_size, shape=(self.num_ch,))
+        self.stream_state = PositionState(0, time.perf_counter(), np.zeros((0,)), False)
+        self.analog.register_callback(self._chunk_generated, 'Nsamples_generated', self.chunk_size)
+        for _ in range(2):  # prefill so that the generation does not underflow at start
+            self._write_chunk()
+        self.analog.start()
+        self.clock.start()
+        self.streaming = True
+        self._writer = threading.Thread(target=self._write_ahead, daemon=True)
+        self._writer.start()
+
+    def stop_streaming(self):
+        if not self.streaming:
+            return
+        self.clock.stop()
+        # the moves are interrupted where the generation stopped
+        for axis in self.AO_channels.keys():
+            self.applied_voltages[axis] = self.streamed_voltage(axis)
+        self.stream_state = self.stream_state._replace(done=True)
+        self.streaming = False
+        self.analog.stop()  # unblocks a pending write
+        if self._writer is not None:
+            self._writer.join(1.)
+            self._writer = None
+
+    def queue_move(self, axis, target, velocity, acceleration):
+        """Append a move of one axis at the end of the streamed trajectory
+
+        Parameters
+        ----------
+        axis: str, one of the keys of AO_channels
+        target: float, target voltage
+        velocity: float, maximum velocity (V/s)
+        acceleration: float, maximum acceleration (V/s^2)
+        """
+        index = list(self.AO_channels.keys()).index(axis)
+        with self._queue_lock:
+            profile = motion_profile(self._queued_end[index], target, velocity, acceleration,
+                                     1 / self.clock_frequency)
+            move = np.repeat(self._queued_end[:, None], profile.size, axis=1)
+            move[index] = profile
+            self._queue.append(move)
+            self._queued_end[index] = target
+        self.applied_voltages[axis] = target
+
+    def _next_chunk(self):
+        """Get the next chunk_size samples, from the queued moves then holding the last voltages"""
+        chunk = np.empty((self.num_ch, self.chunk_size))
+        filled = 0
+        with self._queue_lock:
+            while filled < self.chunk_size and len(self._queue) != 0:
+                move = self._queue[0]
+                N = min(self.chunk_size - filled, move.shape[1] - self._queue_position)
+                chunk[:, filled:filled + N] = move[:, self._queue_position:self._queue_position + N]
+                filled += N
+                self._queue_position += N
+                if self._queue_position == move.shape[1]:
+                    self._queue.popleft()
+                    self._queue_position = 0
+            if filled != 0:
+                self._last_output = chunk[:, filled - 1].copy()
+        chunk[:, filled:] = self._last_output[:, None]
+        return chunk
+
+    def _write_chunk(self):
+        chunk = self._next_chunk()
+        self.analog.writeAnalog(self.chunk_size, self.num_ch, chunk)  # blocks while the buffer is full
+        self.history.extend(chunk.T)
+        self._written += self.chunk_size
+
+    def _write_ahead(self):
+        while self.streaming:
+            try:
+                self._write_chunk()
+            except Exception as e:
+                if self.streaming:
+                    logger.error(f'AO streaming stopped: {e}')
+                self.streaming = False
+
+    def _chunk_generated(self, task_handle, event_type, Nsamples, callback_data):
+        self.stream_state = PositionState(self.stream_state.index + self.chunk_size, time.perf_counter(),
+                                          self.stream_state.voltages, False)
+        return 0  # mandatory for the DAQmx callback
+
+    def get_generated_samples(self):
+        """Get the number of samples per channel generated since the start of the stream, from the last
+        generation event extrapolated with the clock frequency (no driver call)"""
+        state = self.stream_state
+        if state.done:
+            return state.index
+        return min(state.index + int((time.perf_counter() - state.timestamp) * self.clock_frequency),
+                   self._written)
+
+    def streamed_voltage(self, axis):
+        """Get the voltage currently generated on the channel of axis in streaming mode"""
+        index = list(self.AO_channels.keys()).index(axis)
+        back = self._written - max(self.get_generated_samples(), 1) + 1  # from the newest written sample
+        return self.history.last(min(back, len(self.history)))[0, index]
+
+    def current_voltage(self, axis):
+        """Get the voltage currently generated on the channel of axis, from the last driver events"""
+        if self.streaming:
+            return self.streamed_voltage(axis)
+        state = self.tracker.state
+        if state.done or state.voltages.size != self.num_ch:
+            return self.applied_voltages[axis]
+        return self.tracker.voltages()[list(self.AO_channels.keys()).index(axis)]
 
     def get_max_ch_nb(self):
-        # get the max number of available AO channels of the device with the clock
+        # get the max number of available AO channels of the device with the clock, enumerated once per device
         dev = self.clock_channel_name.split('/')[0]
-        chans = self.clock.get_NIDAQ_channels(devices=[dev], source_type="Analog_Output")
-        self.max_ch_nb = len(chans)
+        if dev != self._max_ch_nb_device:
+            chans = self.clock.get_NIDAQ_channels(devices=[dev], source_type="Analog_Output")
+            self.max_ch_nb = len(chans)
+            self._max_ch_nb_device = dev
 
     def stop(self):
-        self.locked = False
+        """Abort the movement in progress at once, the scanners stay where the output was interrupted and
+        merged_move_done is emitted for the axes of the aborted trajectory"""
+        self._merge_timer.stop()
+        with self._requests_lock:
+            self._requests.clear()
+        self.stop_streaming()
+        self._abort_plan()
+        state = self.tracker.state
+        interrupted = self.locked and not state.done and state.voltages.size == self.num_ch
+        if interrupted:
+            voltages = self.tracker.voltages()
         self.clock.stop()
         self.analog.stop()
+        if interrupted:
+            for ind, ax in enumerate(self.AO_channels.keys()):
+                self.applied_voltages[ax] = voltages[ind]
+            self.tracker.hold(voltages)
+        axes = self._merged_axes
+        self._merged_axes = []
+        self.locked = False
+        if len(axes) != 0:
+            self.merged_move_done.emit(axes)
 
     def received_move_done(self):
         self.locked = False
         self.ni_card_ready_for_moving.emit()
-
@@ -0,0 +1,918 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from pymodaq.utils.data import DataFromPlugins, Axis
+from pymodaq.utils.logger import set_logger, get_module_name
+
+logger = set_logger(get_module_name(__file__))
+
+
+class RingBuffer:
+    """Preallocated circular buffer of fixed length
+
+    Samples of any shape (given at init) are stored along the first axis. Once full, the oldest samples are
+    overwritten so that the memory footprint does not depend on the acquisition duration.
+    """
+    def __init__(self, length=1000, shape=(), dtype=np.float64):
+        self._data = np.zeros((length,) + tuple(shape), dtype=dtype)
+        self._index = 0  # position of the next write
+        self._count = 0  # number of valid samples
+
+    @property
+    def length(self):
+        return self._data.shape[0]
+
+    @property
+    def shape(self):
+        return self._data.shape[1:]
+
+    def __len__(self):
+        return self._count
+
+    def is_full(self):
+        return self._count == self.length
+
+    def clear(self):
+        self._index = 0
+        self._count = 0
+
+    def append(self, value):
+        self._data[self._index] = value
+        self._index = (self._index + 1) % self.length
+        self._count = min(self._count + 1, self.length)
+
+    def extend(self, values):
+        """Add a block of samples (first axis) in at most two slice assignments"""
+        values = np.asarray(values)
+        if values.shape[0] >= self.length:
+            self._data[...] = values[-self.length:]
+            self._index = 0
+            self._count = self.length
+            return
+        N = values.shape[0]
+        first = min(N, self.length - self._index)
+        self._data[self._index:self._index + first] = values[:first]
+        self._data[:N - first] = values[first:]
+        self._index = (self._index + N) % self.length
+        self._count = min(self._count + N, self.length)
+
+    def to_array(self):
+        """Get a copy of the valid samples, from the oldest to the newest"""
+        if not self.is_full():
+            return self._data[:self._count].copy()
+        return np.concatenate((self._data[self._index:], self._data[:self._index]))
+
+    def last(self, N=1):
+        """Get a copy of the N newest samples, from the oldest to the newest"""
+        N = min(N, self._count)
+        indexes = np.arange(self._index - N, self._index) % self.length
+        return self._data[indexes]
+
+
+class RollingHistory:
+    """Plugin side history of 0D values with their timestamps, of fixed length
+
+    To be used by 0D viewers, the history can be emitted as a 1D trace with a time axis.
+    """
+    params = [{'title': 'Rolling history:', 'name': 'history', 'type': 'group', 'children': [
+        {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+        {'title': 'Length:', 'name': 'length', 'type': 'int', 'value': 1000, 'min': 2},
+        {'title': 'Emit as 1D?:', 'name': 'emit', 'type': 'bool', 'value': True},
+    ]}]
+
+    def __init__(self, length=1000, Nchannels=1):
+        self.timestamps = RingBuffer(length)
+        self.values = RingBuffer(length, shape=(Nchannels,))
+
+    @property
+    def length(self):
+        return self.timestamps.length
+
+    def reset(self, length=None, Nchannels=None):
+        if length is None:
+            length = self.length
+        if Nchannels is None:
+            Nchannels = self.values.shape[0]
+        self.timestamps = RingBuffer(length)
+        self.values = RingBuffer(length, shape=(Nchannels,))
+
+    def clear(self):
+        self.timestamps.clear()
+        self.values.clear()
+
+    def update(self, values, timestamp=None):
+        """Add one sample per channel
+
+        Parameters
+        ----------
+        values: iterable of float, one value per channel
+        timestamp: float, time in seconds (time.time() if None)
+        """
+        values = np.ravel(np.asarray(values, dtype=np.float64))
+        if values.size != self.values.shape[0]:
+            self.reset(Nchannels=values.size)
+        if timestamp is None:
+            timestamp = time.time()
+        self.timestamps.append(timestamp)
+        self.values.append(values)
+
+    def to_dwa(self, name='History', labels=None) -> DataFromPlugins:
+        """Export the history as 1D data, the time axis is relative to the newest sample"""
+        times = self.timestamps.to_array()
+        values = self.values.to_array()
+        if times.size != 0:
+            times -= times[-1]
+        return DataFromPlugins(name=name, data=list(values.T), dim='Data1D', labels=labels,
+                               axes=[Axis('Time', units='s', data=times, index=0)])
+
+
+class TimeTagStream:
+    """Convert the raw time stamps of a counter (timebase edges latched on each event) into event times
+
+    The raw values are the uint32 counts of a timebase of known frequency, they roll over every 2**32 ticks (43s at
+    100MHz). The differences are computed with the uint32 arithmetic and accumulated in int64 such that the
+    roll over is handled as long as two consecutive events are separated by less than 2**32 ticks.
+    The most recent time tags (in seconds) are kept in a ring buffer.
+    """
+    def __init__(self, timebase_frequency=100e6, length=100000):
+        self.timebase_frequency = timebase_frequency
+        self.tags = RingBuffer(length)
+        self._last_raw = None
+        self._last_ticks = 0
+
+    def clear(self):
+        self.tags.clear()
+        self._last_raw = None
+        self._last_ticks = 0
+
+    def update(self, raw_counts):
+        """Add a block of raw counts
+
+        Parameters
+        ----------
+        raw_counts: ndarray of uint32
+
+        Returns
+        -------
+        ndarray: the event times (s) of this block, relative to the start of the counter
+        """
+        raw_counts = np.asarray(raw_counts, dtype=np.uint32)
+        if raw_counts.size == 0:
+            return np.zeros((0,))
+        steps = np.empty(raw_counts.shape, dtype=np.uint32)
+        np.subtract(raw_counts[1:], raw_counts[:-1], out=steps[1:])
+        if self._last_raw is None:
+            steps[0] = raw_counts[0]  # the counter started from 0
+        else:
+            np.subtract(raw_counts[:1], self._last_raw, out=steps[:1])
+        ticks = np.cumsum(steps, dtype=np.int64)
+        ticks += self._last_ticks
+        self._last_raw = raw_counts[-1]
+        self._last_ticks = ticks[-1]
+        tags = ticks / self.timebase_frequency
+        self.tags.extend(tags)
+        return tags
+
+
+class TimeTagHistogram:
+    """Vectorized accumulation of histograms from event time tags
+
+    Two kinds of histograms are available:
+
+    * Inter-arrival: histogram of the delays between consecutive events
+    * Arrival: histogram of the delays between each event and the last sync (excitation) pulse before it, giving
+      the arrival time (or lifetime) histogram. Without the time tags of the sync pulses, the event times are taken
+      modulo period instead, which is only valid if the excitation is phase locked to the timebase of the time
+      tags (otherwise their relative drift smears the histogram)
+    """
+    modes = ['Inter-arrival', 'Arrival']
+
+    def __init__(self, bin_width=1e-6, Nbins=1000, mode='Inter-arrival', period=1e-3):
+        assert mode in self.modes
+        self.bin_width = bin_width
+        self.Nbins = int(Nbins)
+        self.mode = mode
+        self.period = period
+        self.counts = np.zeros((self.Nbins,), dtype=np.int64)
+        self._last_tag = None
+        self._syncs = np.zeros((0,))  # sync pulses kept for the events of the next blocks
+
+    @property
+    def axis(self):
+        """Lower edges of the bins in seconds"""
+        return np.arange(self.Nbins) * self.bin_width
+
+    def clear(self):
+        self.counts[:] = 0
+        self._last_tag = None
+        self._syncs = np.zeros((0,))
+
+    def update(self, tags, sync=None):
+        """Add a block of sorted event times (s) to the histogram
+
+        Parameters
+        ----------
+        tags: ndarray, the sorted event times (s) of the block
+        sync: ndarray or None, the sorted times (s) of the sync pulses in Arrival mode, including all the pulses
+            preceding the events of the block (the sync tags have to be read after the event tags). The events
+            preceding the first sync pulse are not counted.
+        """
+        tags = np.asarray(tags, dtype=np.float64)
+        if self.mode == 'Arrival' and sync is not None:
+            delays = self.sync_delays(tags, np.asarray(sync, dtype=np.float64))
+        elif tags.size == 0:
+            return self.counts
+        elif self.mode == 'Inter-arrival':
+            if self._last_tag is None:
+                delays = np.diff(tags)
+            else:
+                delays = np.diff(tags, prepend=self._last_tag)
+            self._last_tag = tags[-1]
+        else:
+            delays = np.mod(tags, self.period)
+        indexes = (delays / self.bin_width).astype(np.int64)
+        indexes = indexes[(indexes >= 0) & (indexes < self.Nbins)]
+        self.counts += np.bincount(indexes, minlength=self.Nbins)
+        return self.counts
+
+    def sync_delays(self, tags, sync):
+        """Delays between each event and the last sync pulse before it
+
+        The sync pulses from the one preceding the last event (the last one if there is no event) are kept for the
+        events of the next blocks, which may be read later than these pulses. An event preceding all the kept
+        pulses is not counted.
+        """
+        references = np.concatenate((self._syncs, sync))
+        previous = np.searchsorted(references, tags, side='right') - 1
+        first = previous[-1] if tags.size > 0 else references.size - 1
+        self._syncs = references[max(first, 0):]
+        return tags[previous >= 0] - references[previous[previous >= 0]]
+
+    def to_dwa(self, name='Histogram', labels=None) -> DataFromPlugins:
+        return DataFromPlugins(name=name, data=[self.counts.astype(np.float64)], dim='Data1D', labels=labels,
+                               axes=[Axis('Time', units='s', data=self.axis, index=0)])
+
+
+def pairs_within_window(tags_start, tags_stop, window):
+    """Get all the delays tags_stop - tags_start lying in [-window, window]
+
+    Both arrays have to be sorted, the pairs are found with a sorted search (no python loop)
+
+    Returns
+    -------
+    ndarray: the delays of all the pairs
+    """
+    lows = np.searchsorted(tags_stop, tags_start - window, side='left')
+    highs = np.searchsorted(tags_stop, tags_start + window, side='right')
+    Npairs = highs - lows
+    total = int(np.sum(Npairs))
+    if total == 0:
+        return np.zeros((0,))
+    index_start = np.repeat(np.arange(tags_start.size), Npairs)
+    # index of each stop within its own pair range, then shifted by the range start
+    offsets = np.cumsum(Npairs) - Npairs
+    index_stop = np.arange(total) - np.repeat(offsets, Npairs) + np.repeat(lows, Npairs)
+    return tags_stop[index_stop] - tags_start[index_start]
+
+
+class CrossCorrelator:
+    """Streaming cross-correlation histogram (coincidences as a function of the delay) of two event streams
+
+    Blocks of sorted time tags of both channels are added as they are acquired. Only the events of the last
+    *window* seconds of each channel are kept between blocks, to be paired with the future events of the other
+    channel, so that the memory needed does not depend on the acquisition duration. Each pair of events is
+    counted once.
+    """
+    def __init__(self, window=100e-9, bin_width=1e-9):
+        self.window = window
+        self.bin_width = bin_width
+        self.Nbins = 2 * int(np.ceil(window / bin_width))
+        self.counts = np.zeros((self.Nbins,), dtype=np.int64)
+        self._tail_start = np.zeros((0,))
+        self._tail_stop = np.zeros((0,))
+        self.Nevents = np.zeros((2,), dtype=np.int64)
+        self.duration = 0.
+
+    @property
+    def axis(self):
+        """Center of the delay bins in seconds"""
+        return (np.arange(self.Nbins) - self.Nbins / 2 + 0.5) * self.bin_width
+
+    def clear(self):
+        self.counts[:] = 0
+        self._tail_start = np.zeros((0,))
+        self._tail_stop = np.zeros((0,))
+        self.Nevents[:] = 0
+        self.duration = 0.
+
+    def update(self, tags_start, tags_stop, duration=0.):
+        """Add the new sorted events of both channels
+
+        Parameters
+        ----------
+        tags_start: ndarray, time tags (s) of the first channel
+        tags_stop: ndarray, time tags (s) of the second channel
+        duration: float, acquisition time (s) covered by these blocks, used for the normalization
+        """
+        tags_start = np.asarray(tags_start, dtype=np.float64)
+        tags_stop = np.asarray(tags_stop, dtype=np.float64)
+        # new start events with all the recent stop events, then the old start events with the new stop ones
+        delays = np.concatenate((pairs_within_window(tags_start,
+                                                     np.concatenate((self._tail_stop, tags_stop)), self.window),
+                                 pairs_within_window(self._tail_start, tags_stop, self.window)))
+        indexes = np.floor(delays / self.bin_width).astype(np.int64) + self.Nbins // 2
+        indexes = indexes[(indexes >= 0) & (indexes < self.Nbins)]
+        self.counts += np.bincount(indexes, minlength=self.Nbins)
+
+        self.Nevents += [tags_start.size, tags_stop.size]
+        self.duration += duration
+        self._tail_start = self._keep_tail(self._tail_start, tags_start, tags_stop)
+        self._tail_stop = self._keep_tail(self._tail_stop, tags_stop, tags_start)
+        return self.counts
+
+    def _keep_tail(self, tail, tags, other_tags):
+        """Keep the events that may still be paired with future events of the other channel"""
+        tags = np.concatenate((tail, tags))
+        if tags.size == 0:
+            return tags
+        # future events of the other channel come after its last event and after the ones of this channel
+        last = tags[-1] if other_tags.size == 0 else min(tags[-1], other_tags[-1])
+        return tags[np.searchsorted(tags, last - self.window, side='left'):]
+
+    def normalized(self):
+        """Coincidences normalized by the ones expected for uncorrelated events (g2)"""
+        if self.duration <= 0 or np.any(self.Nevents == 0):
+            return self.counts.astype(np.float64)
+        return self.counts * self.duration / (self.Nevents[0] * self.Nevents[1] * self.bin_width)
+
+    def to_dwa(self, name='Correlation', normalize=False, labels=None) -> DataFromPlugins:
+        data = self.normalized() if normalize else self.counts.astype(np.float64)
+        return DataFromPlugins(name=name, data=[data], dim='Data1D', labels=labels,
+                               axes=[Axis('Delay', units='s', data=self.axis, index=0)])
+
+
+def schmitt_trigger(active, inactive, armed=True):
+    """Find the activations of a condition with hysteresis, without python loop
+
+    A sample is an activation if the condition is active while the detector is armed, the detector being armed again
+    only once the condition has been inactive (the hysteresis band lying between active and inactive).
+
+    Parameters
+    ----------
+    active: ndarray of bool, samples where the condition is active
+    inactive: ndarray of bool, samples where the condition is inactive (beyond the hysteresis), exclusive of active
+    armed: bool, state of the detector before the first sample
+
+    Returns
+    -------
+    tuple: the indexes of the activations and the state of the detector after the last sample
+    """
+    states = np.where(active, 1, np.where(inactive, -1, 0))
+    states = np.concatenate(([-1 if armed else 1], states))
+    # the state of each sample is the last defined one (forward fill of the non zero states)
+    last = np.maximum.accumulate(np.where(states != 0, np.arange(states.size), 0))
+    states = states[last]
+    activations = np.flatnonzero((states[1:] == 1) & (states[:-1] == -1))
+    return activations, bool(states[-1] == -1)
+
+
+class EventDetector:
+    """Streaming software trigger on continuous blocks of samples, for events that cannot be routed to a hardware
+    trigger (a threshold on a computed channel for instance)
+
+    The condition is evaluated on a detection signal (one of the channels, or any function of them given as signal)
+    for each block at once, with an hysteresis preventing the noise to fire several events. Each event is captured
+    with pre samples before it and post samples after it (that can lie in the next blocks), the recent samples being
+    kept in a ring buffer.
+
+    Conditions:
+
+    * Rising/Falling threshold: the signal goes above/below level, armed again below level - hysteresis (above level
+      + hysteresis)
+    * Slope: the derivative of the signal (per second) goes beyond level (above if positive, below if negative)
+    * Inside/Outside window: the signal enters/leaves [level, window_top]
+    """
+    conditions = ['Rising threshold', 'Falling threshold', 'Slope', 'Inside window', 'Outside window']
+    params = [{'title': 'Event detection:', 'name': 'events', 'type': 'group', 'children': [
+        {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+        {'title': 'Channel index:', 'name': 'channel', 'type': 'int', 'value': 0, 'min': 0},
+        {'title': 'Condition:', 'name': 'condition', 'type': 'list', 'limits': conditions},
+        {'title': 'Level:', 'name': 'level', 'type': 'float', 'value': 1.},
+        {'title': 'Window top:', 'name': 'window_top', 'type': 'float', 'value': 2.},
+        {'title': 'Hysteresis:', 'name': 'hysteresis', 'type': 'float', 'value': 0.1, 'min': 0.},
+        {'title': 'Pretrigger samples:', 'name': 'pre', 'type': 'int', 'value': 100, 'min': 0},
+        {'title': 'Posttrigger samples:', 'name': 'post', 'type': 'int', 'value': 100, 'min': 1},
+    ]}]
+
+    def __init__(self, condition='Rising threshold', level=1., window_top=2., hysteresis=0.1, pre=100, post=100,
+                 sample_rate=1000., channel=0, signal=None):
+        """
+        Parameters
+        ----------
+        signal: callable, computing the detection signal of shape (Nsamples,) from a block of shape
+            (Nchannels, Nsamples), the channel of index channel if None
+        """
+        assert condition in self.conditions
+        self.condition = condition
+        self.level = level
+        self.window_top = window_top
+        self.hysteresis = hysteresis
+        self.pre = int(pre)
+        self.post = int(post)
+        self.sample_rate = sample_rate
+        self.channel = channel
+        self.signal = signal
+        self.samples = RingBuffer(0)
+        self.clear()
+
+    def clear(self):
+        self.samples.clear()
+        self._armed = True
+        self._last_value = None  # last sample of the detection signal, for the slope
+        self._Nsamples = 0  # number of samples since the start of the stream
+        self._pending = []  # indexes of the events waiting for their post samples
+
+    def detection_signal(self, block):
+        if self.signal is not None:
+            return np.asarray(self.signal(block), dtype=np.float64)
+        return block[self.channel].astype(np.float64)
+
+    def activations(self, signal):
+        """Get the conditions (active and inactive beyond the hysteresis) of the samples of the detection signal"""
+        level, hysteresis = self.level, self.hysteresis
+        if self.condition == 'Slope':
+            previous = signal[0] if self._last_value is None else self._last_value
+            signal = np.diff(signal, prepend=previous) * self.sample_rate
+            if level < 0:
+                signal, level = -signal, -level
+        if self.condition in ['Rising threshold', 'Slope']:
+            return signal >= level, signal <= level - hysteresis
+        elif self.condition == 'Falling threshold':
+            return signal <= level, signal >= level + hysteresis
+        inside = (signal >= level) & (signal <= self.window_top)
+        outside = (signal < level - hysteresis) | (signal > self.window_top + hysteresis)
+        if self.condition == 'Inside window':
+            return inside, outside
+        return outside, inside
+
+    def update(self, block):
+        """Process a block of samples of shape (Nchannels, Nsamples)
+
+        Returns
+        -------
+        list of tuple: the events whose capture is complete, (time (s) of the event since the start of the stream,
+            samples of shape (Nchannels, pre + post), the event being the sample of index pre, or less at the very
+            beginning of the stream)
+        """
+        block = np.atleast_2d(block)
+        if self.samples.length < self.pre + self.post + block.shape[1] or \
+                self.samples.shape != (block.shape[0],):
+            # the ring buffer keeps the samples of the pending events, at least one block and the pre samples
+            previous = self.samples.to_array() if self.samples.shape == (block.shape[0],) else None
+            self.samples = RingBuffer(2 * (self.pre + self.post + block.shape[1]), shape=(block.shape[0],))
+            if previous is not None and len(previous) != 0:
+                self.samples.extend(previous)
+        signal = self.detection_signal(block)
+        if signal.size == 0:
+            return []
+        indexes, self._armed = schmitt_trigger(*self.activations(signal), armed=self._armed)
+        self._last_value = signal[-1]
+        self._pending.extend(self._Nsamples + indexes)
+        self.samples.extend(block.T)
+        self._Nsamples += block.shape[1]
+
+        captures = []
+        while len(self._pending) != 0 and self._pending[0] + self.post <= self._Nsamples:
+            index = self._pending.pop(0)
+            start = max(index - self.pre, self._Nsamples - len(self.samples))
+            data = self.samples.last(self._Nsamples - start)[:index + self.post - start]
+            captures.append((index / self.sample_rate, data.T.copy()))
+        return captures
+
+    def axis(self, Nsamples):
+        """Time axis (s) of a capture of Nsamples, relative to its event"""
+        return (np.arange(Nsamples) - (Nsamples - self.post)) / self.sample_rate
+
+    def to_dwa(self, capture, name='Event', labels=None) -> DataFromPlugins:
+        time_s, data = capture
+        return DataFromPlugins(name=name, data=list(data), dim='Data1D', labels=labels,
+                               axes=[Axis('Time', units='s', data=self.axis(data.shape[1]), index=0)])
+
+
+class PulseAnalyzer:
+    """Streaming pulse height analysis of continuous blocks of samples (pulse height spectroscopy)
+
+    On each block, at once: the baseline (median of the blocks, averaged over a few of them) is subtracted, the pulses
+    are the parts of the signal above threshold (with an hysteresis), and their height (maximum) and area are
+    computed per pulse with reduceat. A pulse not finished at the end of a block is carried over to the next one.
+    The heights are accumulated in a histogram, only the histogram and the statistics of the pulses being emitted
+    instead of the raw samples.
+    """
+    params = [{'title': 'Pulse analysis:', 'name': 'pulses', 'type': 'group', 'children': [
+        {'title': 'Enable?:', 'name': 'enable', 'type': 'bool', 'value': False},
+        {'title': 'Channel index:', 'name': 'channel', 'type': 'int', 'value': 0, 'min': 0},
+        {'title': 'Polarity:', 'name': 'polarity', 'type': 'list', 'limits': ['Positive', 'Negative']},
+        {'title': 'Threshold:', 'name': 'threshold', 'type': 'float', 'value': 0.1, 'min': 0.},
+        {'title': 'Hysteresis:', 'name': 'hysteresis', 'type': 'float', 'value': 0.02, 'min': 0.},
+        {'title': 'Baseline averaging (blocks):', 'name': 'baseline_blocks', 'type': 'int', 'value': 10, 'min': 1},
+        {'title': 'Max pulse length:', 'name': 'max_length', 'type': 'int', 'value': 10000, 'min': 2},
+        {'title': 'Nbins:', 'name': 'Nbins', 'type': 'int', 'value': 1000, 'min': 1},
+        {'title': 'Max height:', 'name': 'max_height', 'type': 'float', 'value': 10., 'min': 0.},
+        {'title': 'Clear histogram:', 'name': 'clear', 'type': 'bool_push', 'value': False},
+    ]}]
+    statistics = ['Rate (pulses/s)', 'Mean height', 'Mean area', 'Baseline']
+
+    def __init__(self, threshold=0.1, hysteresis=0.02, polarity='Positive', baseline_blocks=10, max_length=10000,
+                 Nbins=1000, max_height=10., sample_rate=1000., channel=0):
+        self.threshold = threshold
+        self.hysteresis = hysteresis
+        self.sign = 1. if polarity == 'Positive' else -1.
+        self.baseline_blocks = baseline_blocks
+        self.max_length = max_length
+        self.Nbins = int(Nbins)
+        self.max_height = max_height
+        self.sample_rate = sample_rate
+        self.channel = channel
+        self.counts = np.zeros((self.Nbins,), dtype=np.int64)
+        self.clear()
+
+    @property
+    def axis(self):
+        """Lower edges of the height bins"""
+        return np.arange(self.Nbins) * (self.max_height / self.Nbins)
+
+    def clear(self):
+        self.counts[:] = 0
+        self.baseline = None
+        self._carry = np.zeros((0,))  # samples (baseline subtracted) of the pulse not finished at the end of a block
+        self._Nsamples = 0
+        self._Npulses = 0
+        self._heights_sum = 0.
+        self._areas_sum = 0.
+
+    def update(self, block):
+        """Process a block of samples of shape (Nchannels, Nsamples) or (Nsamples,)
+
+        Returns
+        -------
+        tuple of ndarray: the heights, areas (V.s) and times (s since the start of the stream, of their start) of the
+            pulses ended in this block
+        """
+        signal = np.atleast_2d(block)[self.channel].astype(np.float64) * self.sign
+        if signal.size == 0:
+            return np.zeros((0,)), np.zeros((0,)), np.zeros((0,))
+        median = np.median(signal)
+        if self.baseline is None:
+            self.baseline = median
+        else:
+            self.baseline += (median - self.baseline) / self.baseline_blocks
+        offset = self._Nsamples - self._carry.size  # index in the stream of the first sample of signal
+        signal = np.concatenate((self._carry, signal - self.baseline))
+        self._Nsamples += signal.size - self._carry.size
+
+        active = signal >= self.threshold
+        inactive = signal <= self.threshold - self.hysteresis
+        starts = schmitt_trigger(active, inactive, armed=True)[0]
+        ends = schmitt_trigger(inactive, active, armed=False)[0]
+        if starts.size > ends.size:
+            self._carry = signal[starts[-1]:]
+            if self._carry.size > self.max_length:
+                self._carry = np.zeros((0,))  # not a pulse, for instance a step of the baseline
+            starts = starts[:ends.size]
+        else:
+            self._carry = np.zeros((0,))
+        if starts.size == 0:
+            return np.zeros((0,)), np.zeros((0,)), np.zeros((0,))
+
+        bounds = np.stack((starts, ends), axis=1).ravel()
+        heights = np.maximum.reduceat(signal, bounds)[::2]
+        areas = np.add.reduceat(signal, bounds)[::2] / self.sample_rate
+        indexes = (heights * (self.Nbins / self.max_height)).astype(np.int64)
+        indexes = indexes[(indexes >= 0) & (indexes < self.Nbins)]
+        self.counts += np.bincount(indexes, minlength=self.Nbins)
+        self._Npulses += heights.size
+        self._heights_sum += np.sum(heights)
+        self._areas_sum += np.sum(areas)
+        return heights, areas, (offset + starts) / self.sample_rate
+
+    def statistics_values(self):
+        """Rate (pulses/s) since the start of the stream, mean height and area of the pulses and the baseline"""
+        Npulses = max(self._Npulses, 1)
+        return [self._Npulses * self.sample_rate / max(self._Nsamples, 1), self._heights_sum / Npulses,
+                self._areas_sum / Npulses, 0. if self.baseline is None else self.baseline * self.sign]
+
+    def to_dwa(self, name='Pulse heights', labels=None) -> DataFromPlugins:
+        return DataFromPlugins(name=name, data=[self.counts.astype(np.float64)], dim='Data1D', labels=labels,
+                               axes=[Axis('Height', units='V', data=self.axis, index=0)])
+
+    def statistics_dwa(self, name='Pulse statistics') -> DataFromPlugins:
+        return DataFromPlugins(name=name, data=[np.array([value]) for value in self.statistics_values()],
+                               dim='Data0D', labels=self.statistics)
+
+
+def periodic_waveform(shape, phases):
+    """Normalized periodic waveforms (amplitude 1, no offset) of the phases given in turns
+
+    Sinus, Square and Triangle go from -1 to 1 (starting at 0 going up for the Sinus and the Triangle), the Ramp goes
+    from 0 to 1.
+    """
+    phases = np.mod(phases, 1.)
+    if shape == 'Sinus':
+        return np.sin(2 * np.pi * phases)
+    elif shape == 'Ramp':
+        return phases
+    elif shape == 'Square':
+        return np.where(phases < 0.5, 1., -1.)
+    elif shape == 'Triangle':
+        return 1. - 2. * np.abs(2. * np.mod(phases + 0.25, 1.) - 1.)
+    raise ValueError(f'Unknown periodic waveform: {shape}')
+
+
+class WaveformLibrary:
+    """Memoized waveforms, scaled into a reused buffer
+
+    The normalized waveforms (amplitude 1, no offset) are computed once for given parameters and kept in a least
+    recently used cache of maxsize entries. Getting a waveform then only scales and offsets the cached one in place
+    into the output buffer, the transcendental functions are not evaluated again.
+    """
+    shapes = ['Sinus', 'Ramp', 'Square', 'Triangle', 'Chirp', 'Arbitrary']
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._buffer = np.zeros((0,))
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def base(self, shape, Nsamples, frequency=10., sample_rate=1000., endpoint=False, stop_frequency=100.,
+             path=''):
+        """Get the normalized waveform, from the cache if already computed
+
+        Parameters
+        ----------
+        shape: str, one of shapes
+        Nsamples: int, number of samples
+        frequency: float, frequency of the periodic waveforms, start frequency of the Chirp (Hz)
+        sample_rate: float, frequency of the sample clock (Hz)
+        endpoint: bool, if True the Ramp reaches 1 on the last sample (single ramp over the whole buffer), otherwise
+            the Ramp and the Arbitrary waveform are sampled as one period of a repeated output
+        stop_frequency: float, frequency reached at the end of the Chirp (Hz)
+        path: str, file of the Arbitrary waveform (.npy or text), resampled to Nsamples, FileNotFoundError being
+            raised if it does not exist
+
+        Returns
+        -------
+        ndarray: the cached waveform, not to be modified
+        """
+        key = (shape, Nsamples, frequency, sample_rate, endpoint)
+        if shape == 'Chirp':
+            key += (stop_frequency,)
+        elif shape == 'Arbitrary':
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f'The arbitrary waveform file {path!r} does not exist')
+            key += (path, os.path.getmtime(path))  # the file may be edited
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        time_axis = np.arange(Nsamples) / sample_rate
+        if shape == 'Ramp':
+            values = np.linspace(0, 1, Nsamples, endpoint=endpoint)
+        elif shape == 'Chirp':
+            duration = Nsamples / sample_rate
+            values = np.sin(2 * np.pi * (frequency * time_axis +
+                                         (stop_frequency - frequency) * time_axis ** 2 / (2 * duration)))
+        elif shape == 'Arbitrary':
+            data = np.load(path) if path.endswith('.npy') else np.loadtxt(path)
+            data = np.ravel(data).astype(np.float64)
+            if data.size == Nsamples:
+                values = data
+            else:
+                values = np.interp(np.linspace(0, 1, Nsamples, endpoint=endpoint),
+                                   np.linspace(0, 1, data.size, endpoint=endpoint), data)
+        else:
+            values = periodic_waveform(shape, frequency * time_axis)
+        values.flags.writeable = False
+
+        self._cache[key] = values
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return values
+
+    def waveform(self, shape, Nsamples, amplitude=1., offset=0., **kwargs):
+        """Get amplitude * base waveform + offset, computed in place into a reused buffer (valid until the next
+        call), see base for the other parameters"""
+        base = self.base(shape, Nsamples, **kwargs)
+        if self._buffer.size != Nsamples:
+            self._buffer = np.empty((Nsamples,))
+        np.multiply(base, amplitude, out=self._buffer)
+        self._buffer += offset
+        return self._buffer
+
+
+class WaveformGenerator:
+    """Phase continuous generation of a periodic waveform, block after block
+
+    The phase (in turns) is accumulated from one block to the next. Changes of the amplitude, offset or frequency
+    are applied at a given sample index, the phase being kept, so that the output has no glitch.
+    The changes can be requested from another thread than the one generating the blocks.
+    """
+    waveforms = ['Sinus', 'Ramp', 'Square', 'Triangle']
+    apply_modes = ['Next sample', 'End of period']
+
+    def __init__(self, waveform='Sinus', frequency=10., amplitude=1., offset=0., sample_rate=1000.):
+        assert waveform in self.waveforms
+        self.waveform = waveform
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.offset = offset
+        self.sample_rate = sample_rate
+        self.index = 0  # index of the next sample to generate
+        self._phase = 0.  # phase of the next sample, in turns
+        self._pending = []  # (index, parameters) of the requested changes, sorted by index
+        self._lock = threading.Lock()
+
+    def update(self, apply_at='Next sample', **parameters):
+        """Request a change of some of the parameters (amplitude, offset, frequency)
+
+        Parameters
+        ----------
+        apply_at: str or int, either one of apply_modes or the index of the sample where the change is applied
+        parameters: the new values
+        """
+        with self._lock:
+            if apply_at == 'Next sample':
+                index = self.index
+            elif apply_at == 'End of period':
+                period = self.sample_rate / self.frequency
+                index = self.index + int(np.ceil((1. - self._phase) % 1. * period))
+            else:
+                index = max(int(apply_at), self.index)
+            self._pending.append((index, parameters))
+            self._pending.sort(key=lambda change: change[0])
+
+    def _shape(self, phases):
+        return self.offset + self.amplitude * periodic_waveform(self.waveform, phases)
+
+    def generate(self, Nsamples):
+        """Get the next Nsamples of the waveform, the blocks between two changes being computed at once"""
+        values = np.empty((Nsamples,))
+        start = 0
+        with self._lock:
+            while start < Nsamples:
+                while len(self._pending) != 0 and self._pending[0][0] <= self.index + start:
+                    for key, value in self._pending.pop(0)[1].items():
+                        setattr(self, key, value)
+                stop = Nsamples if len(self._pending) == 0 else min(Nsamples, self._pending[0][0] - self.index)
+                step = self.frequency / self.sample_rate
+                values[start:stop] = self._shape((self._phase + np.arange(stop - start) * step) % 1.)
+                self._phase = (self._phase + (stop - start) * step) % 1.
+                start = stop
+            self.index += Nsamples
+        return values
+
+
+scan_patterns = ['Linear', 'Snake', 'Spiral']
+
+
+def spiral_walk(Nx, Ny):
+    """Walk along the rings of a Nx x Ny grid, from its center outwards, moving by a single pixel on each step
+
+    Returns
+    -------
+    list of (x index, y index)
+    """
+    walk = []
+    left, right, top, bottom = 0, Nx - 1, 0, Ny - 1
+    while left <= right and top <= bottom:  # walk the rings inwards, from the outer one
+        walk.extend((x, top) for x in range(left, right + 1))
+        walk.extend((right, y) for y in range(top + 1, bottom + 1))
+        if top < bottom:
+            walk.extend((x, bottom) for x in range(right - 1, left - 1, -1))
+        if left < right:
+            walk.extend((left, y) for y in range(bottom - 1, top, -1))
+        left, right, top, bottom = left + 1, right - 1, top + 1, bottom - 1
+    return walk[::-1]
+
+
+def scan_path(axes, pattern='Linear'):
+    """Order the points of a 1D or 2D grid in the sequence they are scanned
+
+    Parameters
+    ----------
+    axes: list of one or two ndarray, the positions along each axis, the first one being the fast axis
+    pattern: str, one of scan_patterns
+        Linear: each line is scanned in the same direction
+        Snake: every other line is scanned backwards (or the 1D axis forth then back)
+        Spiral: the points are scanned ring by ring from the center of the grid outwards, each step moving by a
+            single pixel
+
+    Returns
+    -------
+    indexes: ndarray of int of shape (Npoints, number of axes), the index of each point along each axis
+    positions: ndarray of shape (Npoints, number of axes)
+    """
+    axes = [np.asarray(ax, dtype=np.float64) for ax in axes]
+    shape = tuple(ax.size for ax in axes)
+    grid = np.stack([np.ravel(ind) for ind in np.meshgrid(*[np.arange(N) for N in shape], indexing='xy')], axis=1)
+    if len(axes) == 1:
+        indexes = grid if pattern != 'Snake' else np.concatenate((grid, grid[-2::-1]))
+    elif pattern == 'Snake':
+        lines = grid.reshape((shape[1], shape[0], 2))
+        lines[1::2] = lines[1::2, ::-1]
+        indexes = lines.reshape((-1, 2))
+    elif pattern == 'Spiral':
+        indexes = np.array(spiral_walk(*shape), dtype=int)
+        # each step of the spiral moves the scanner by a single pixel along a single axis
+        if not np.all(np.sum(np.abs(np.diff(indexes, axis=0)), axis=1) == 1):
+            raise RuntimeError(f'The spiral path of a {shape[0]}x{shape[1]} grid is not contiguous')
+    else:
+        indexes = grid
+    positions = np.stack([ax[indexes[:, ind]] for ind, ax in enumerate(axes)], axis=1)
+    return indexes, positions
+
+
+def pack_lines(states):
+    """Pack the states of digital lines into the uint32 words of a port (bit i being line i)
+
+    Parameters
+    ----------
+    states: ndarray of shape (Nlines, Nsamples), any non zero value being a high state
+
+    Returns
+    -------
+    ndarray of uint32 of shape (Nsamples,)
+    """
+    states = np.atleast_2d(np.asarray(states) != 0).astype(np.uint32)
+    weights = np.left_shift(np.uint32(1), np.arange(states.shape[0], dtype=np.uint32))
+    return weights @ states
+
+
+def digital_pattern(transitions, sample_rate, Nsamples, initial=0):
+    """Compute the uint32 words of a port pattern from the transitions of its lines, for instance a shutter and
+    gating sequence
+
+    Parameters
+    ----------
+    transitions: dict, line: list of (time (s), state) of its transitions, the line keeping its state until the next one
+    sample_rate: float, frequency of the sample clock of the pattern
+    Nsamples: int, number of samples of the pattern
+    initial: int, word at the start of the pattern (the state of the lines before their first transition)
+
+    Returns
+    -------
+    ndarray of uint32 of shape (Nsamples,)
+    """
+    states = np.zeros((max(list(transitions.keys()) + [int(initial).bit_length() - 1, 0]) + 1, Nsamples),
+                      dtype=np.uint8)
+    for line in range(states.shape[0]):
+        states[line] = (int(initial) >> line) & 1
+    for line, events in transitions.items():
+        for time_s, state in sorted(events):
+            states[line, int(np.round(time_s * sample_rate)):] = bool(state)
+    return pack_lines(states)
+
+
+def load_digital_pattern(path):
+    """Load a port pattern from a file (.npy or text): either the words (1D) or the states of the lines, one row
+    per line (2D)"""
+    pattern = np.load(path) if str(path).endswith('.npy') else np.loadtxt(path, ndmin=1)
+    if pattern.ndim == 2:
+        return pack_lines(pattern)
+    return np.ravel(pattern).astype(np.uint32)
+
+
+def pulse_ticks(frequencies, duty_cycles, timebase_frequency=100e6):
+    """Convert pulses defined by their frequency and duty cycle into their high and low durations in ticks of a
+    timebase, each duration being at least 2 ticks (the minimum of the counters)
+
+    Returns
+    -------
+    tuple of two ndarray of uint32: the high ticks and the low ticks of each pulse
+    """
+    period = np.maximum(np.round(timebase_frequency / np.asarray(frequencies, dtype=np.float64)), 4)
+    high = np.clip(np.round(period * np.asarray(duty_cycles, dtype=np.float64)), 2, period - 2)
+    return high.astype(np.uint32), (period - high).astype(np.uint32)
+
+
+def load_pulse_table(path):
+    """Load a table of pulses from a file (.npy or text) of two columns (or rows): the frequency (Hz) and the duty
+    cycle of each pulse, or their high and low durations in ticks
+
+    Returns
+    -------
+    tuple of two ndarray, the first and second values of each pulse
+    """
+    table = np.load(path) if str(path).endswith('.npy') else np.loadtxt(path, ndmin=2)
+    table = np.atleast_2d(table)
+    if table.shape[1] != 2:
+        table = table.T
+    if table.shape[1] != 2:
+        raise ValueError(f'A pulse table should have two columns, not {table.shape}')
+    return table[:, 0].copy(), table[:, 1].copy()
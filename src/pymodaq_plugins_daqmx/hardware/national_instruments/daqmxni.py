@@ -7,11 +7,16 @@ from pymodaq.utils.logger import set_logger, get_module_name
 from nidaqmx.constants import AcquisitionType, VoltageUnits, CurrentUnits, CurrentShuntResistorLocation, \
                                 TemperatureUnits, CJCSource, CountDirection, Level, FrequencyUnits, TimeUnits, \
                                 LineGrouping, UsageTypeAI, UsageTypeAO, UsageTypeCI, UsageTypeCO, Edge, \
-                                TerminalConfiguration, ThermocoupleType, ChannelType
+                                TerminalConfiguration, ThermocoupleType, ChannelType, CounterFrequencyMethod, \
+                                READ_ALL_AVAILABLE, EncoderType, EncoderZIndexPhase, LengthUnits, AngleUnits, \
+                                WAIT_INFINITELY, Slope, TriggerType, ActiveLevel, WindowTriggerCondition2
 
 from nidaqmx.system import System as niSystem
 from nidaqmx.system.device import Device as niDevice
 from nidaqmx import Task as niTask
+from nidaqmx.stream_readers import CounterReader, DigitalSingleChannelReader, DigitalMultiChannelReader
+from nidaqmx.stream_writers import AnalogSingleChannelWriter, AnalogMultiChannelWriter, DigitalSingleChannelWriter, \
+    DigitalMultiChannelWriter, CounterWriter
 from nidaqmx.errors import DaqError, DAQmxErrors
 from pymodaq_plugins_daqmx import config
 
@@ -44,12 +49,38 @@ class ChangeDetectionSettings(ClockSettingsBase):
 
 
 class TriggerSettings:
-    def __init__(self, trig_source='', enable=False, edge=Edge.RISING, level=0.1):
+    trigger_types = ['Start', 'Reference', 'Pause']
+    digital_gates = ['High', 'Low']
+    analog_gates = ['Above level', 'Below level', 'Inside window', 'Outside window']
+
+    def __init__(self, trig_source='', enable=False, edge=Edge.RISING, level=0.1, trigger_type='Start',
+                 pretrigger_samples=100, gate='High', window_top=1.):
+        """
+        Parameters
+        ----------
+        trig_source: str, a PFI terminal (digital trigger) or an analog input channel (analog trigger)
+        enable: bool
+        edge: Edge, edge (or slope for an analog trigger) of a Start or Reference trigger
+        level: float, level of an analog trigger, the bottom of the window for a window gate
+        trigger_type: str, one of trigger_types: the acquisition starts on the trigger (counter inputs being armed
+            by it), or the Reference trigger ends a finite acquisition keeping pretrigger_samples samples acquired
+            before it, or the acquisition is Paused while the gate is not active
+        pretrigger_samples: int, number of samples before the Reference trigger, out of the Nsamples of the task
+        gate: str, condition on the trigger source for the acquisition to run in Pause mode, one of digital_gates
+            (level of the PFI terminal) or analog_gates
+        window_top: float, top of the window for a window gate
+        """
         assert edge in Edge
+        assert trigger_type in self.trigger_types
+        assert gate in self.digital_gates + self.analog_gates
         self.trig_source = trig_source
         self.enable = enable
         self.edge = edge
         self.level = level
+        self.trigger_type = trigger_type
+        self.pretrigger_samples = pretrigger_samples
+        self.gate = gate
+        self.window_top = window_top
 
 
 class Channel:
@@ -107,6 +138,70 @@ class CIChannel(Channel):
         self.counter_type = counter_type
 
 
+class CITimestampChannel(CIChannel):
+    def __init__(self, timebase='/Dev1/100MHzTimebase', timebase_frequency=100e6, **kwargs):
+        """Counter input counting the edges of a timebase, its value latched on each edge of its sample clock
+        (for instance the change detection event of a digital input task) being the time stamp of this edge
+
+        Parameters
+        ----------
+        timebase: (str) terminal of the timebase counted
+        timebase_frequency: (float) frequency of the timebase in Hz, to convert the counts into seconds
+        """
+        super().__init__(counter_type=UsageTypeCI.COUNT_EDGES, **kwargs)
+        self.timebase = timebase
+        self.timebase_frequency = timebase_frequency
+
+
+class CIFrequencyChannel(CIChannel):
+    def __init__(self, value_min=2., value_max=100., meas_method=CounterFrequencyMethod.LOW_FREQUENCY_1_COUNTER,
+                 meas_time=1e-3, divisor=4, **kwargs):
+        """Counter input measuring the frequency (Hz) of the signal on its input terminal
+
+        Parameters
+        ----------
+        value_min: (float) minimum expected frequency
+        value_max: (float) maximum expected frequency
+        meas_method: (CounterFrequencyMethod) measurement method, 1 counter for low frequencies
+        meas_time: (float) measurement time (s), for the HIGH_FREQUENCY_2_COUNTERS method
+        divisor: (int) number of periods averaged, for the LARGE_RANGE_2_COUNTERS method
+        """
+        super().__init__(counter_type=UsageTypeCI.FREQUENCY, **kwargs)
+        assert meas_method in CounterFrequencyMethod
+        self.value_min = value_min
+        self.value_max = value_max
+        self.meas_method = meas_method
+        self.meas_time = meas_time
+        self.divisor = divisor
+
+
+class CIPeriodChannel(CIFrequencyChannel):
+    def __init__(self, value_min=1e-6, value_max=0.1, **kwargs):
+        """Counter input measuring the period (s) of the signal on its input terminal, see CIFrequencyChannel"""
+        super().__init__(value_min=value_min, value_max=value_max, **kwargs)
+        self.counter_type = UsageTypeCI.PERIOD
+
+
+class CIEncoderChannel(CIChannel):
+    def __init__(self, counter_type=UsageTypeCI.POSITION_LINEAR_ENCODER, decoding_type=EncoderType.X_4,
+                 dist_per_pulse=1e-6, pulses_per_rev=1000, **kwargs):
+        """Counter input decoding the A/B signals of a quadrature encoder into a position
+
+        Parameters
+        ----------
+        counter_type: (UsageTypeCI) POSITION_LINEAR_ENCODER (meters) or POSITION_ANGULAR_ENCODER (degrees)
+        decoding_type: (EncoderType)
+        dist_per_pulse: (float) distance (m) of one pulse, for the linear encoders
+        pulses_per_rev: (int) number of pulses per revolution, for the angular encoders
+        """
+        assert counter_type in [UsageTypeCI.POSITION_LINEAR_ENCODER, UsageTypeCI.POSITION_ANGULAR_ENCODER]
+        super().__init__(counter_type=counter_type, **kwargs)
+        assert decoding_type in EncoderType
+        self.decoding_type = decoding_type
+        self.dist_per_pulse = dist_per_pulse
+        self.pulses_per_rev = pulses_per_rev
+
+
 class COChannel(Channel):
     def __init__(self, edge=Edge.RISING, counter_type=UsageTypeCO.PULSE_FREQUENCY, **kwargs):
         super().__init__(**kwargs)
@@ -124,9 +219,45 @@ class ClockCounter(COChannel):
         self.counter_type = counter_type
 
 
+class COPulseChannel(COChannel):
+    def __init__(self, frequency=1000., duty_cycle=0.5, high_ticks=100, low_ticks=100, timebase='',
+                 idle_state=Level.LOW, initial_delay=0., counter_type=UsageTypeCO.PULSE_FREQUENCY, **kwargs):
+        """Pulse train generated by a counter output, each pulse being defined either by its frequency and duty
+        cycle (PULSE_FREQUENCY) or by its high and low durations in ticks of a timebase (PULSE_TICKS). With a finite
+        or continuous implicit timing, a buffer of pulses (one sample per pulse) can be written on the task
+
+        Parameters
+        ----------
+        frequency: float, frequency (Hz) of the pulses (PULSE_FREQUENCY)
+        duty_cycle: float, ratio of the high duration over the period (PULSE_FREQUENCY)
+        high_ticks: int, high duration of the pulses in ticks of the timebase (PULSE_TICKS)
+        low_ticks: int, low duration of the pulses in ticks of the timebase (PULSE_TICKS)
+        timebase: str, terminal of the timebase, for instance /Dev1/100MHzTimebase (PULSE_TICKS)
+        idle_state: Level, state of the output when the task is stopped, the pulses being the other state
+        initial_delay: float, delay before the first pulse, in s (PULSE_FREQUENCY) or in ticks (PULSE_TICKS)
+        """
+        super().__init__(counter_type=counter_type, **kwargs)
+        assert counter_type in [UsageTypeCO.PULSE_FREQUENCY, UsageTypeCO.PULSE_TICKS]
+        assert idle_state in Level
+        self.frequency = frequency
+        self.duty_cycle = duty_cycle
+        self.high_ticks = high_ticks
+        self.low_ticks = low_ticks
+        self.timebase = timebase
+        self.idle_state = idle_state
+        self.initial_delay = initial_delay
+
+
 class DigitalChannel(Channel):
-    def __init__(self, **kwargs):
+    def __init__(self, line_grouping=LineGrouping.CHAN_PER_LINE, **kwargs):
+        """
+        Parameters
+        ----------
+        line_grouping: LineGrouping, CHAN_FOR_ALL_LINES if the name of the channel is a port (DevX/portY), written as
+            uint32 words
+        """
         super().__init__(**kwargs)
+        self.line_grouping = line_grouping
 
 
 class DOChannel(DigitalChannel):
@@ -152,6 +283,11 @@ class NIDAQmx:
         self.callback_data = None
         self.is_scalar = True
         self.write_buffer = np.array([0.])  # ou est utilisé ce buffer??
+        self.counter_reader = None
+        self.counter_buffer = np.zeros((0,))
+        self.digital_reader = None
+        self.digital_buffer = np.zeros((0,), dtype=np.uint32)
+        self.onboard_memory = False  # True if the AO channels of the task only use the onboard memory
 
     @property
     def task(self):
@@ -321,6 +457,19 @@ class NIDAQmx:
             pass
         logger.info("       ********** CONFIGURATION SEQUENCE SUCCESSFULLY ENDED **********")
 
+    @classmethod
+    def get_NIDAQ_ports(cls, devices=None, source_type=ChannelType.DIGITAL_OUTPUT):
+        """Get the list of the digital ports (to be used with CHAN_FOR_ALL_LINES) of the connected devices"""
+        if devices is None:
+            devices = cls.get_NIDAQ_devices().device_names
+        ports = []
+        for device in devices:
+            if source_type == ChannelType.DIGITAL_OUTPUT:
+                ports.extend(niDevice(device).do_ports.channel_names)
+            else:
+                ports.extend(niDevice(device).di_ports.channel_names)
+        return ports
+
     @classmethod
     def getAOMaxRate(cls, device):
         return niDevice(device).ao_max_rate
@@ -364,6 +513,9 @@ class NIDAQmx:
 
                 self._task = None
                 self.c_callback = None
+                self.counter_reader = None
+                self.digital_reader = None
+            self.onboard_memory = False
 
             self._task = niTask()
             logger.info("TASK: {}".format(self._task))
@@ -429,14 +581,50 @@ class NIDAQmx:
                 elif channel.source == ChannelType.COUNTER_INPUT:  # counter input
                     try:
                         if channel.counter_type == UsageTypeCI.COUNT_EDGES:
-                            self._task.ci_channels.add_ci_count_edges_chan(channel.name, "",
-                                                                           channel.edge, 0,
-                                                                           CountDirection.COUNT_UP)
+                            ci_channel = self._task.ci_channels.add_ci_count_edges_chan(channel.name, "",
+                                                                                        channel.edge, 0,
+                                                                                        CountDirection.COUNT_UP)
+                            if isinstance(channel, CITimestampChannel):
+                                ci_channel.ci_count_edges_term = channel.timebase
                         elif channel.counter_type == UsageTypeCI.PULSE_WIDTH_DIGITAL_SEMI_PERIOD:
                             self._task.ci_channels.add_ci_semi_period_chan(channel.name, "counter task",
                                                                            0,  # expected min
                                                                            channel.value_max,  # expected max
                                                                            TimeUnits.TICKS, "")
+                        elif channel.counter_type == UsageTypeCI.FREQUENCY:
+                            self._task.ci_channels.add_ci_freq_chan(channel.name, "",
+                                                                    channel.value_min,
+                                                                    channel.value_max,
+                                                                    FrequencyUnits.HZ,
+                                                                    channel.edge,
+                                                                    channel.meas_method,
+                                                                    channel.meas_time,
+                                                                    channel.divisor)
+                        elif channel.counter_type == UsageTypeCI.POSITION_LINEAR_ENCODER:
+                            self._task.ci_channels.add_ci_lin_encoder_chan(channel.name, "",
+                                                                           channel.decoding_type,
+                                                                           False, 0.,
+                                                                           EncoderZIndexPhase.AHIGH_BHIGH,
+                                                                           LengthUnits.METERS,
+                                                                           channel.dist_per_pulse,
+                                                                           0.)
+                        elif channel.counter_type == UsageTypeCI.POSITION_ANGULAR_ENCODER:
+                            self._task.ci_channels.add_ci_ang_encoder_chan(channel.name, "",
+                                                                           channel.decoding_type,
+                                                                           False, 0.,
+                                                                           EncoderZIndexPhase.AHIGH_BHIGH,
+                                                                           AngleUnits.DEGREES,
+                                                                           channel.pulses_per_rev,
+                                                                           0.)
+                        elif channel.counter_type == UsageTypeCI.PERIOD:
+                            self._task.ci_channels.add_ci_period_chan(channel.name, "",
+                                                                      channel.value_min,
+                                                                      channel.value_max,
+                                                                      TimeUnits.SECONDS,
+                                                                      channel.edge,
+                                                                      channel.meas_method,
+                                                                      channel.meas_time,
+                                                                      channel.divisor)
 
                     except DaqError as e:
                         err_code = e.error_code
@@ -450,7 +638,21 @@ class NIDAQmx:
                         raise IOError(status)
                 elif channel.source == ChannelType.COUNTER_OUTPUT:  # counter output
                     try:
-                        if channel.counter_type == UsageTypeCO.PULSE_FREQUENCY:
+                        if isinstance(channel, COPulseChannel) and \
+                                channel.counter_type == UsageTypeCO.PULSE_TICKS:
+                            self._task.co_channels.add_co_pulse_chan_ticks(channel.name, channel.timebase, "",
+                                                                           channel.idle_state,
+                                                                           int(channel.initial_delay),
+                                                                           channel.low_ticks,
+                                                                           channel.high_ticks)
+                        elif isinstance(channel, COPulseChannel):
+                            self._task.co_channels.add_co_pulse_chan_freq(channel.name, "",
+                                                                          FrequencyUnits.HZ,
+                                                                          channel.idle_state,
+                                                                          channel.initial_delay,
+                                                                          channel.frequency,
+                                                                          channel.duty_cycle)
+                        elif channel.counter_type == UsageTypeCO.PULSE_FREQUENCY:
                             self._task.co_channels.add_co_pulse_chan_freq(channel.name, "clock task",
                                                                           FrequencyUnits.HZ,
                                                                           Level.LOW,
@@ -470,8 +672,7 @@ class NIDAQmx:
                         raise IOError(status)
                 elif channel.source == ChannelType.DIGITAL_OUTPUT:
                     try:
-                        self._task.do_channels.add_do_chan(channel.name, "",
-                                                           LineGrouping.CHAN_PER_LINE)
+                        self._task.do_channels.add_do_chan(channel.name, "", channel.line_grouping)
                     except DaqError as e:
                         err_code = e.error_code
                     if not not err_code:
@@ -479,8 +680,7 @@ class NIDAQmx:
                         raise IOError(status)
                 elif channel.source == ChannelType.DIGITAL_INPUT:  # Digital_Input
                     try:
-                        self._task.di_channels.add_di_chan(channel.name, "",
-                                                           LineGrouping.CHAN_PER_LINE)
+                        self._task.di_channels.add_di_chan(channel.name, "", channel.line_grouping)
                     except DaqError as e:
                         err_code = e.error_code
                     if not not err_code:
@@ -494,7 +694,12 @@ class NIDAQmx:
                 mode = AcquisitionType.FINITE
             if clock_settings.Nsamples > 1 and isinstance(err_code, type(None)):
                 try:
-                    if isinstance(clock_settings, ClockSettings):
+                    if isinstance(clock_settings, ClockSettings) and clock_settings.source is None and \
+                            self.is_implicitly_timed(channels):
+                        # one sample per measured period of the input signal or per generated pulse, no sample
+                        # clock needed
+                        self._task.timing.cfg_implicit_timing(mode, clock_settings.Nsamples)
+                    elif isinstance(clock_settings, ClockSettings):
                         self._task.timing.cfg_samp_clk_timing(clock_settings.frequency,
                                                               clock_settings.source,
                                                               clock_settings.edge,
@@ -512,30 +717,74 @@ class NIDAQmx:
                     logger.error(traceback.format_exc())
                     raise IOError(status)
 
-            for channel in channels:
-                if not trigger_settings.enable:
-                    if channel.source == ChannelType.COUNTER_INPUT:
-                        pass  # Maybe here adding the configuration fastCTr0 with Ctr1 etc...?
-                    else:
-                        pass
-                        # err = self._task.triggers.start_trigger.disable_start_trig()
-                        # if err != 0:
-                        #     raise IOError(self.DAQmxGetErrorString(err))
-                else:
-                    if 'PF' in trigger_settings.trig_source:
-                        self._task.triggers.start_trigger.disable_start_trig()
-                    elif 'ai' in trigger_settings.trig_source:
-                        self._task.triggers.start_trigger.cfg_anlg_edge_start_trig(
-                            trigger_settings.trig_source,
-                            Edge[trigger_settings.edge],
-                            trigger_settings.level)
-                    else:
-                        raise IOError('Unsupported Trigger source')
+            # configure the triggering, for the whole task
+            if trigger_settings.enable:
+                try:
+                    self.configure_trigger(channels, trigger_settings)
+                except DaqError as e:
+                    err_code = e.error_code
+                if not not err_code:
+                    status = self.DAQmxGetErrorString(err_code)
+                    raise IOError(status)
             logger.info("Task's channels{}".format(self._task.ai_channels.channel_names))
         except Exception as e:
             logger.error("Exception caught: {}".format(e))
             logger.error(traceback.format_exc())
 
+    def configure_trigger(self, channels, trigger_settings):
+        """Configure the trigger of the task: a start trigger (an arm start trigger for counter inputs, that have no
+        start trigger), a reference trigger or a pause trigger gating the acquisition
+
+        Parameters
+        ----------
+        channels: list of Channel, the channels of the task
+        trigger_settings: TriggerSettings
+        """
+        source = trigger_settings.trig_source
+        digital = 'PF' in source
+        if not digital and 'ai' not in source:
+            raise IOError('Unsupported Trigger source')
+        triggers = self._task.triggers
+        if trigger_settings.trigger_type == 'Pause':
+            # the acquisition (samples or counted edges) only runs while the gate is active
+            if digital:
+                triggers.pause_trigger.trig_type = TriggerType.DIGITAL_LEVEL
+                triggers.pause_trigger.dig_lvl_src = source
+                triggers.pause_trigger.dig_lvl_when = Level.LOW if trigger_settings.gate == 'High' else Level.HIGH
+            elif 'window' in trigger_settings.gate:
+                triggers.pause_trigger.trig_type = TriggerType.ANALOG_WINDOW
+                triggers.pause_trigger.anlg_win_src = source
+                triggers.pause_trigger.anlg_win_btm = trigger_settings.level
+                triggers.pause_trigger.anlg_win_top = trigger_settings.window_top
+                triggers.pause_trigger.anlg_win_when = WindowTriggerCondition2.OUTSIDE_WINDOW \
+                    if trigger_settings.gate == 'Inside window' else WindowTriggerCondition2.INSIDE_WINDOW
+            else:
+                triggers.pause_trigger.trig_type = TriggerType.ANALOG_LEVEL
+                triggers.pause_trigger.anlg_lvl_src = source
+                triggers.pause_trigger.anlg_lvl_lvl = trigger_settings.level
+                triggers.pause_trigger.anlg_lvl_when = ActiveLevel.BELOW \
+                    if trigger_settings.gate == 'Above level' else ActiveLevel.ABOVE
+        elif trigger_settings.trigger_type == 'Reference':
+            # finite acquisition only, pretrigger_samples being kept before the trigger
+            if digital:
+                triggers.reference_trigger.cfg_dig_edge_ref_trig(source, trigger_settings.pretrigger_samples,
+                                                                 trigger_settings.edge)
+            else:
+                triggers.reference_trigger.cfg_anlg_edge_ref_trig(source, trigger_settings.pretrigger_samples,
+                                                                  Slope[trigger_settings.edge.name],
+                                                                  trigger_settings.level)
+        elif any([channel.source == ChannelType.COUNTER_INPUT for channel in channels]):
+            if not digital:
+                raise IOError('Counter inputs can only be armed by a digital trigger')
+            triggers.arm_start_trigger.trig_type = TriggerType.DIGITAL_EDGE
+            triggers.arm_start_trigger.dig_edge_src = source
+            triggers.arm_start_trigger.dig_edge_edge = trigger_settings.edge
+        elif digital:
+            triggers.start_trigger.cfg_dig_edge_start_trig(source, trigger_settings.edge)
+        else:
+            triggers.start_trigger.cfg_anlg_edge_start_trig(source, Slope[trigger_settings.edge.name],
+                                                            trigger_settings.level)
+
     def register_callback(self, callback, event='done', nsamples=1):
 
         if event == 'done':
@@ -545,18 +794,204 @@ class NIDAQmx:
         elif event == 'Nsamples':
             self._task.register_every_n_samples_acquired_into_buffer_event(nsamples, callback)
 
-    def readCounter(self):
-        #    return 25
+    @classmethod
+    def is_implicitly_timed(cls, channels):
+        """Check if the channels are frequency or period counter inputs, sampled on each period of their signal, or
+        pulse train counter outputs, one sample being one pulse"""
+        return len(channels) != 0 and all([(channel.source == ChannelType.COUNTER_INPUT and
+                                            channel.counter_type in [UsageTypeCI.FREQUENCY, UsageTypeCI.PERIOD]) or
+                                           isinstance(channel, COPulseChannel)
+                                           for channel in channels])
+
+    def readCounter(self, Nsamples=READ_ALL_AVAILABLE, timeout=10.):
+        """Read a block of samples of a counter input task
+
+        For a single channel the samples are read into a reused buffer with a stream reader, without the
+        conversion to python lists done by task.read
+
+        Returns
+        -------
+        ndarray: the samples, shape (Nsamples,) for a single channel, (Nchannels, Nsamples) otherwise
+        """
+        if len(self._task.channel_names) != 1:
+            return np.array(self._task.read(Nsamples, timeout=timeout))
+        if Nsamples == READ_ALL_AVAILABLE:
+            Nsamples = self._task.in_stream.avail_samp_per_chan
+        if self.counter_buffer.size < Nsamples:
+            self.counter_buffer = np.zeros((Nsamples,))
+        read = self.readCounterBuffer(self.counter_buffer, Nsamples, timeout=timeout)
+        return self.counter_buffer[:read].copy()
+
+    def readCounterBuffer(self, buffer, Nsamples=READ_ALL_AVAILABLE, timeout=10.):
+        """Read the samples of a single channel counter input task into a preallocated float64 buffer (or uint32
+        buffer for the raw counts of an edge counter)
+
+        Returns
+        -------
+        int: the number of samples read
+        """
+        if self.counter_reader is None:
+            self.counter_reader = CounterReader(self._task.in_stream)
+        if Nsamples == READ_ALL_AVAILABLE:
+            Nsamples = min(self._task.in_stream.avail_samp_per_chan, buffer.size)
+        # the reader checks that the array size matches the number of samples
+        if buffer.dtype == np.uint32:
+            return self.counter_reader.read_many_sample_uint32(buffer[:Nsamples],
+                                                               number_of_samples_per_channel=Nsamples,
+                                                               timeout=timeout)
+        return self.counter_reader.read_many_sample_double(buffer[:Nsamples],
+                                                           number_of_samples_per_channel=Nsamples,
+                                                           timeout=timeout)
+
+    def readDigital(self, Nsamples=READ_ALL_AVAILABLE, timeout=10.):
+        """Read a block of samples of a (sample clocked or change detection) digital input task, as one uint32 word
+        per sample and channel (bit i being line i of a port channel), into a buffer reused from one read to the
+        next
+
+        Returns
+        -------
+        ndarray of uint32 of shape (Nchannels, Nsamples read), a view of the reused buffer
+        """
+        Nchannels = len(self._task.channel_names)
+        if Nsamples == READ_ALL_AVAILABLE:
+            Nsamples = self._task.in_stream.avail_samp_per_chan
+        if self.digital_buffer.size < Nchannels * Nsamples:
+            self.digital_buffer = np.zeros((Nchannels * Nsamples,), dtype=np.uint32)
+        # contiguous view of the reused buffer, as expected by the readers
+        buffer = self.digital_buffer[:Nchannels * Nsamples].reshape((Nchannels, Nsamples))
+        if Nsamples == 0:
+            return buffer
+        if Nchannels == 1:
+            if self.digital_reader is None:
+                self.digital_reader = DigitalSingleChannelReader(self._task.in_stream)
+            read = self.digital_reader.read_many_sample_port_uint32(buffer[0], number_of_samples_per_channel=Nsamples,
+                                                                     timeout=timeout)
+        else:
+            if self.digital_reader is None:
+                self.digital_reader = DigitalMultiChannelReader(self._task.in_stream)
+            read = self.digital_reader.read_many_sample_port_uint32(buffer, number_of_samples_per_channel=Nsamples,
+                                                                     timeout=timeout)
+        return buffer[:, :read]
+
+    def writeAnalog(self, Nsamples, Nchannels, values, autostart=False, onboard_memory=False):
+        """Write Nsamples on the Nchannels analog output channels of the task
+
+        Parameters
+        ----------
+        Nsamples: int, number of samples to write on each channel
+        Nchannels: int, number of AO channels defined in the task
+        values: ndarray of size Nsamples * Nchannels, grouped by channel
+        autostart: bool, start the task with the write
+        onboard_memory: bool, for a regenerated (periodic) output written before starting the task: if the device
+            supports it, the samples are uploaded once into its onboard memory and regenerated from there, without
+            any transfer from the host while the task runs
+        """
+        if np.prod(values.shape) != Nsamples * Nchannels:
+            raise ValueError(f'The shape of analog outputs values is incorrect, should be {Nsamples} x {Nchannels}')
+        values = np.ascontiguousarray(values, dtype=np.float64).reshape((Nchannels, Nsamples))
+        self.write_buffer = values
+        self.is_scalar = Nsamples == 1
+        if Nsamples > 1:
+            onboard_memory = onboard_memory and Nsamples * Nchannels <= self.get_onboard_buffer_size()
+            if onboard_memory != self.onboard_memory:
+                self.set_onboard_memory(onboard_memory)
+        if Nchannels == 1:
+            writer = AnalogSingleChannelWriter(self._task.out_stream, auto_start=autostart)
+            if self.is_scalar:
+                writer.write_one_sample(values[0, 0], timeout=WAIT_INFINITELY)
+            else:
+                writer.write_many_sample(values[0], timeout=WAIT_INFINITELY)
+        else:
+            writer = AnalogMultiChannelWriter(self._task.out_stream, auto_start=autostart)
+            if self.is_scalar:
+                writer.write_one_sample(values[:, 0].copy(), timeout=WAIT_INFINITELY)
+            else:
+                writer.write_many_sample(values, timeout=WAIT_INFINITELY)
+
+    def writeDigitalPort(self, Nsamples, Nchannels, values, autostart=False, timeout=10.):
+        """Write Nsamples uint32 words on each of the Nchannels port channels of the task (CHAN_FOR_ALL_LINES), all
+        the lines of a port being set at once by a single word
+
+        Parameters
+        ----------
+        Nsamples: int, number of samples to write on each channel, a whole clocked pattern or a single word
+        Nchannels: int, number of port channels defined in the task
+        values: ndarray of size Nsamples * Nchannels, grouped by channel, bit i of a word being line i of the port
+        autostart: bool, start the task with the write
+        timeout: float, maximum time (s) to wait for space in the buffer
+        """
+        if np.prod(values.shape) != Nsamples * Nchannels:
+            raise ValueError(f'The shape of digital outputs values is incorrect, should be {Nsamples} x {Nchannels}')
+        values = np.ascontiguousarray(values, dtype=np.uint32).reshape((Nchannels, Nsamples))
+        if Nchannels == 1:
+            writer = DigitalSingleChannelWriter(self._task.out_stream, auto_start=autostart)
+            if Nsamples == 1:
+                writer.write_one_sample_port_uint32(int(values[0, 0]), timeout=timeout)
+            else:
+                writer.write_many_sample_port_uint32(values[0], timeout=timeout)
+        else:
+            writer = DigitalMultiChannelWriter(self._task.out_stream, auto_start=autostart)
+            if Nsamples == 1:
+                writer.write_one_sample_port_uint32(values[:, 0].copy(), timeout=timeout)
+            else:
+                writer.write_many_sample_port_uint32(values, timeout=timeout)
+
+    def writeCounterFrequency(self, frequencies, duty_cycles, autostart=False, timeout=10.):
+        """Write the pulses of a PULSE_FREQUENCY counter output task in a single call, one sample per pulse
 
-        time.sleep(1)
-        self.value = self._task.read()
+        On a task with an implicit timing, the buffer is generated once (finite) or regenerated (continuous) when the
+        task starts. A single pulse written on a running continuous task changes the pulses generated on the fly.
 
-        #    t = Timer(counting_time,self.read)
-        #    self._task.start()
-        #    t.start()
-        #    time.sleep(2*counting_time)
-        #    print(self.value)
-        return self.value
+        Parameters
+        ----------
+        frequencies: ndarray, frequency (Hz) of each pulse
+        duty_cycles: ndarray or float, duty cycle of each pulse (or of all of them)
+        autostart: bool, start the task with the write
+        timeout: float, maximum time (s) to wait for space in the buffer
+        """
+        frequencies = np.ascontiguousarray(np.atleast_1d(frequencies), dtype=np.float64)
+        duty_cycles = np.ascontiguousarray(np.broadcast_to(duty_cycles, frequencies.shape), dtype=np.float64)
+        writer = CounterWriter(self._task.out_stream, auto_start=autostart)
+        if frequencies.size == 1:
+            writer.write_one_sample_pulse_frequency(float(frequencies[0]), float(duty_cycles[0]), timeout=timeout)
+        else:
+            writer.write_many_sample_pulse_frequency(frequencies, duty_cycles, timeout=timeout)
+
+    def writeCounterTicks(self, high_ticks, low_ticks, autostart=False, timeout=10.):
+        """Write the pulses of a PULSE_TICKS counter output task in a single call, one sample per pulse, see
+        writeCounterFrequency
+
+        Parameters
+        ----------
+        high_ticks: ndarray, high duration of each pulse in ticks of the timebase of the channel
+        low_ticks: ndarray, low duration of each pulse in ticks of the timebase of the channel
+        autostart: bool, start the task with the write
+        timeout: float, maximum time (s) to wait for space in the buffer
+        """
+        high_ticks = np.ascontiguousarray(np.atleast_1d(high_ticks), dtype=np.uint32)
+        low_ticks = np.ascontiguousarray(np.broadcast_to(low_ticks, high_ticks.shape), dtype=np.uint32)
+        writer = CounterWriter(self._task.out_stream, auto_start=autostart)
+        if high_ticks.size == 1:
+            writer.write_one_sample_pulse_ticks(int(high_ticks[0]), int(low_ticks[0]), timeout=timeout)
+        else:
+            writer.write_many_sample_pulse_ticks(high_ticks, low_ticks, timeout=timeout)
+
+    def get_onboard_buffer_size(self):
+        """Number of samples the onboard buffer of the output device of the task can hold, 0 if not available"""
+        try:
+            return self._task.out_stream.output_onbrd_buf_size
+        except DaqError:
+            return 0
+
+    def set_onboard_memory(self, enable=True):
+        """Regenerate the samples of the AO channels of the (stopped) task from the onboard memory only, if enable"""
+        self.onboard_memory = enable
+        try:
+            self._task.ao_channels.all.ao_use_only_on_brd_mem = enable
+        except DaqError as e:
+            if enable:
+                logger.info(f'Onboard memory not used: {e}')
+                self.set_onboard_memory(False)
 
     @classmethod
     def getAIVoltageRange(cls, device='Dev1'):
@@ -584,6 +1019,7 @@ class NIDAQmx:
             self._task.stop()
             self._task.close()
             self._task = None
+            self.counter_reader = None
 
     @classmethod
     def DAQmxGetErrorString(cls, error_code):
@@ -0,0 +1,128 @@
+from typing import List, Tuple
+
+import numpy as np
+from pymodaq.utils.data import Axis, DataDistribution
+from pymodaq.utils.math_utils import linspace_step
+from pymodaq.utils.scanner.scan_factory import ScannerFactory, ScannerBase
+
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_objects import AO_with_clock_DAQmx, ScanPlan
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import scan_path, scan_patterns
+
+
+def scanner_axis(actuator):
+    """Get the axis of the DAQmx_MultipleScannerControl actuator, None if actuator is another kind of actuator"""
+    try:
+        if actuator.actuator == 'DAQmx_MultipleScannerControl':
+            return actuator.settings['move_settings', 'multiaxes', 'axis']
+    except (AttributeError, KeyError):  # not initialized or not a DAQ_Move
+        pass
+    return None
+
+
+def scanner_controller(actuator):
+    """Get the AO_with_clock_DAQmx controller of the DAQmx_MultipleScannerControl actuator, None otherwise"""
+    if scanner_axis(actuator) is None:
+        return None
+    controller = getattr(actuator, 'controller', None)
+    return controller if isinstance(controller, AO_with_clock_DAQmx) else None
+
+
+class DAQmxScannerBase(ScannerBase):
+    """Scanner compiling a 1D or 2D grid into a ScanPlan
+
+    The points are scanned in the order of the pattern (see scan_path). Each time the scan is set, the plan is
+    published to the AO_with_clock_DAQmx controllers of its actuators, so that the DAQmx_MultipleScannerControl actuators with
+    hardware timed scans enabled output the whole scan at once on their clock, each point being held for the dwell
+    time, instead of one clocked move per point. The other actuators of the scan are moved as usual.
+    """
+    distribution = DataDistribution['uniform']
+    n_axes = 1
+
+    def __init__(self, actuators: List = None, **_ignored):
+        self.axes_values = []
+        super().__init__(actuators=actuators)
+
+    def set_scan(self):
+        self.axes_values = [linspace_step(self.settings[f'axis{ind + 1}', 'start'],
+                                          self.settings[f'axis{ind + 1}', 'stop'],
+                                          self.settings[f'axis{ind + 1}', 'step']) for ind in range(self.n_axes)]
+        self.axes_indexes, self.positions = scan_path(self.axes_values, self.settings['pattern'])
+        self.axes_unique = self.axes_values
+        self.n_steps = self.positions.shape[0]
+        actuators = self.actuators if self.actuators is not None else []
+        axes = [scanner_axis(actuators[ind]) if ind < len(actuators) else None for ind in range(self.n_axes)]
+        scan_plan = ScanPlan(axes, self.positions, self.settings['dwell_time'] * 1e-3)
+        for actuator in actuators:
+            controller = scanner_controller(actuator)
+            if controller is not None:
+                controller.set_scan_plan(scan_plan)
+
+    def set_settings_titles(self):
+        if self.actuators is not None and len(self.actuators) == self.n_axes:
+            for ind, actuator in enumerate(self.actuators):
+                self.settings.child(f'axis{ind + 1}').setOpts(title=f'{actuator.title}:')
+
+    def evaluate_steps(self) -> int:
+        Nsteps = 1
+        for ind in range(self.n_axes):
+            start, stop, step = [self.settings[f'axis{ind + 1}', name] for name in ['start', 'stop', 'step']]
+            if step == 0:
+                return 0
+            Nsteps *= int(np.abs((stop - start) / step) + 1)
+        if self.n_axes == 1 and self.settings['pattern'] == 'Snake':
+            Nsteps = 2 * Nsteps - 1
+        return Nsteps
+
+    def get_nav_axes(self) -> List[Axis]:
+        actuators = self.actuators if self.actuators is not None else []
+        return [Axis(label=actuators[ind].title if ind < len(actuators) else f'axis{ind + 1}',
+                     units=actuators[ind].units if ind < len(actuators) else '',
+                     data=np.squeeze(self.axes_values[ind]), index=ind) for ind in range(self.n_axes)]
+
+    def get_scan_shape(self) -> Tuple[int]:
+        return tuple(len(values) for values in self.axes_values)
+
+    def get_indexes_from_scan_index(self, scan_index: int) -> Tuple[int]:
+        return tuple(self.axes_indexes[scan_index])
+
+    def update_from_scan_selector(self, scan_selector):
+        pass
+
+
+@ScannerFactory.register()
+class Scan1DDAQmx(DAQmxScannerBase):
+    """Hardware timed 1D scan, the Snake pattern scans forth then back"""
+    params = [
+        {'title': 'Pattern:', 'name': 'pattern', 'type': 'list', 'limits': ['Linear', 'Snake']},
+        {'title': 'Dwell time (ms):', 'name': 'dwell_time', 'type': 'float', 'value': 100., 'min': 0.},
+        {'title': 'Axis:', 'name': 'axis1', 'type': 'group', 'children': [
+            {'title': 'Start:', 'name': 'start', 'type': 'float', 'value': 0.},
+            {'title': 'Stop:', 'name': 'stop', 'type': 'float', 'value': 1000.},
+            {'title': 'Step:', 'name': 'step', 'type': 'float', 'value': 100.},
+        ]},
+    ]
+    n_axes = 1
+    scan_type = 'Scan1D'
+    scan_subtype = 'DAQmx hardware timed'
+
+
+@ScannerFactory.register()
+class Scan2DDAQmx(DAQmxScannerBase):
+    """Hardware timed 2D scan, the first axis being the fast one"""
+    params = [
+        {'title': 'Pattern:', 'name': 'pattern', 'type': 'list', 'limits': scan_patterns},
+        {'title': 'Dwell time (ms):', 'name': 'dwell_time', 'type': 'float', 'value': 100., 'min': 0.},
+        {'title': 'Axis 1 (fast):', 'name': 'axis1', 'type': 'group', 'children': [
+            {'title': 'Start:', 'name': 'start', 'type': 'float', 'value': 0.},
+            {'title': 'Stop:', 'name': 'stop', 'type': 'float', 'value': 1000.},
+            {'title': 'Step:', 'name': 'step', 'type': 'float', 'value': 100.},
+        ]},
+        {'title': 'Axis 2 (slow):', 'name': 'axis2', 'type': 'group', 'children': [
+            {'title': 'Start:', 'name': 'start', 'type': 'float', 'value': 0.},
+            {'title': 'Stop:', 'name': 'stop', 'type': 'float', 'value': 1000.},
+            {'title': 'Step:', 'name': 'step', 'type': 'float', 'value': 100.},
+        ]},
+    ]
+    n_axes = 2
+    scan_type = 'Scan2D'
+    scan_subtype = 'DAQmx hardware timed'
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from pymodaq_plugins_daqmx.hardware.national_instruments.daqmx_processing import schmitt_trigger, EventDetector, \
+    PulseAnalyzer, CrossCorrelator, pairs_within_window, TimeTagStream, TimeTagHistogram, scan_path, spiral_walk
+
+
+def split(array, rng, Nblocks=5):
+    """Split array along its last axis at random positions (possibly giving empty blocks)"""
+    cuts = np.sort(rng.integers(0, array.shape[-1] + 1, Nblocks - 1))
+    return np.split(array, cuts, axis=-1)
+
+
+def schmitt_trigger_loop(active, inactive, armed=True):
+    activations = []
+    for ind in range(active.size):
+        if armed and active[ind]:
+            activations.append(ind)
+            armed = False
+        elif inactive[ind]:
+            armed = True
+    return np.array(activations, dtype=int), armed
+
+
+@pytest.mark.parametrize('armed', [True, False])
+def test_schmitt_trigger(armed):
+    rng = np.random.default_rng(0)
+    signal = np.cumsum(rng.normal(size=2000))
+    active, inactive = signal >= 1., signal <= 0.5
+    indexes, state = schmitt_trigger(active, inactive, armed=armed)
+    expected_indexes, expected_state = schmitt_trigger_loop(active, inactive, armed=armed)
+    assert np.array_equal(indexes, expected_indexes)
+    assert state == expected_state
+
+
+@pytest.mark.parametrize('condition', EventDetector.conditions[:2] + EventDetector.conditions[3:])
+def test_event_detector_blocks(condition):
+    rng = np.random.default_rng(1)
+    stream = np.stack((np.sin(np.arange(5000) / 20) + 0.1 * rng.normal(size=5000), rng.normal(size=5000)))
+    pre, post = 30, 50
+    detector = EventDetector(condition=condition, level=0.5, window_top=0.8, hysteresis=0.2, pre=pre, post=post,
+                             sample_rate=1000.)
+    captures = []
+    for block in split(stream, rng, 20):
+        captures.extend(detector.update(block))
+
+    reference = EventDetector(condition=condition, level=0.5, window_top=0.8, hysteresis=0.2)
+    indexes, _ = schmitt_trigger_loop(*reference.activations(stream[0]))
+    indexes = indexes[indexes + post <= stream.shape[1]]
+    assert len(captures) == indexes.size > 0
+    for (time_s, data), index in zip(captures, indexes):
+        assert time_s == pytest.approx(index / 1000.)
+        assert np.array_equal(data, stream[:, max(index - pre, 0):index + post])
+
+
+def pulses_loop(signal, threshold, hysteresis):
+    heights = []
+    start = None
+    for ind, value in enumerate(signal):
+        if start is None and value >= threshold:
+            start = ind
+        elif start is not None and value <= threshold - hysteresis:
+            heights.append(np.max(signal[start:ind]))
+            start = None
+    return np.array(heights)
+
+
+def test_pulse_analyzer_blocks():
+    rng = np.random.default_rng(2)
+    signal = np.zeros((20000,))  # null median, hence a null baseline
+    for start in rng.choice(np.arange(0, 19900, 100), 60, replace=False):
+        signal[start:start + 20] = rng.uniform(0.2, 5.) * np.hanning(20)
+    analyzer = PulseAnalyzer(threshold=0.1, hysteresis=0.02, Nbins=50, max_height=5., sample_rate=1000.)
+    heights = np.concatenate([analyzer.update(block)[0] for block in split(signal, rng, 30)])
+    expected = pulses_loop(signal, 0.1, 0.02)
+    assert np.allclose(heights, expected)
+    assert np.sum(analyzer.counts) == np.sum(expected < 5.)
+
+
+def test_pairs_within_window():
+    rng = np.random.default_rng(3)
+    tags_start, tags_stop = np.sort(rng.uniform(0, 1, 300)), np.sort(rng.uniform(0, 1, 400))
+    delays = pairs_within_window(tags_start, tags_stop, 0.01)
+    expected = [stop - start for start in tags_start for stop in tags_stop if abs(stop - start) <= 0.01]
+    assert np.allclose(np.sort(delays), np.sort(expected))
+
+
+def test_cross_correlator_blocks():
+    rng = np.random.default_rng(4)
+    tags_start, tags_stop = np.sort(rng.uniform(0, 1e-3, 2000)), np.sort(rng.uniform(0, 1e-3, 2000))
+    correlator = CrossCorrelator(window=100e-9, bin_width=10e-9)
+    bounds = np.concatenate(([0.], np.sort(rng.uniform(0, 1e-3, 9)), [1.]))
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        correlator.update(tags_start[(tags_start >= low) & (tags_start < high)],
+                          tags_stop[(tags_stop >= low) & (tags_stop < high)])
+    delays = (tags_stop[None, :] - tags_start[:, None]).ravel()
+    delays = delays[np.abs(delays) <= 100e-9]
+    indexes = np.floor(delays / 10e-9).astype(int) + correlator.Nbins // 2
+    expected = np.bincount(indexes[(indexes >= 0) & (indexes < correlator.Nbins)], minlength=correlator.Nbins)
+    assert np.array_equal(correlator.counts, expected)
+
+
+def test_time_tag_stream_rollover():
+    rng = np.random.default_rng(5)
+    ticks = np.cumsum(rng.integers(1, 2 ** 31, 1000, dtype=np.int64))  # rolls over the uint32 counter many times
+    raw = (ticks % 2 ** 32).astype(np.uint32)
+    stream = TimeTagStream(timebase_frequency=100e6, length=2000)
+    tags = np.concatenate([stream.update(block) for block in split(raw, rng, 10)])
+    assert np.allclose(tags, ticks / 100e6)
+
+
+def test_time_tag_histogram_sync():
+    rng = np.random.default_rng(6)
+    sync = np.arange(1e-8, 1e-5, 100.03e-9)
+    tags = np.unique(rng.choice(sync, 500) + rng.exponential(20e-9, 500))
+    histogram = TimeTagHistogram(bin_width=1e-9, Nbins=200, mode='Arrival')
+    bounds = np.concatenate(([0.], np.sort(rng.uniform(0, 1e-5, 6)), [1.]))
+    read_sync = 0.
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        # the sync pulses are read after the events, a bit later
+        sync_end = high + rng.uniform(0, 300e-9)
+        histogram.update(tags[(tags >= low) & (tags < high)], sync=sync[(sync >= read_sync) & (sync < sync_end)])
+        read_sync = sync_end
+    delays = tags - sync[np.searchsorted(sync, tags, side='right') - 1]
+    expected = np.bincount((delays / 1e-9).astype(int), minlength=200)[:200]
+    assert np.array_equal(histogram.counts, expected)
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (1, 5), (5, 1), (2, 2), (4, 3), (3, 4), (4, 4), (5, 5), (7, 2)])
+def test_spiral_walk(shape):
+    walk = np.array(spiral_walk(*shape))
+    assert len({tuple(index) for index in walk}) == walk.shape[0] == shape[0] * shape[1]
+    assert np.all(np.sum(np.abs(np.diff(walk, axis=0)), axis=1) == 1)
+    assert np.all(walk >= 0) and np.all(walk < np.array(shape))
+
+
+@pytest.mark.parametrize('pattern', ['Linear', 'Snake', 'Spiral'])
+@pytest.mark.parametrize('shape', [(4, 3), (5, 5), (1, 6)])
+def test_scan_path_2D(pattern, shape):
+    axes = [np.linspace(0, 1, shape[0]), np.linspace(10, 20, shape[1])]
+    indexes, positions = scan_path(axes, pattern)
+    assert len({tuple(index) for index in indexes}) == indexes.shape[0] == shape[0] * shape[1]
+    assert np.array_equal(positions, np.stack((axes[0][indexes[:, 0]], axes[1][indexes[:, 1]]), axis=1))
+    if pattern != 'Linear':
+        assert np.all(np.sum(np.abs(np.diff(indexes, axis=0)), axis=1) == 1)
+
+
+def test_scan_path_1D_snake():
+    indexes, positions = scan_path([np.arange(4.)], 'Snake')
+    assert np.array_equal(indexes[:, 0], [0, 1, 2, 3, 2, 1, 0])
+    assert np.array_equal(positions[:, 0], [0., 1., 2., 3., 2., 1., 0.])